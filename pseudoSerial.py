@@ -23,10 +23,10 @@ class Serial:
         self._isOpen  = True
         self._receivedData = ""
         self._data = chr(0x10) + chr(0x02) +\
-                     chr(0x0A) + chr(0x01) + chr(0x01) +\
-                     chr(0x60) + chr(0x00) + chr(0x00) +\
+                     chr(0x0A) + chr(0x00) + chr(0x00) +\
+                     chr(0x00) + chr(0x00) + chr(0x01) +\
                      chr(0x55) + chr(0x30) + chr(0x60) +\
-                     chr(0x10) + chr(0x03) + chr(0xEA)
+                     chr(0x10) + chr(0x03) + chr(0xFD)
 
     ## isOpen()
     # returns True if the port to the Arduino is open.  False otherwise
@@ -48,6 +48,11 @@ class Serial:
     def write( self, string ):
         self._receivedData += string
 
+    ## flush()
+    # waits until all written data has been transmitted
+    def flush( self ):
+        pass
+
     ## read()
     # reads n characters from the fake Arduino. Actually n characters
     # are read from the string _data and returned to the caller.
@@ -18,7 +18,7 @@ with open('HISTORY.rst') as history_file:
 
 # Read version number etc from other file
 # http://stackoverflow.com/questions/2058802/how-can-i-get-the-version-defined-in-setup-py-setuptools-in-my-package
-with open('tacos2.py') as mainfile:
+with open('tacos2/__init__.py') as mainfile:
     main_py = mainfile.read()
 metadata = dict( re.findall(r"__([a-z]+)__ *= *'([^']+)'", main_py) )
 
@@ -32,7 +32,11 @@ setup(
     description="Easy-to-use TacosII implementation for Python",
     long_description=readme + '\n\n' + history,
     install_requires = ['pyserial'],
-    py_modules = ['tacos2', 'dummy_serial'],
+    packages = ['tacos2'],
+    py_modules = ['dummy_serial'],
+    entry_points = {
+        'console_scripts': ['tacos2 = tacos2.cli:main'],
+    },
     keywords='tacos2 serial',
     classifiers=[
         'Development Status :: 1 - Beta',
@@ -0,0 +1,800 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Tacos2: A Python driver for the Tacos2 protocols via serial port (via RS485 or RS232).
+
+"""
+
+__author__   = 'Kazuhiro Matsuda'
+__email__    = 'kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp'
+__url__      = 'https://github.com/kaz260/tacos2'
+__license__  = 'Apache License, Version 2.0'
+
+__version__  = '0.1'
+__status__   = 'Beta'
+
+
+import os
+import sys
+
+from tacos2 import capacity as _capacity
+from tacos2 import correlation as _correlation
+from tacos2 import profiling as _profiling
+from tacos2.codec import DLE, STX, ETX, STOP, SET, GET, \
+    _calculateFcc, _checkEsc, _checkFrame, _checkResponse, _checkResponseFields, _embedPayload, _embedResponse, \
+    _extractPayload
+from tacos2.config import BusConfig
+from tacos2.errors import CollisionError, DeadlineExpiredError, FrameError, NoAnswerError, NoiseError, \
+    QueueFullError, TruncatedFrameError, WrongResponderError
+from tacos2.futures import FrameFuture
+from tacos2.polling import Poller
+from tacos2.scheduler import PRIORITY_BACKGROUND, PRIORITY_GET, PRIORITY_SET, PRIORITY_STOP, BusScheduler, \
+    _absoluteDeadline
+from tacos2.timing import _LATEST_READ_TIMES, _SECONDS_TO_MILLISECONDS, _SECONDS_TO_NANOSECONDS, \
+    _calculate_frame_time, _calculate_minimum_silent_period, _markBusIdle, _now_ns, _portBitsPerCharacter, \
+    _silentPeriod, _waitForSilentPeriod, _waitUntil, busIdleTime
+from tacos2.utils import _LazyModule, _checkAddress, _checkInt, _checkNumerical, _checkString, \
+    _hexdecode, _hexencode, _hexlify, _print_out
+
+# pySerial and the serial port management are imported on first use,
+# to keep the import of tacos2 fast for short-lived scripts.
+serial = _LazyModule('serial')
+_serialport = _LazyModule('tacos2.serialport')
+
+####################
+## Default values ##
+####################
+
+BAUDRATE = 9600
+"""Default value for the baudrate in Baud (int)."""
+
+PARITY   = 'N'
+"""Default value for the parity. See the pySerial module for documentation. Defaults to serial.PARITY_NONE (``'N'``)"""
+
+BYTESIZE = 8
+"""Default value for the bytesize (int)."""
+
+STOPBITS = 1
+"""Default value for the number of stopbits (int)."""
+
+TIMEOUT  = 0.1
+"""Default value for the timeout value in seconds (float)."""
+
+CLOSE_PORT_AFTER_EACH_CALL = False
+"""Default value for port closure setting.
+
+The port is kept open by default, and is reopened automatically if it fails (for example
+when a USB-to-RS485 adaptor is unplugged). See :data:`RECONNECT_ATTEMPTS`."""
+
+RECONNECT_ATTEMPTS = 8
+"""Default value for the number of attempts to reopen a failed serial port (int)."""
+
+RECONNECT_DELAY = 0.05
+"""Default value for the delay in seconds before the first reopen attempt (float). It is doubled for each attempt."""
+
+RECONNECT_MAX_DELAY = 2.0
+"""Default value for the maximum delay in seconds between two reopen attempts (float)."""
+
+##############################
+## Tacos2 instrument object ##
+##############################
+
+
+class Instrument():
+    """Instrument class for talking to instruments (slaves) via the TacosII protocols (via RS485 or RS232).
+
+    Args:
+        * port (str): The serial port name, for example ``/dev/ttyUSB0`` (Linux), ``/dev/tty.usbserial`` (OS X) or ``COM4`` (Windows).
+          Or a URL such as ``tcp://192.168.0.7:4001``, see :mod:`tacos2.transports`.
+        * devicetype (int): Source device type 
+        * sourceaddress (int): Source address
+        * config (:class:`.BusConfig` or None): Settings of the bus. Use None for the module defaults
+          (:data:`BAUDRATE`, :data:`TIMEOUT` etc). As the serial port is shared by the instruments
+          with the same port name, the settings apply to all of them.
+
+    """
+
+    def __init__(self, port, devicetype=0X00, sourceaddress=0X00, config=None):
+        if port not in _serialport._SERIALPORTS or not _serialport._SERIALPORTS[port]:
+            self.serial = _serialport._SERIALPORTS[port] = _serialport._openPort(port, BusConfig() if config is None else config)
+        else:
+            self.serial = _serialport._SERIALPORTS[port]
+            if self.serial.port is None:
+                self.serial.open()
+        """The serial port object as defined by the pySerial module. Created by the constructor.
+
+        For the port names ``tcp://host:port`` and ``memory://name`` this is a transport
+        from :mod:`tacos2.transports` with the same interface.
+
+        Attributes:
+            - port (str):      Serial port name.
+                - Most often set by the constructor (see the class documentation).
+            - baudrate (int):  Baudrate in Baud.
+                - Defaults to :data:`BAUDRATE`.
+            - parity (probably int): Parity. See the pySerial module for documentation.
+                - Defaults to :data:`PARITY`.
+            - bytesize (int):  Bytesize in bits.
+                - Defaults to :data:`BYTESIZE`.
+            - stopbits (int):  The number of stopbits.
+                - Defaults to :data:`STOPBITS`.
+            - timeout (float): Timeout value in seconds.
+                - Defaults to :data:`TIMEOUT`.
+
+        The settings can be given per bus with a :class:`.BusConfig`.
+        """
+
+        if port not in _serialport._SCHEDULERS:
+            _serialport._SCHEDULERS[port] = BusScheduler(port)
+
+        self.sax = devicetype
+        """Source device type (1Byte) """
+
+        self.sa = sourceaddress
+        """source address (1 byte) """
+
+        self.height = 0;
+        """ blind hight from floor"""
+
+        self.angle = 0;
+        """ slat angle """
+
+        self.slaveAddress = 0x01
+        """ client address """
+
+        self._response = None  # The latest GET response of the slave, see _sendResponse()
+
+        self.state = None
+        """A :class:`tacos2.simulator.BlindBank` keeping the height and angle of the slave, or None.
+
+        With a bank backed by a state file, a slave restarted with the same file answers with the
+        height and angle it had. Used by :meth:`respond`.
+        """
+
+        self.debug = False
+        """Set this to :const:`True` to print the communication details. Defaults to :const:`False`."""
+
+        self.close_port_after_each_call = CLOSE_PORT_AFTER_EACH_CALL
+        """If this is :const:`True`, the serial port will be closed after each call. Defaults to :data:`CLOSE_PORT_AFTER_EACH_CALL`. To change it, set the value ``tacos2.CLOSE_PORT_AFTER_EACH_CALL=True`` .
+
+        This is not needed for recovering from a disconnected adaptor, as a failing port is reopened automatically.
+        """
+
+        self.replay_after_reconnect = True
+        """If this is :const:`True`, a command that failed because the serial port was disconnected
+        is sent again after the port has been reopened. Otherwise an IOError is raised. Defaults to :const:`True`,
+        as the STOP, SET and GET commands can safely be repeated.
+        """
+
+        self.precalculate_read_size = True
+        """If this is :const:`False`, the serial port reads until timeout
+        instead of just reading a specific number of bytes. Defaults to :const:`True`.
+
+        New in version 0.5.
+        """
+        
+        self.handle_local_echo = False
+        """Set to to :const:`True` if your RS-485 adaptor has local echo enabled. 
+        Then the transmitted message will immeadiately appear at the receive line of the RS-485 adaptor.
+        Tacos2 will then read and discard this data, before reading the data from the slave.
+        The echo is compared with the request as it arrives, and an IOError is raised at the first differing byte.
+        Set to None to detect the local echo on the first request of the port.
+        Defaults to :const:`False`.
+
+        New in version 0.7.
+        """
+
+        if config is not None:
+            config.apply(self)
+
+        if  self.close_port_after_each_call:
+            self.serial.close()
+
+    def __repr__(self):
+        """String representation of the :class:`.Instrument` object."""
+        return "{}.{}<id=0x{:x}, devicetype={}, sourceaddress={}, close_port_after_each_call={}, precalculate_read_size={}, debug={}, serial={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.devicetype,
+            self.sourceaddress,
+            self.close_port_after_each_call,
+            self.precalculate_read_size,
+            self.debug,
+            self.serial,
+            )
+
+    ######################################
+    ## Methods for talking to the slave ##
+    ######################################
+    def stop(self, das, dae, deadline=None):
+        """stop Blind control.
+
+        Args:
+            * das(destination address start): Start address of the blind to be controlled.
+            * dae(destination address end): End address of the blind to be controlled.
+            * deadline (float or None): Drop the command if it can not be sent within this many seconds.
+
+        If this command is sended, blind stops operation.
+        das must be equal to or less than dae. 
+
+        Returns:
+            None, once the STOP frame has been written to the bus (a STOP has no response).
+
+        Raises:
+            ValueError, TypeError, IOError
+
+        The STOP overtakes the commands waiting for the bus, see :mod:`tacos2.scheduler`.
+        The SET frames in the write queue are trimmed to the addresses outside das to dae.
+
+        """
+
+        cw = 0xC0
+        cmd = STOP
+        _checkAddress(das, dae)
+        return self._genericCommand(das, dae, cw, cmd, deadline=deadline)
+
+
+    def set(self, das, dae, height=255, angle=255, deadline=None):
+        """Set Blind heigth from floor and slat angle. Height and angle are represented as percentage.
+
+        Args:
+            * das(destination address start): Start address of the blind to be controlled.
+            * dae(destination address end): End address of the blind to be controlled.
+            * deadline (float or None): Drop the command if it can not be sent within this many seconds.
+
+        Returns:
+            Height and angle. 
+
+        Raises:
+            ValueError, TypeError, IOError (:class:`.DeadlineExpiredError` if the deadline expired)
+
+        """
+
+        cw = 0xC0
+        cmd = SET 
+        _checkAddress(das, dae)
+        return self._genericCommand(das, dae, cw, cmd, height=height, angle=angle, deadline=deadline)
+
+
+    def get(self, das, deadline=None, priority=None):
+        """Read blind's height and slat angle.
+
+        Args:
+            * das(destination address start): Start address of the blind to be controlled.
+            * deadline (float or None): Drop the command if it can not be sent within this many seconds.
+            * priority (int or None): :data:`PRIORITY_GET`, or :data:`PRIORITY_BACKGROUND` for polling. None for :data:`PRIORITY_GET`.
+
+        Returns:
+            Height and angle
+
+        Raises:
+            ValueError, TypeError, IOError (:class:`.DeadlineExpiredError` if the deadline expired)
+
+        """
+
+        cw = 0x60
+        cmd = GET
+        dae = das
+        _checkAddress(das, dae)
+        return self._genericCommand(das, dae, cw, cmd, priority=priority, deadline=deadline)
+
+    def stopNowait(self, das, dae, deadline=None):
+        """Stop blind control, without waiting for the frame to be transmitted.
+
+        Args:
+            * das(destination address start): Start address of the blind to be controlled.
+            * dae(destination address end): End address of the blind to be controlled.
+            * deadline (float or None): Drop the command if it can not be sent within this many seconds.
+
+        Returns:
+            A :class:`.FrameFuture`, which is completed when the frame has been written to the serial port.
+
+        Raises:
+            ValueError, TypeError
+
+        The frame is put in the write queue of the serial port, see :class:`tacos2.serialport._PortWriter`.
+        It overtakes the SET frames in the queue.
+
+        """
+        _checkAddress(das, dae)
+        return self._genericCommandNowait(das, dae, 0xC0, STOP, deadline=deadline)
+
+    def setNowait(self, das, dae, height=255, angle=255, deadline=None):
+        """Set blind height and slat angle, without waiting for the frame to be transmitted.
+
+        Args:
+            * das(destination address start): Start address of the blind to be controlled.
+            * dae(destination address end): End address of the blind to be controlled.
+            * deadline (float or None): Drop the command if it can not be sent within this many seconds.
+              The future then fails with :class:`.DeadlineExpiredError`.
+
+        Returns:
+            A :class:`.FrameFuture`, which is completed when the frame has been written to the serial port.
+
+        Raises:
+            ValueError, TypeError
+
+        Use this to send a whole scene without blocking on each frame::
+
+            futures = [instr.setNowait(address, address, 50, 80) for address in range(1, 7)]
+            for future in futures:
+                future.result()
+
+        """
+        _checkAddress(das, dae)
+        return self._genericCommandNowait(das, dae, 0xC0, SET, height=height, angle=angle, deadline=deadline)
+
+    def setSlaveAddress(self, address):
+        """ set slave address """
+
+        if address > 0 or address <= 255:
+            self.slaveAddress = address
+        else:
+            raise ValueError(address)
+
+    def _receive(self):
+        """ receive payload from master and respond
+
+        Args:
+            None
+
+        Returns:
+            Received payload, as a list of characters.
+
+        Waits for the next valid frame. Invalid frames and noise are skipped.
+        """
+
+        while True:
+            try:
+                frame = _serialport._readFrame(self.serial)[0]
+            except NoAnswerError:
+                continue
+            except FrameError as err:
+                if self.debug:
+                    _print_out('Tacos2 debug mode. Skipping an invalid frame from the master: {}'.format(err))
+                continue
+            break
+
+        payloadFromMaster = list(frame)
+        if self.debug:
+            _print_out("payload from master:{}".format(repr(payloadFromMaster)))
+
+        return payloadFromMaster
+
+    def respond(self):
+        """ analyze payload from master
+
+        Waits for a request from the master and handles it as the slave at :attr:`slaveAddress`:
+
+        * SET: the height and angle are changed if the slave address is within DAS to DAE.
+          A value of 255 leaves it unchanged.
+        * STOP: accepted if the slave address is within DAS to DAE. The simulated blind does not move,
+          so there is nothing to stop.
+        * GET: answered if DAS and DAE are both the slave address.
+
+        Responses from other slaves on the bus are ignored.
+
+        Args:
+            None
+        Raises:
+            ValueError
+        """
+        payloadFromMaster = self._receive()
+
+        if self.state is not None:
+            status = self.state.status(self.slaveAddress)
+            if status is None:  # The first request with this bank and slave address
+                self.state.add(self.slaveAddress, height=self.height, angle=self.angle)
+                status = self.height, self.angle
+            self.height, self.angle = status
+
+        fields = _checkFrame(''.join(payloadFromMaster))
+        das, dae, cw, sax, sa, cmd = fields[:6]
+
+        if cw == 0x00 or not das <= self.slaveAddress <= dae:
+            return  # A response, or a request to other slaves
+
+        if cmd == SET and len(fields) >= 8:
+            if fields[6] != 255:
+                self.height = fields[6]
+            if fields[7] != 255:
+                self.angle = fields[7]
+
+            if self.state is not None:
+                self.state.set(self.slaveAddress, self.slaveAddress, self.height, self.angle)
+
+        if cmd == GET and das == dae:
+            cw = 0x00
+            self._sendResponse(cw)
+
+    def _sendResponse(self, cw):
+        """Send the GET response with the height and angle of the slave.
+
+        The response is encoded once, and again only when the addresses, height or angle have changed,
+        so that repeated GET requests are answered with a single write of the cached frame.
+
+        """
+        key = (self.sa, self.slaveAddress, self.height, self.angle)
+        if self._response is None or self._response[0] != key:
+            payloadToMaster = _embedResponse(self.sa, self.slaveAddress, self.height, self.angle)
+            if sys.version_info[0] > 2:
+                payloadToMaster = bytes(payloadToMaster, encoding='latin1')  # Convert types to make it Python3 compatible
+            self._response = (key, payloadToMaster)
+        payloadToMaster = self._response[1]
+
+        if self.debug:
+            _print_out("Payload to master:{}".format(repr(payloadToMaster)))
+
+        self.serial.write(payloadToMaster)
+            
+    #####################
+    ## Generic command ##
+    #####################
+
+
+    def _genericCommand(self, das, dae, cw, cmd, height=255, angle=255, priority=None, deadline=None):
+        """Generic command for Tacos2.
+
+        Args:
+            * das(destination address start): Start address of the blind to be controlled.
+            * dae(destination address end): End address of the blind to be controlled.
+            * cw: control word
+            * cmd: command
+            * priority (int or None): See :mod:`tacos2.scheduler`. None for the priority of the command.
+            * deadline (float or None): Latest start, in seconds from now.
+
+        Returns:
+            * STOP: OK or NG
+            * GET: blind address, height and angle.
+            * SET: OK or NG
+
+        Raises:
+            ValueError, TypeError, IOError
+
+        """
+
+        with _profiling._phase('command', self):
+
+            ## Build payload to slave ##
+            with _profiling._phase('encode', self):
+                payloadToSlave = _embedPayload(das, dae, cw, self.sax, self.sa, cmd, height, angle)
+
+            ## Communicate ##
+            payloadFromSlave = self._performCommand(payloadToSlave, cmd, priority, _absoluteDeadline(deadline))
+
+            ## Check the contents in the response payload ##
+            if cmd == GET:
+                with _profiling._phase('check', self):
+                    return _checkResponse(payloadFromSlave)  # blind address, height and angle 
+
+    def _genericCommandNowait(self, das, dae, cw, cmd, height=255, angle=255, deadline=None):
+        """Generic command for commands without response (STOP and SET), using the write queue.
+
+        Args:
+            See :meth:`_genericCommand`.
+
+        Returns:
+            A :class:`.FrameFuture` for the queued frame.
+
+        """
+        payloadToSlave = _embedPayload(das, dae, cw, self.sax, self.sa, cmd, height, angle)
+
+        if self.debug:
+            _print_out('\nTacos2 debug mode. Queueing for instrument : {!r} ({})'. \
+                format(payloadToSlave, _hexlify(payloadToSlave)))
+
+        if sys.version_info[0] > 2:
+            payloadToSlave = bytes(payloadToSlave, encoding='latin1')  # Convert types to make it Python3 compatible
+
+        return _serialport._getPortWriter(self.serial).submit(payloadToSlave, self, _absoluteDeadline(deadline))
+
+    def _genericBurstNowait(self, frames):
+        """Queue ready-made frames without response (STOP and SET) as one burst in the write queue.
+
+        Args:
+            frames (list of str): The raw frames (bytes for Python3).
+
+        Returns:
+            A :class:`.FrameFuture` for the whole burst.
+
+        """
+        if self.debug:
+            _print_out('\nTacos2 debug mode. Queueing a burst of {} frames for the instrument'.format(len(frames)))
+
+        return _serialport._getPortWriter(self.serial).submitBurst(frames, self)
+
+    ##########################################
+    ## Communication implementation details ##
+    ##########################################
+
+
+    def _performCommand(self, payloadToSlave, cmd, priority=None, deadline=None):
+        """Performs the command having the *functioncode*.
+
+        Args:
+            * payloadToSlave (str): Data to be transmitted to the slave 
+            * priority, deadline: See :meth:`_communicate`.
+
+        Returns:
+            The extracted data payload from the slave (a string). It has been stripped of FCC etc.
+
+        Raises:
+            ValueError, TypeError.
+
+        Makes use of the :meth:`_communicate` method. The request is generated
+        with the :func:`_embedPayload` function, and the parsing of the
+        response is done with the :func:`_extractPayload` function.
+
+        """
+
+        # Communicate
+        response = self._communicate(payloadToSlave, cmd, priority, deadline)
+
+        # Extract payload
+        if cmd == GET:
+            with _profiling._phase('extract', self):
+                payloadFromSlave = _extractPayload(response)
+            return payloadFromSlave
+
+
+    def _communicate(self, request, cmd, priority=None, deadline=None, timeout=None):
+        """Talk to the slave via a serial port.
+
+        Args:
+            request (str): The raw request that is to be sent to the slave.
+            cmd (str): Command that is to be sent to the slave.
+            priority (int or None): See :mod:`tacos2.scheduler`. None for the priority of the command.
+            deadline (int or None): Latest start time, see :func:`_now_ns`. None for no deadline.
+            timeout (float or None): Read timeout in seconds for this request only. It is applied
+                while holding the bus, so the other users of the port are not affected. None for
+                the timeout of the port.
+
+        Returns:
+            The raw data (string) returned from the slave. It has been validated: byte count, DLE escapes,
+            FCC, and that it comes from the addressed slave. Other frames received before the response,
+            for example late responses to earlier requests, are discarded, see :mod:`tacos2.correlation`.
+
+        Raises:
+            TypeError, ValueError, IOError. Invalid responses raise a :class:`.FrameError` subclass,
+            see :mod:`tacos2.errors`.
+
+        Note that the answer might have strange ASCII control signs, which
+        makes it difficult to print it in the promt (messes up a bit).
+        Use repr() to make the string printable (shows ASCII values for control signs.)
+
+        If the attribute :attr:`Instrument.debug` is :const:`True`, the communication details are printed.
+
+        If the attribute :attr:`Instrument.close_port_after_each_call` is :const:`True` the
+        serial port is closed after each call.
+
+        Timing::
+
+                                                  Request from master (Master is writing)
+                                                  |
+                                                  |       Response from slave (Master is reading)
+                                                  |       |
+            ----W----R----------------------------W-------R----------------------------------------
+                     |                            |       |
+                     |<----- Silent period ------>|       |
+                                                  |       |
+                             Roundtrip time  ---->|-------|<--
+
+        The silent period is measured with the clock of :func:`_now_ns`, which is monotonic
+        (not affected by wall-clock jumps) unless :data:`tacos2.timing._MONOTONIC` is :const:`False`.
+        On Python 2 that is the case when neither the ``monotonic`` package nor Linux is available,
+        see :func:`tacos2.timing._selectClock`. The wait is done by :func:`_waitUntil`, which sleeps
+        for the coarse part and spins for the last part, since the sleep resolution is about
+        1 ms on Linux and 16 ms on Windows. At 115200 baud the silent period is only 0.3 ms.
+
+        For Python3, the information sent to and from pySerial should be of the type bytes.
+        This is taken care of automatically by Tacos2.
+        
+        
+
+        """
+
+        # Frames queued with the nowait methods are sent first, to keep the command order.
+        # A STOP overtakes them instead, and the overlapping SET frames are trimmed.
+        writer = _serialport._PORTWRITERS.get(self.serial.port)
+        if writer is not None:
+            if cmd == STOP:
+                writer.trim(*_checkFrame(request)[:2])
+            else:
+                writer.flush()
+
+        if priority is None:
+            priority = {STOP: PRIORITY_STOP, SET: PRIORITY_SET}.get(cmd, PRIORITY_GET)
+
+        scheduler = _serialport._SCHEDULERS[self.serial.port]
+        with _profiling._phase('schedule', self):
+            scheduler.acquire(priority, deadline)
+        previousTimeout = self.serial.timeout
+        try:
+            if timeout is not None:
+                self.serial.timeout = timeout
+            return self._communicateOnce(request, cmd)
+        except EnvironmentError as err:
+            if not _serialport._isPortFailure(err):
+                raise
+            _serialport._reopenPort(self.serial, err, self.debug)
+            if not self.replay_after_reconnect:
+                raise IOError('The serial port {} was disconnected and has been reopened. '.format(self.serial.port) + \
+                    'The command was not replayed: {!r}'.format(request))
+            return self._communicateOnce(request, cmd)
+        finally:
+            if self.serial.timeout != previousTimeout:
+                self.serial.timeout = previousTimeout
+            scheduler.release()
+
+    def _communicateOnce(self, request, cmd):
+        """Talk to the slave via a serial port, without recovery from port failures.
+
+        See :meth:`_communicate`, which retries via this method after reopening a disconnected port.
+
+        """
+        if self.debug:
+            _print_out('\nTacos2 debug mode. Writing to instrument : {!r} ({})'. \
+                format(request, _hexlify(request)))
+
+        if not self.serial.isOpen():
+            self.serial.open()
+
+        # Late responses to earlier requests must not be taken as the response to this one
+        _serialport._discardStaleInput(self.serial, self.debug)
+
+        if cmd == GET:
+            requestFields = _checkFrame(request)  # For matching the response to the request
+            requestTracker = _correlation.tracker(self.serial.port)
+
+        if sys.version_info[0] > 2:
+            request = bytes(request, encoding='latin1')  # Convert types to make it Python3 compatible
+
+        # Wait to make sure 3.5 character times have passed
+        minimum_silent_period   = _silentPeriod(self.serial)
+        time_since_read         = float(_now_ns() - _LATEST_READ_TIMES.get(self.serial.port, 0)) / _SECONDS_TO_NANOSECONDS
+
+        if time_since_read < minimum_silent_period:
+            sleep_time = minimum_silent_period - time_since_read
+
+            if self.debug:
+                template = 'Tacos2 debug mode. Sleeping for {:.1f} ms. ' + \
+                        'Minimum silent period: {:.1f} ms, time since read: {:.1f} ms.'
+                text = template.format(
+                    sleep_time * _SECONDS_TO_MILLISECONDS,
+                    minimum_silent_period * _SECONDS_TO_MILLISECONDS,
+                    time_since_read * _SECONDS_TO_MILLISECONDS)
+                _print_out(text)
+
+            with _profiling._phase('silent_period', self):
+                _waitForSilentPeriod(self.serial.port, minimum_silent_period)
+
+        elif self.debug:
+            template = 'Tacos2 debug mode. No sleep required before write. ' + \
+                'Time since previous read: {:.1f} ms, minimum silent period: {:.2f} ms.'
+            text = template.format(
+                time_since_read * _SECONDS_TO_MILLISECONDS,
+                minimum_silent_period * _SECONDS_TO_MILLISECONDS)
+            _print_out(text)
+
+        # Write request
+        latest_write_time = _now_ns()
+        if cmd == GET:
+            requestKey = requestTracker.begin(requestFields)
+
+        with _profiling._phase('write', self):
+            self.serial.write(request)
+
+        # Read and discard local echo, byte by byte as it arrives
+        with _profiling._phase('echo', self):
+            responseStart = _serialport._readLocalEcho(self.serial, request, self.handle_local_echo)
+        if self.debug and self.handle_local_echo is not False:
+            template = 'Tacos2 debug mode. Local echo handling: {}, {} bytes of the response received with the echo.'
+            _print_out(template.format(_serialport._LOCAL_ECHO.get(self.serial.port, self.handle_local_echo), len(responseStart)))
+
+        if cmd != GET:
+            # No response. The bus is idle as soon as the request has been transmitted.
+            frame_time = _calculate_frame_time(len(request), self.serial.baudrate, _portBitsPerCharacter(self.serial))
+            idle_time = max(_now_ns(), latest_write_time + int(frame_time * _SECONDS_TO_NANOSECONDS))
+            _markBusIdle(self.serial.port, idle_time)
+            _capacity._recordExchange(self.serial, latest_write_time, request, end=idle_time)
+
+        # Read response
+        # When only "GET" command is sent to the slave, the slave will return a response.
+        # Exactly the bytes given by the byte count of the response are read, see _readFrame().
+        if cmd == GET:
+            try:
+                with _profiling._phase('response', self):
+                    answer, fields, skipped = _serialport._readResponse(self.serial, requestFields, responseStart, self.debug)
+            except NoAnswerError:
+                _capacity._recordExchange(self.serial, latest_write_time, request, timedOut=True)
+                requestTracker.expire(requestKey)
+                raise
+            except Exception:
+                requestTracker.expire(requestKey)
+                raise
+            else:
+                requestTracker.complete(requestKey)
+            finally:
+                _markBusIdle(self.serial.port)
+                if self.close_port_after_each_call:
+                    self.serial.close()
+
+            if self.debug:
+                template = 'Tacos2 debug mode. Response from instrument: {!r} ({}) ({} bytes, {} noise bytes skipped), ' + \
+                    'roundtrip time: {:.1f} ms. Timeout setting: {:.1f} ms.\n'
+                text = template.format(
+                    answer,
+                    _hexlify(answer),
+                    len(answer),
+                    skipped,
+                    float(_LATEST_READ_TIMES.get(self.serial.port, 0) - latest_write_time) / _SECONDS_TO_NANOSECONDS * _SECONDS_TO_MILLISECONDS,
+                    self.serial.timeout * _SECONDS_TO_MILLISECONDS)
+                _print_out(text)
+
+            _capacity._recordExchange(self.serial, latest_write_time, request, answer,
+                end=_LATEST_READ_TIMES.get(self.serial.port))
+            _checkResponseFields(fields, requestFields, answer)
+            return answer
+
+
+#####################
+# Development tools #
+#####################
+
+
+def _getDiagnosticString():
+    """Generate a diagnostic string, showing the module version, the platform, current directory etc.
+
+    Returns:
+        A descriptive string.
+
+    """
+    text = '\n## Diagnostic output from tacos2 ## \n\n'
+    text += 'Tacos2 version: ' + __version__ + '\n'
+    text += 'Tacos2 status: ' + __status__ + '\n'
+    text += 'File name (with relative path): ' + __file__ + '\n'
+    text += 'Full file path: ' + os.path.abspath(__file__) + '\n\n'
+    text += 'pySerial version: ' + serial.VERSION + '\n'
+    text += 'pySerial full file path: ' + os.path.abspath(serial.__file__) + '\n\n'
+    text += 'Platform: ' + sys.platform + '\n'
+    text += 'Filesystem encoding: ' + repr(sys.getfilesystemencoding()) + '\n'
+    text += 'Byteorder: ' + sys.byteorder + '\n'
+    text += 'Python version: ' + sys.version + '\n'
+    text += 'Python version info: ' + repr(sys.version_info) + '\n'
+    text += 'Python flags: ' + repr(sys.flags) + '\n'
+    text += 'Python argv: ' + repr(sys.argv) + '\n'
+    text += 'Python prefix: ' + repr(sys.prefix) + '\n'
+    text += 'Python exec prefix: ' + repr(sys.exec_prefix) + '\n'
+    text += 'Python executable: ' + repr(sys.executable) + '\n'
+    try:
+        text += 'Long info: ' + repr(sys.long_info) + '\n'
+    except:
+        text += 'Long info: (none)\n'  # For Python3 compatibility
+    try:
+        text += 'Float repr style: ' + repr(sys.float_repr_style) + '\n\n'
+    except:
+        text += 'Float repr style: (none) \n\n'  # For Python 2.6 compatibility
+    text += 'Variable __name__: ' + __name__ + '\n'
+    text += 'Current directory: ' + os.getcwd() + '\n\n'
+    text += 'Python path: \n'
+    text += '\n'.join(sys.path) + '\n'
+    text += '\n## End of diagnostic output ## \n'
+    return text
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Capacity of a Tacos2 bus: wire time of the frames, measured utilisation per port, and predicted sweep times.
+
+Use it to decide when a bus segment should be split, or run at a higher baudrate::
+
+    model = tacos2.capacity.CapacityModel(tacos2.BusConfig(baudrate=9600))
+    model.sweepTime(range(1, 41))         # Seconds for one GET of each address
+    model.load(range(1, 41), interval=1)  # Fraction of the bus used by polling every second
+
+    usage = tacos2.capacity.busUsage('/dev/ttyUSB0')
+    usage.utilisation                     # Measured fraction of time with frames on the wire
+
+"""
+
+import threading
+
+from tacos2.config import BusConfig
+from tacos2.codec import DLE, GET, SET, _embedPayload
+from tacos2.timing import _SECONDS_TO_NANOSECONDS, _bitsPerCharacter, _calculate_frame_time, \
+    _calculate_minimum_silent_period, _now_ns, _portBitsPerCharacter
+from tacos2.utils import _checkAddress, _checkNumerical
+
+_TURNAROUND_TIME = 0.002  # Typical time in seconds for a slave to start answering
+_REQUEST_CONTROLWORD = {GET: 0x60}  # Control word of the requests, 0xC0 for SET and STOP
+_UNSTUFFED_REPLY_LENGTH = 14  # DLE STX BC DAS DAE CW SAX SA CMD H A DLE ETX FCC
+
+_USAGE = {}  # BusUsage per port name
+_USAGE_LOCK = threading.Lock()
+
+
+def bitsPerCharacter(bytesize=8, parity='N', stopbits=1):
+    """Return the number of bit times (int or float) for one character on the wire.
+
+    A start bit, the data bits, a parity bit unless the parity is ``'N'``, and the stop bits.
+    This is the character time used for all the bus timing, see :func:`tacos2.timing._bitsPerCharacter`.
+
+    """
+    return _bitsPerCharacter(bytesize, parity, stopbits)
+
+
+def frameWireTime(frame, baudrate, bytesize=8, parity='N', stopbits=1):
+    """Return the time in seconds (float) to transmit a frame.
+
+    Args:
+        * frame (str, bytes or int): The stuffed frame, or its length in bytes.
+        * baudrate (int): The baudrate.
+        * bytesize, parity, stopbits: The character framing, as for :class:`tacos2.config.BusConfig`.
+
+    """
+    length = frame if isinstance(frame, int) else len(frame)
+    return _calculate_frame_time(length, baudrate, _bitsPerCharacter(bytesize, parity, stopbits))
+
+
+def replyLength(sourceaddress, address, height=0, angle=0):
+    """Return the length in bytes (int) of the stuffed GET reply from a slave.
+
+    Each field with the value DLE (0x10) is sent twice, and so is the byte count when it becomes 0x10.
+
+    """
+    escapes = sum(1 for value in (sourceaddress, sourceaddress, address, height, angle) if value == DLE)
+    bytecount = _UNSTUFFED_REPLY_LENGTH - 4 + escapes
+    return _UNSTUFFED_REPLY_LENGTH + escapes + (1 if bytecount == DLE else 0)
+
+
+class CapacityModel():
+    """Predicted time on the bus for commands and polling sweeps.
+
+    Args:
+        * config (:class:`tacos2.config.BusConfig` or None): The bus settings. None for the default settings.
+        * sourceaddress (int): The address of the master.
+        * devicetype (int): The device type of the master.
+        * turnaround (float): Time in seconds for a slave to start answering a GET.
+
+    The times include the silent period before each request, so the time of a sweep is the sum
+    of the times of its exchanges.
+
+    """
+
+    def __init__(self, config=None, sourceaddress=0, devicetype=0, turnaround=_TURNAROUND_TIME):
+        config = BusConfig() if config is None else config
+        _checkNumerical(turnaround, minvalue=0, description='turnaround time')
+
+        self.config = config
+        """The bus settings (:class:`tacos2.config.BusConfig`)."""
+
+        self.sourceaddress = sourceaddress
+        """The address of the master (int)."""
+
+        self.devicetype = devicetype
+        """The device type of the master (int)."""
+
+        self.turnaround = turnaround
+        """Time in seconds for a slave to start answering a GET (float)."""
+
+    def __repr__(self):
+        """String representation of the :class:`.CapacityModel` object."""
+        return "{}.{}<id=0x{:x}, baudrate={}, turnaround={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.config.baudrate,
+            self.turnaround,
+            )
+
+    @property
+    def silentPeriod(self):
+        """The silent period in seconds (float) before each request."""
+        if self.config.silent_period is not None:
+            return self.config.silent_period
+        return _calculate_minimum_silent_period(self.config.baudrate,
+            _bitsPerCharacter(self.config.bytesize, self.config.parity, self.config.stopbits))
+
+    def wireTime(self, frame):
+        """Return the time in seconds (float) to transmit a frame, or a number of bytes, with these settings."""
+        return frameWireTime(frame, self.config.baudrate, self.config.bytesize, self.config.parity, self.config.stopbits)
+
+    def requestTime(self, cmd, das, dae=None, height=255, angle=255):
+        """Return the time in seconds (float) for a SET or STOP request, including the silent period before it."""
+        dae = das if dae is None else dae
+        _checkAddress(das, dae)
+        frame = _embedPayload(das, dae, _REQUEST_CONTROLWORD.get(cmd, 0xC0), self.devicetype, self.sourceaddress,
+            cmd, height, angle)
+        return self.silentPeriod + self.wireTime(frame)
+
+    def getTime(self, address, status=None):
+        """Return the time in seconds (float) for a GET exchange with an address.
+
+        Args:
+            * address (int): The address.
+            * status (tuple or None): The expected (height, angle), which decides the stuffing of the reply.
+              None for a reply without stuffed values.
+
+        """
+        height, angle = (0, 0) if status is None else status
+        return self.requestTime(GET, address) + self.turnaround + \
+            self.wireTime(replyLength(self.sourceaddress, address, height, angle))
+
+    def sweepTime(self, addresses, statuses=None, sets=()):
+        """Return the predicted time in seconds (float) of one polling sweep.
+
+        Args:
+            * addresses (iterable of int): The addresses that get a GET.
+            * statuses (dict or None): Expected (height, angle) per address, see :meth:`getTime`.
+            * sets (iterable of tuple): SET commands sent during the sweep, as (das, dae) or (das, dae, height, angle).
+
+        """
+        statuses = {} if statuses is None else statuses
+        total = sum(self.getTime(address, statuses.get(address)) for address in addresses)
+        for command in sets:
+            total += self.requestTime(SET, *command)
+        return total
+
+    def load(self, addresses, interval, statuses=None, sets=()):
+        """Return the fraction (float) of the bus time used by a polling plan.
+
+        Args:
+            * addresses, statuses, sets: See :meth:`sweepTime`.
+            * interval (float): Time in seconds between the start of two sweeps.
+
+        A value of 1.0 or more means that the sweeps take longer than the interval,
+        so that the bus is saturated.
+
+        """
+        _checkNumerical(interval, minvalue=0, description='interval')
+        sweepTime = self.sweepTime(addresses, statuses, sets)
+        if interval == 0:
+            return float('inf') if sweepTime else 0.0
+        return sweepTime / float(interval)
+
+
+class BusUsage():
+    """Measured use of the bus on one port, see :func:`busUsage`.
+
+    The wire time of the frames is calculated from their length and the port settings.
+    All times are in seconds.
+
+    """
+
+    def __init__(self, port):
+        self.port = port
+        """The port name (str)."""
+
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __repr__(self):
+        """String representation of the :class:`.BusUsage` object."""
+        return "{}.{}<id=0x{:x}, port={!r}, exchanges={}, utilisation={:.3f}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.port,
+            self.exchanges,
+            self.utilisation,
+            )
+
+    def reset(self):
+        """Clear the measurements."""
+        with self._lock:
+            self._start = None
+            self._end = None
+
+            self.exchanges = 0
+            """Number of requests written (int)."""
+
+            self.timeouts = 0
+            """Number of GET requests without an answer (int)."""
+
+            self.busy_time = 0.0
+            """Time with frames on the wire (float)."""
+
+            self.response_wait_time = 0.0
+            """Time waiting for answering slaves to start their reply (float)."""
+
+            self.wasted_time = 0.0
+            """Time waiting for answers that never came (float)."""
+
+            self.idle_gaps = 0
+            """Number of idle gaps between two exchanges (int)."""
+
+            self.idle_time = 0.0
+            """Total time between the end of an exchange and the start of the next one (float)."""
+
+            self.longest_idle_gap = 0.0
+            """The longest idle gap (float)."""
+
+    @property
+    def elapsed(self):
+        """Time (float) from the start of the first exchange to the end of the latest one."""
+        if self._start is None:
+            return 0.0
+        return float(self._end - self._start) / _SECONDS_TO_NANOSECONDS
+
+    @property
+    def utilisation(self):
+        """Fraction (float) of the elapsed time with frames on the wire."""
+        elapsed = self.elapsed
+        return min(1.0, self.busy_time / elapsed) if elapsed else 0.0
+
+    @property
+    def occupancy(self):
+        """Fraction (float) of the elapsed time the bus was not available for other exchanges.
+
+        The wire time, the response waits and the wasted timeouts.
+
+        """
+        elapsed = self.elapsed
+        if not elapsed:
+            return 0.0
+        return min(1.0, (self.busy_time + self.response_wait_time + self.wasted_time) / elapsed)
+
+    def snapshot(self):
+        """Return the measurements as a dict."""
+        with self._lock:
+            return {
+                'port': self.port,
+                'elapsed': self.elapsed,
+                'exchanges': self.exchanges,
+                'timeouts': self.timeouts,
+                'busy_time': self.busy_time,
+                'response_wait_time': self.response_wait_time,
+                'wasted_time': self.wasted_time,
+                'idle_gaps': self.idle_gaps,
+                'idle_time': self.idle_time,
+                'longest_idle_gap': self.longest_idle_gap,
+                'mean_idle_gap': self.idle_time / self.idle_gaps if self.idle_gaps else 0.0,
+                'utilisation': self.utilisation,
+                'occupancy': self.occupancy,
+                }
+
+    def _record(self, start, end, requestTime, replyTime=0.0, timedOut=False):
+        """Record an exchange.
+
+        Args:
+            * start (int): Time of the write of the request, see :func:`tacos2.timing._now_ns`.
+            * end (int): Time when the bus went idle after the exchange.
+            * requestTime (float): Wire time of the request.
+            * replyTime (float): Wire time of the reply, 0.0 if there was none.
+            * timedOut (bool): True if an expected reply did not come.
+
+        """
+        end = max(end, start)
+        duration = float(end - start) / _SECONDS_TO_NANOSECONDS
+        with self._lock:
+            if self._start is None:
+                self._start = start
+            elif start > self._end:
+                gap = float(start - self._end) / _SECONDS_TO_NANOSECONDS
+                self.idle_gaps += 1
+                self.idle_time += gap
+                self.longest_idle_gap = max(self.longest_idle_gap, gap)
+            self._end = max(self._end, end) if self._end is not None else end
+
+            self.exchanges += 1
+            self.busy_time += requestTime + replyTime
+            if timedOut:
+                self.timeouts += 1
+                self.wasted_time += max(0.0, duration - requestTime)
+            elif replyTime:
+                self.response_wait_time += max(0.0, duration - requestTime - replyTime)
+
+
+def busUsage(port):
+    """Return the :class:`BusUsage` of a port, measured by all instruments on it.
+
+    Args:
+        port (str): The port name.
+
+    """
+    with _USAGE_LOCK:
+        usage = _USAGE.get(port)
+        if usage is None:
+            usage = _USAGE[port] = BusUsage(port)
+        return usage
+
+
+def _recordExchange(serialport, start, request, reply=None, timedOut=False, end=None):
+    """Record an exchange on a serial port in its :class:`BusUsage`.
+
+    Args:
+        * serialport: The serial port object.
+        * start (int): Time of the write of the request, see :func:`tacos2.timing._now_ns`.
+        * request (str or bytes): The request frame.
+        * reply (str, bytes or None): The reply frame, None if there was none.
+        * timedOut (bool): True if an expected reply did not come.
+        * end (int or None): Time when the bus went idle. None for now.
+
+    """
+    bitsPerCharacter = _portBitsPerCharacter(serialport)
+    requestTime = _calculate_frame_time(len(request), serialport.baudrate, bitsPerCharacter)
+    replyTime = 0.0 if reply is None else _calculate_frame_time(len(reply), serialport.baudrate, bitsPerCharacter)
+    busUsage(serialport.port)._record(start, _now_ns() if end is None else end, requestTime, replyTime, timedOut)
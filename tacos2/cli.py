@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Command line tool for Tacos2 buses.
+
+Usage examples::
+
+    tacos2 set /dev/ttyUSB0 1 6 --height 50 --angle 80
+    tacos2 get /dev/ttyUSB0 1
+    tacos2 stop /dev/ttyUSB0 1 6
+    tacos2 scan /dev/ttyUSB0 --format csv --output floor3.csv
+    tacos2 bench /dev/ttyUSB0 1 --count 200
+    tacos2 monitor /dev/ttyUSB0 --das 1 --dae 40 --interval 2 --history /var/lib/tacos2/floor3
+    tacos2 history /var/lib/tacos2/floor3 --das 1 --dae 6 --since 3600
+    tacos2 simulate /dev/ttyUSB1 --das 1 --dae 200 --state demo.state
+    tacos2 serve /dev/ttyUSB0 /dev/ttyUSB1 --listen 127.0.0.1:4000 --config buses.json
+
+The same commands are available with ``python -m tacos2``.
+
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import tacos2
+from tacos2.config import loadConfig
+from tacos2.discovery import Discovery, loadTopology
+from tacos2.gateway import GatewayServer
+from tacos2.historian import Historian
+from tacos2.simulator import BlindBank, Simulator
+from tacos2.timing import _SECONDS_TO_MILLISECONDS, _SECONDS_TO_NANOSECONDS, _now_ns
+
+_FORMATS = ('json', 'csv')
+
+
+def main(argv=None):
+    """Run the command line tool.
+
+    Args:
+        argv (list of str or None): The command line arguments, without the program name.
+            Use None to read them from :data:`sys.argv`.
+
+    Returns:
+        The exit status (int).
+
+    """
+    args = _buildParser().parse_args(argv)
+
+    try:
+        return args.function(args)
+    except (IOError, TypeError, ValueError) as err:
+        sys.stderr.write('tacos2: error: {}\n'.format(err))
+        return 1
+    except KeyboardInterrupt:
+        return 130
+
+
+def _buildParser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('port', help='serial port name, for example /dev/ttyUSB0 or COM4')
+    _addBusOptions(common)
+    common.add_argument('--sourceaddress', type=_address, default=0x00,
+        help='source address of this master (default: %(default)s)')
+    common.add_argument('--format', choices=_FORMATS, default='json',
+        help='output format (default: %(default)s)')
+    common.add_argument('--output', default=None,
+        help='output file (default: standard output)')
+    common.add_argument('--debug', action='store_true',
+        help='print the communication details')
+
+    parser = argparse.ArgumentParser(prog='tacos2', description='Control and inspect Tacos2 blinds on a serial bus.')
+    subparsers = parser.add_subparsers(title='commands', dest='command')
+    subparsers.required = True  # Python 3 makes the subcommand optional by default
+
+    command = subparsers.add_parser('set', parents=[common], help='set height and angle of one address or a range')
+    _addRange(command)
+    command.add_argument('--height', type=_value, default=255, help='height in percent (default: unchanged)')
+    command.add_argument('--angle', type=_value, default=255, help='slat angle (default: unchanged)')
+    command.set_defaults(function=_commandSet)
+
+    command = subparsers.add_parser('get', parents=[common], help='read height and angle of one address or a range')
+    _addRange(command)
+    _addTopologyOption(command)
+    command.set_defaults(function=_commandGet)
+
+    command = subparsers.add_parser('stop', parents=[common], help='stop one address or a range')
+    _addRange(command)
+    command.set_defaults(function=_commandStop)
+
+    command = subparsers.add_parser('scan', parents=[common],
+        help='find the responding addresses on the bus, and store the topology')
+    command.add_argument('--das', type=_address, default=0x01, help='first address (default: %(default)s)')
+    command.add_argument('--dae', type=_address, default=0xFF, help='last address (default: %(default)s)')
+    command.add_argument('--probe-timeout', type=float, default=None,
+        help='read timeout in seconds for the first probe of each address (default: from the baudrate)')
+    command.set_defaults(function=_commandScan)
+
+    command = subparsers.add_parser('bench', parents=[common], help='measure the GET roundtrip time of an address')
+    command.add_argument('das', type=_address, help='address')
+    command.add_argument('--count', type=int, default=100, help='number of GET commands (default: %(default)s)')
+    command.set_defaults(function=_commandBench)
+
+    command = subparsers.add_parser('monitor', parents=[common], help='print height and angle changes until interrupted')
+    command.add_argument('--das', type=_address, default=0x01, help='first address (default: %(default)s)')
+    command.add_argument('--dae', type=_address, default=0xFF, help='last address (default: %(default)s)')
+    command.add_argument('--interval', type=float, default=1.0,
+        help='time in seconds between the start of two sweeps (default: %(default)s)')
+    command.add_argument('--duration', type=float, default=None,
+        help='stop after this many seconds (default: run until interrupted)')
+    command.add_argument('--history', default=None, metavar='DIRECTORY',
+        help='also store the changes in a historian directory')
+    _addTopologyOption(command)
+    command.set_defaults(function=_commandMonitor)
+
+    command = subparsers.add_parser('history', help='print the changes stored by monitor --history')
+    command.add_argument('directory', help='historian directory')
+    command.add_argument('--das', type=_address, default=0x00, help='first address (default: %(default)s)')
+    command.add_argument('--dae', type=_address, default=0xFF, help='last address (default: %(default)s)')
+    command.add_argument('--since', type=float, default=None,
+        help='only the changes of the last this many seconds (default: all)')
+    command.add_argument('--format', choices=_FORMATS, default='json',
+        help='output format (default: %(default)s)')
+    command.add_argument('--output', default=None,
+        help='write the result to this file instead of the standard output')
+    command.set_defaults(function=_commandHistory)
+
+    command = subparsers.add_parser('serve', help='serve serial ports to other processes on a local socket')
+    command.add_argument('ports', nargs='+', help='serial port names, for example /dev/ttyUSB0 or COM4')
+    command.add_argument('--listen', type=_socketAddress, default=('127.0.0.1', 4000),
+        help='host:port for TCP, or a path for a Unix socket (default: 127.0.0.1:4000)')
+    _addBusOptions(command)
+    command.add_argument('--sourceaddress', type=_address, default=0x00,
+        help='source address of this master (default: %(default)s)')
+    command.set_defaults(function=_commandServe)
+
+    command = subparsers.add_parser('simulate', help='simulate blinds answering a master, for tests and demos')
+    command.add_argument('port', help='serial port name, for example /dev/ttyUSB1 or memory://demo')
+    command.add_argument('--das', type=_address, default=0x01, help='first simulated address (default: %(default)s)')
+    command.add_argument('--dae', type=_address, default=0x01, help='last simulated address (default: %(default)s)')
+    command.add_argument('--state', default=None,
+        help='state file keeping the blind positions across restarts (default: in memory only)')
+    command.add_argument('--duration', type=float, default=None,
+        help='stop after this many seconds (default: run until interrupted)')
+    command.add_argument('--debug', action='store_true', help='print the handled commands')
+    _addBusOptions(command)
+    command.set_defaults(function=_commandSimulate)
+
+    return parser
+
+
+def _addBusOptions(parser):
+    parser.add_argument('--config', default=None,
+        help='JSON file with the settings per bus, see tacos2.config')
+    parser.add_argument('--baudrate', type=int, default=None,
+        help='baudrate in Baud (default: from the config file, or {})'.format(tacos2.BAUDRATE))
+    parser.add_argument('--timeout', type=float, default=None,
+        help='read timeout in seconds (default: from the config file, or {})'.format(tacos2.TIMEOUT))
+
+
+def _addRange(parser):
+    parser.add_argument('das', type=_address, help='destination address start')
+    parser.add_argument('dae', type=_address, nargs='?', default=None, help='destination address end (default: DAS)')
+
+
+def _addTopologyOption(parser):
+    parser.add_argument('--all-addresses', action='store_true',
+        help='poll all addresses of a range, instead of only those found by the latest scan')
+
+
+def _address(text):
+    return _integerArgument(text, 0x00, 0xFF, 'address')
+
+
+def _value(text):
+    return _integerArgument(text, 0, 255, 'value')
+
+
+def _socketAddress(text):
+    host, separator, port = text.rpartition(':')
+    if not separator or os.sep in text:
+        return text
+    return (host, _integerArgument(port, 1, 65535, 'TCP port'))
+
+
+def _integerArgument(text, minvalue, maxvalue, description):
+    try:
+        value = int(text, 0)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid {}: {!r}'.format(description, text))
+    if not minvalue <= value <= maxvalue:
+        raise argparse.ArgumentTypeError('{} must be in the range {} to {}: {}'.format(description, minvalue, maxvalue, value))
+    return value
+
+
+##############
+## Commands ##
+##############
+
+
+def _commandSet(args):
+    instrument = _openInstrument(args)
+    instrument.set(args.das, _rangeEnd(args), args.height, args.angle)
+    return 0
+
+
+def _commandStop(args):
+    instrument = _openInstrument(args)
+    instrument.stop(args.das, _rangeEnd(args))
+    return 0
+
+
+def _commandGet(args):
+    instrument = _openInstrument(args)
+    poller = tacos2.Poller(instrument, args.das, _rangeEnd(args), addresses=_knownAddresses(args))
+    if not poller.addresses:
+        raise IOError('No address from {} to {} in the topology of {}. Scan the bus, or use --all-addresses'.format(
+            args.das, _rangeEnd(args), args.port))
+    poller.poll()
+
+    if not poller.status:
+        raise IOError('No answer from address {} to {}'.format(args.das, _rangeEnd(args)))
+
+    _writeRows(args, ('address', 'height', 'angle', 'latency_ms'), _statusRows(poller))
+    return 0
+
+
+def _commandScan(args):
+    instrument = _openInstrument(args)
+    discovery = Discovery(instrument, probe_timeout=args.probe_timeout)
+
+    startTime = _now_ns()
+    discovery.run(args.das, args.dae)
+    duration = float(_now_ns() - startTime) / _SECONDS_TO_NANOSECONDS
+
+    _writeRows(args, ('address', 'height', 'angle', 'latency_ms'), _statusRows(discovery))
+    sys.stderr.write('Found {} of {} addresses in {:.2f} s\n'.format(
+        len(discovery.status), args.dae - args.das + 1, duration))
+    if discovery.ambiguous:
+        sys.stderr.write('Ambiguous answers from: {}\n'.format(', '.join(str(a) for a in sorted(discovery.ambiguous))))
+    return 0
+
+
+def _commandBench(args):
+    instrument = _openInstrument(args)
+
+    latencies = []
+    errors = 0
+    startTime = _now_ns()
+    for _ in range(args.count):
+        requestTime = _now_ns()
+        try:
+            instrument.get(args.das)
+        except (IOError, ValueError):
+            errors += 1
+            continue
+        latencies.append(float(_now_ns() - requestTime) / _SECONDS_TO_NANOSECONDS)
+    duration = float(_now_ns() - startTime) / _SECONDS_TO_NANOSECONDS
+
+    if not latencies:
+        raise IOError('No answer from address {} in {} attempts'.format(args.das, args.count))
+
+    latencies.sort()
+    row = {
+        'address': args.das,
+        'count': args.count,
+        'errors': errors,
+        'min_ms': _milliseconds(latencies[0]),
+        'mean_ms': _milliseconds(sum(latencies) / len(latencies)),
+        'p95_ms': _milliseconds(latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]),
+        'max_ms': _milliseconds(latencies[-1]),
+        'rate_per_s': round(args.count / duration, 1) if duration > 0 else None,
+        }
+    _writeRows(args, ('address', 'count', 'errors', 'min_ms', 'mean_ms', 'p95_ms', 'max_ms', 'rate_per_s'), [row])
+    return 0
+
+
+def _commandMonitor(args):
+    instrument = _openInstrument(args)
+    poller = tacos2.Poller(instrument, args.das, args.dae, interval=args.interval, addresses=_knownAddresses(args))
+
+    fields = ('time', 'address', 'height', 'angle')
+    stream = _openOutput(args)
+    writer = _StreamingWriter(stream, args.format, fields)
+
+    def report(address, height, angle):
+        writer.write({'time': round(time.time(), 3), 'address': address, 'height': height, 'angle': angle})
+
+    poller.subscribe(report)
+    historian = None
+    if args.history is not None:
+        historian = Historian(args.history)
+        poller.subscribe(historian.record)
+    poller.start()
+    try:
+        if args.duration is None:
+            while True:
+                time.sleep(3600)
+        else:
+            time.sleep(args.duration)
+    finally:
+        poller.stop()
+        if historian is not None:
+            historian.close()
+        if stream is not sys.stdout:
+            stream.close()
+    return 0
+
+
+def _commandHistory(args):
+    if not os.path.isdir(args.directory):
+        raise IOError('No historian directory: {}'.format(args.directory))
+    historian = Historian(args.directory)
+    try:
+        start = None if args.since is None else time.time() - args.since
+        changes = historian.query(start=start, das=args.das, dae=args.dae)
+    finally:
+        historian.close()
+    rows = [{'time': timestamp, 'address': address, 'height': height, 'angle': angle}
+            for timestamp, address, height, angle in changes]
+    _writeRows(args, ('time', 'address', 'height', 'angle'), rows)
+    return 0
+
+
+def _commandServe(args):
+    configs = dict((port, _busConfig(args, port)) for port in args.ports)
+    server = GatewayServer(args.listen, args.ports, sourceaddress=args.sourceaddress, configs=configs)
+    server.start()
+    sys.stderr.write('Serving {} on {}\n'.format(', '.join(args.ports), server.address))
+    try:
+        while True:
+            time.sleep(3600)
+    finally:
+        server.close()
+
+
+def _commandSimulate(args):
+    bank = BlindBank(args.state)
+    bank.add(args.das, args.dae)
+    simulator = Simulator(args.port, bank, config=_busConfig(args, args.port))
+    simulator.debug = args.debug
+    simulator.start()
+    sys.stderr.write('Simulating {} addresses on {}\n'.format(len(bank.addresses), args.port))
+    try:
+        if args.duration is None:
+            while True:
+                time.sleep(3600)
+        else:
+            time.sleep(args.duration)
+    finally:
+        simulator.stop()
+        bank.close()
+    return 0
+
+
+#############
+## Helpers ##
+#############
+
+
+def _openInstrument(args):
+    instrument = tacos2.Instrument(args.port, sourceaddress=args.sourceaddress, config=_busConfig(args, args.port))
+    instrument.debug = args.debug
+    return instrument
+
+
+def _busConfig(args, port):
+    """The :class:`tacos2.BusConfig` of a port, from the config file and the command line options."""
+    config = tacos2.BusConfig()
+    if args.config is not None:
+        config = loadConfig(args.config).get(port, config)
+
+    changes = {}
+    if args.baudrate is not None:
+        changes['baudrate'] = args.baudrate
+    if args.timeout is not None:
+        changes['timeout'] = args.timeout
+    return config.copy(**changes)
+
+
+def _knownAddresses(args):
+    """The addresses of the latest scan, to narrow a range sweep. None to poll all addresses of the range."""
+    if args.all_addresses or args.das == _rangeEnd(args):
+        return None  # A single address is polled as requested, also when the scan did not find it
+    return loadTopology(args.port)
+
+
+def _rangeEnd(args):
+    return args.das if args.dae is None else args.dae
+
+
+def _milliseconds(seconds):
+    return round(seconds * _SECONDS_TO_MILLISECONDS, 2)
+
+
+def _statusRows(source):
+    """Rows for the status and latencies of a :class:`tacos2.Poller` or :class:`tacos2.discovery.Discovery`."""
+    rows = []
+    for address in sorted(source.status):
+        height, angle = source.status[address]
+        rows.append({
+            'address': address,
+            'height': height,
+            'angle': angle,
+            'latency_ms': _milliseconds(source.latencies[address]),
+            })
+    return rows
+
+
+def _openOutput(args):
+    if args.output is None:
+        return sys.stdout
+    return open(args.output, 'w')
+
+
+def _writeRows(args, fields, rows):
+    stream = _openOutput(args)
+    try:
+        if args.format == 'json':
+            json.dump(rows, stream, indent=2, sort_keys=True, separators=(',', ': '))
+            stream.write('\n')
+        else:
+            writer = csv.DictWriter(stream, fields, lineterminator='\n')
+            writer.writerow(dict((field, field) for field in fields))
+            writer.writerows(rows)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+
+class _StreamingWriter():
+    """Write rows one by one, as JSON lines or CSV, and flush after each row."""
+
+    def __init__(self, stream, format, fields):
+        self.stream = stream
+        self.format = format
+        self._csvWriter = None
+        if format == 'csv':
+            self._csvWriter = csv.DictWriter(stream, fields, lineterminator='\n')
+            self._csvWriter.writerow(dict((field, field) for field in fields))
+            stream.flush()
+
+    def write(self, row):
+        if self._csvWriter is None:
+            self.stream.write(json.dumps(row, sort_keys=True) + '\n')
+        else:
+            self._csvWriter.writerow(row)
+        self.stream.flush()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
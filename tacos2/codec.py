@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Encoding and decoding of Tacos2 frames.
+
+This module does not depend on pySerial.
+
+"""
+
+from tacos2.errors import CollisionError, NoiseError, WrongResponderError
+
+#####################
+## Named constants ##
+#####################
+
+DLE = 0x10
+STX= 0x02
+ETX= 0x03
+STOP = 0x84
+SET = 0x8F
+GET = 0x55
+
+_FRAME_START = chr(DLE) + chr(STX)
+_FRAME_END = chr(DLE) + chr(ETX)
+_MINIMUM_BYTECOUNT = 8  # DAS DAE CW SAX SA CMD DLE ETX
+_ESCAPED = tuple(chr(DLE) * 2 if value == DLE else chr(value) for value in range(256))  # See _checkEsc()
+
+####################
+# Payload handling #
+####################
+
+
+def _embedPayload(das, dae, cw, sax, sa, cmd, height=255, angle=255):
+    """Build a request frame to the slave.
+
+    Args:
+        * das (int): Destination address start.
+        * dae (int): Destination address end.
+        * cw (int): Control word.
+        * sax (int): Source device type.
+        * sa (int): Source address.
+        * cmd (int): Command, one of STOP, GET and SET.
+        * height (int): Blind height, only used for SET. 255 leaves the height unchanged.
+        * angle (int): Slat angle, only used for SET. 255 leaves the angle unchanged.
+
+    Returns:
+        The raw frame (str), including DLE+STX, the byte count and the FCC.
+
+    """
+    payload = _checkEsc(das) + _checkEsc(dae) + _checkEsc(cw) + \
+              _checkEsc(sax) + _checkEsc(sa) + chr(cmd)
+
+    if cmd == SET:
+        payload += _checkEsc(height) + _checkEsc(angle)
+
+    payload += chr(DLE) + chr(ETX)
+    payload = _checkEsc(len(payload)) + payload
+
+    return chr(DLE) + chr(STX) + payload + chr(_calculateFcc(payload))
+
+
+def _embedResponse(da, sa, height, angle):
+    """Build the response frame of a slave to a GET request.
+
+    Args:
+        * da (int): Destination address: the source address of the master.
+        * sa (int): Source address: the address of the slave.
+        * height (int): Blind height.
+        * angle (int): Slat angle.
+
+    Returns:
+        The raw frame (str), including DLE+STX, the byte count and the FCC.
+
+    """
+    payload = _checkEsc(da) + _checkEsc(da) + chr(0x00) + chr(0x00) + _checkEsc(sa) + chr(GET) + \
+              _checkEsc(height) + _checkEsc(angle) + chr(DLE) + chr(ETX)
+    payload = _checkEsc(len(payload)) + payload
+
+    return chr(DLE) + chr(STX) + payload + chr(_calculateFcc(payload))
+
+
+def _extractPayload(response):
+    """Extract the payload data part from the slave's response.
+
+    Args:
+        * response (str): The raw response byte string from the slave.
+
+    Returns:
+        The payload part of the *response* string: from the byte count to the DLE ETX, still escaped.
+
+    Raises:
+        ValueError for a response shorter than its byte count. A :class:`.FrameError` subclass for a
+        response with a broken structure or a wrong FCC, see :func:`_checkFrame`.
+
+    For development purposes, this function can also be used to extract the payload from the request sent TO the slave.
+
+    """
+    length = _frameLength(response)
+    if length is None or len(response) < length:
+        raise ValueError('The response is shorter than its byte count: {!r}'.format(response))
+
+    frame = response[:length]
+    _checkFrame(frame)
+    return frame[2:-1]
+
+
+def _frameLength(data):
+    """Return the total length of the frame at the start of *data*, from its byte count.
+
+    Args:
+        data (str): Received bytes, starting with DLE STX.
+
+    Returns:
+        The frame length (int) including DLE STX, the byte count and the FCC,
+        or None if the byte count has not been received yet.
+
+    Raises:
+        CollisionError if the byte count is too small or wrongly escaped.
+
+    """
+    if len(data) < 3:
+        return None
+    bytecount = ord(data[2])
+    headerLength = 3
+    if bytecount == DLE:
+        if len(data) < 4:
+            return None
+        if ord(data[3]) != DLE:
+            raise CollisionError('Invalid escape of the byte count: {!r}'.format(data[:4]), data)
+        headerLength = 4
+    if bytecount < _MINIMUM_BYTECOUNT:
+        raise CollisionError('Too small byte count: {}'.format(bytecount), data[:headerLength])
+    return headerLength + bytecount + 1
+
+
+def _checkFrame(frame):
+    """Validate a complete frame: byte count, DLE escapes, the unescaped ETX and the FCC.
+
+    Args:
+        frame (str): The frame, from DLE STX to the FCC. Its length must be given by :func:`_frameLength`.
+
+    Returns:
+        The unescaped fields from DAS onwards: a list of int [das, dae, cw, sax, sa, cmd, data...].
+
+    Raises:
+        CollisionError for a broken structure, NoiseError for a wrong FCC.
+
+    """
+    if frame[:2] != _FRAME_START:
+        raise CollisionError('The frame does not start with DLE STX: {!r}'.format(frame), frame)
+    headerLength = 4 if ord(frame[2]) == DLE else 3
+
+    if frame[-3:-1] != _FRAME_END:
+        raise CollisionError('The frame does not end with an unescaped DLE ETX: {!r}'.format(frame), frame)
+
+    fields = _unescape(frame[headerLength:-3], frame, headerLength)
+
+    if len(fields) < 6:
+        raise CollisionError('Too few fields in the frame: {!r}'.format(frame), frame)
+
+    fcc = _calculateFcc(frame[2:-1])
+    if ord(frame[-1]) != fcc:
+        raise NoiseError('Wrong FCC: {} instead of {} in the frame {!r}'.format(ord(frame[-1]), fcc, frame), frame)
+
+    return fields
+
+
+def _unescape(body, frame, offset=0):
+    """Return the values (list of int) of the escaped *body* of a frame.
+
+    Raises:
+        CollisionError for a DLE that does not escape a DLE. The *frame* and *offset* of the body in it
+        are used in the error message.
+
+    """
+    if chr(DLE) not in body:
+        return [ord(character) for character in body]
+
+    fields = []
+    position = 0
+    while position < len(body):
+        value = ord(body[position])
+        if value == DLE:
+            following = body[position + 1:position + 2]
+            if following == chr(STX):
+                raise CollisionError('A new frame starts inside the frame: {!r}'.format(frame), frame)
+            if following != chr(DLE):
+                raise CollisionError('Invalid DLE escape at byte {}: {!r}'.format(offset + position, frame), frame)
+            position += 1
+        fields.append(value)
+        position += 1
+    return fields
+
+
+def _checkResponseFields(fields, requestFields, frame):
+    """Check that a response answers a request: DA is the master, SA is the addressed slave, and the command matches.
+
+    Args:
+        * fields (list of int): The response fields, see :func:`_checkFrame`.
+        * requestFields (list of int): The request fields.
+        * frame (str): The response frame, for the error message.
+
+    Raises:
+        WrongResponderError
+
+    """
+    das, dae, _, _, sa, cmd = fields[:6]
+    requestDas, _, _, _, requestSa, requestCmd = requestFields[:6]
+    if sa != requestDas or das != requestSa or dae != requestSa or cmd != requestCmd:
+        raise WrongResponderError(
+            'Response from address {} to {}-{} with command 0x{:02X}, expected from address {} to {} with command 0x{:02X}: {!r}'.format(
+                sa, das, dae, cmd, requestDas, requestSa, requestCmd, frame), frame)
+    if cmd == GET and len(fields) != 8:
+        raise WrongResponderError('A GET response must have height and angle: {!r}'.format(frame), frame)
+
+
+def _checkEsc(data):
+    """Return the character for a value, doubled if it is DLE (escape code necessary)."""
+    if 0 <= data < len(_ESCAPED):
+        return _ESCAPED[data]
+    return chr(data)  # Raises the errors of chr() for invalid values
+
+
+def _calculateFcc(payload):
+    """ Calculate frame check code.
+        add all bytes and calculete two's complement
+    """
+    return -sum(map(ord, payload)) & 0xFF
+
+
+def _checkResponse(response):
+    """Parse height and angle from the payload of a GET response.
+
+    Args:
+        response (str): The payload from :func:`_extractPayload`, from the byte count to the DLE ETX.
+
+    Returns:
+        The height and the angle, as characters (str of length 1), or None for a response to another command.
+        A value of 255 is returned as it is.
+
+    Raises:
+        CollisionError for invalid DLE escapes, WrongResponderError for a GET response without height and angle.
+
+    """
+    headerLength = 2 if response[0] == chr(DLE) else 1
+    fields = _unescape(response[headerLength:-2], response, headerLength)
+
+    if len(fields) < 6 or fields[5] != GET:
+        return None
+    if len(fields) != 8:
+        raise WrongResponderError('A GET response must have height and angle: {!r}'.format(response), response)
+
+    return chr(fields[6]), chr(fields[7])
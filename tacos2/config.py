@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Per-bus settings: baudrate, framing, timeout, local echo, the silent period between frames and the queue limits.
+
+Without a :class:`BusConfig`, an :class:`tacos2.Instrument` uses the module defaults
+:data:`tacos2.BAUDRATE`, :data:`tacos2.TIMEOUT` etc. With a config file, each bus gets its own
+settings, so upgraded segments can run at a higher baudrate next to legacy ones::
+
+    configs = tacos2.config.loadConfig('buses.json')
+    instrument = tacos2.Instrument('/dev/ttyUSB1', config=configs['/dev/ttyUSB1'])
+
+The config file is JSON. The ``defaults`` apply to all buses, and are overridden per bus::
+
+    {
+        "defaults": {"timeout": 0.1},
+        "buses": {
+            "/dev/ttyUSB0": {"baudrate": 9600},
+            "/dev/ttyUSB1": {"baudrate": 115200, "handle_local_echo": true, "silent_period": 0.0005},
+            "/dev/ttyUSB2": {"queue_limit": 50, "queue_policy": "coalesce"}
+        }
+    }
+
+"""
+
+import json
+
+import tacos2
+from tacos2 import queues
+from tacos2 import timing
+from tacos2.utils import _checkInt, _checkNumerical
+
+_SETTINGS = ('baudrate', 'parity', 'bytesize', 'stopbits', 'timeout', 'handle_local_echo', 'silent_period',
+    'queue_limit', 'queue_policy')
+_PARITIES = ('N', 'E', 'O', 'M', 'S')
+_BYTESIZES = (5, 6, 7, 8)
+_STOPBITS = (1, 1.5, 2)
+
+
+class BusConfig():
+    """Validated settings of one bus.
+
+    Args:
+        * baudrate (int or None): Baudrate in Baud. None for :data:`tacos2.BAUDRATE`.
+        * parity (str or None): ``'N'``, ``'E'``, ``'O'``, ``'M'`` or ``'S'``. None for :data:`tacos2.PARITY`.
+        * bytesize (int or None): Data bits per character. None for :data:`tacos2.BYTESIZE`.
+        * stopbits (int, float or None): 1, 1.5 or 2. None for :data:`tacos2.STOPBITS`.
+        * timeout (float or None): Read timeout in seconds. None for :data:`tacos2.TIMEOUT`.
+        * handle_local_echo (bool or None): The RS-485 adaptor echoes the transmitted data.
+          None to detect it. See :attr:`tacos2.Instrument.handle_local_echo`.
+        * silent_period (float or None): Fixed silent period in seconds between two frames.
+          None for 3.5 character times at the baudrate.
+        * queue_limit (int or None): Maximum number of commands in each queue of the bus. None for unbounded.
+        * queue_policy (str): What happens to a command when the queue is full, one of
+          :data:`tacos2.queues.POLICIES`. See :mod:`tacos2.queues`.
+
+    Raises:
+        TypeError, ValueError for invalid settings. The settings are checked once, here.
+
+    """
+
+    def __init__(self, baudrate=None, parity=None, bytesize=None, stopbits=None, timeout=None,
+            handle_local_echo=False, silent_period=None, queue_limit=None, queue_policy=queues.POLICY_BLOCK):
+        self.baudrate = tacos2.BAUDRATE if baudrate is None else baudrate
+        self.parity = str(tacos2.PARITY if parity is None else parity)
+        self.bytesize = tacos2.BYTESIZE if bytesize is None else bytesize
+        self.stopbits = tacos2.STOPBITS if stopbits is None else stopbits
+        self.timeout = tacos2.TIMEOUT if timeout is None else timeout
+        self.handle_local_echo = handle_local_echo
+        self.silent_period = silent_period
+        self.queue_limit = queue_limit
+        self.queue_policy = str(queue_policy)
+
+        _checkInt(self.baudrate, minvalue=1, description='baudrate')
+        if self.parity not in _PARITIES:
+            raise ValueError('The parity must be one of {}. Given: {!r}'.format(', '.join(_PARITIES), self.parity))
+        if self.bytesize not in _BYTESIZES:
+            raise ValueError('The bytesize must be one of {}. Given: {!r}'.format(_BYTESIZES, self.bytesize))
+        if self.stopbits not in _STOPBITS:
+            raise ValueError('The stopbits must be one of {}. Given: {!r}'.format(_STOPBITS, self.stopbits))
+        _checkNumerical(self.timeout, minvalue=0, description='timeout')
+        if not isinstance(self.handle_local_echo, (bool, type(None))):
+            raise TypeError('The handle_local_echo must be a bool or None. Given: {!r}'.format(self.handle_local_echo))
+        if self.silent_period is not None:
+            _checkNumerical(self.silent_period, minvalue=0, description='silent period')
+        if self.queue_limit is not None:
+            _checkInt(self.queue_limit, minvalue=1, description='queue limit')
+        if self.queue_policy not in queues.POLICIES:
+            raise ValueError('The queue_policy must be one of {}. Given: {!r}'.format(', '.join(queues.POLICIES), self.queue_policy))
+
+    def __repr__(self):
+        """String representation of the :class:`.BusConfig` object."""
+        return "{}.{}<id=0x{:x}, {}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            ', '.join('{}={!r}'.format(name, getattr(self, name)) for name in _SETTINGS),
+            )
+
+    def __eq__(self, other):
+        return isinstance(other, BusConfig) and self.settings() == other.settings()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def settings(self):
+        """Return the settings as a dict, in the format of the config file."""
+        return dict((name, getattr(self, name)) for name in _SETTINGS)
+
+    def copy(self, **changes):
+        """Return a new, validated config with some settings changed.
+
+        Example: ``config.copy(baudrate=38400)``.
+
+        """
+        settings = self.settings()
+        for name in changes:
+            if name not in settings:
+                raise ValueError('Unknown bus setting: {!r}'.format(name))
+        settings.update(changes)
+        return BusConfig(**settings)
+
+    def openArguments(self):
+        """Return the keyword arguments for opening a serial port (:class:`serial.Serial`) with these settings."""
+        return {
+            'baudrate': self.baudrate,
+            'parity': self.parity,
+            'bytesize': self.bytesize,
+            'stopbits': self.stopbits,
+            'timeout': self.timeout,
+            }
+
+    def apply(self, instrument):
+        """Apply the settings to an instrument and its serial port.
+
+        The serial port is shared by all instruments on the same port name, so the bus settings
+        apply to all of them. Only the settings that differ are changed, as pySerial
+        reconfigures an open port for each change.
+
+        """
+        serialport = instrument.serial
+        for name, value in self.openArguments().items():
+            if getattr(serialport, name, None) != value:
+                setattr(serialport, name, value)
+
+        if self.silent_period is None:
+            timing._SILENT_PERIODS.pop(serialport.port, None)
+        else:
+            timing._SILENT_PERIODS[serialport.port] = self.silent_period
+
+        queues._QUEUE_SETTINGS[serialport.port] = (self.queue_limit, self.queue_policy)
+
+        instrument.handle_local_echo = self.handle_local_echo
+
+
+def loadConfig(path):
+    """Load the bus settings from a config file.
+
+    Args:
+        path (str): The JSON config file, see the module documentation.
+
+    Returns:
+        A dict of port name: :class:`BusConfig`.
+
+    Raises:
+        IOError if the file can not be read, ValueError or TypeError for an invalid file or setting.
+        The error message names the bus.
+
+    """
+    with open(path) as configFile:
+        try:
+            content = json.load(configFile)
+        except ValueError as err:
+            raise ValueError('The config file {} is not valid JSON: {}'.format(path, err))
+
+    if not isinstance(content, dict) or not isinstance(content.get('buses', {}), dict):
+        raise ValueError('The config file {} must contain an object with "defaults" and "buses"'.format(path))
+
+    defaults = content.get('defaults', {})
+    configs = {}
+    for port, settings in content.get('buses', {}).items():
+        merged = dict(defaults)
+        merged.update(settings)
+        unknown = sorted(set(merged) - set(_SETTINGS))
+        if unknown:
+            raise ValueError('Unknown setting {!r} for the bus {} in {}'.format(str(unknown[0]), port, path))
+        try:
+            configs[str(port)] = BusConfig(**dict((str(name), value) for name, value in merged.items()))
+        except (TypeError, ValueError) as err:
+            raise err.__class__('Invalid setting for the bus {} in {}: {}'.format(port, path, err))
+    return configs
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Correlation of responses with requests, per port.
+
+Each GET request is tracked while it is in flight, by its (das, sa, cmd). A response matches
+it when its SA is the requested address, its DAS and DAE are the source address of the master,
+and the command is the same. Other frames received while waiting, for example for another
+address or command, are discarded.
+
+The protocol has no sequence number, so a response can not be told apart from the response to
+an earlier request with the same key. Therefore the bytes received since the previous exchange
+are discarded before each request is written, which removes the late responses that have
+arrived by then. A late response that arrives only after the next request to the same address
+has been written is still taken as its answer.
+
+Requests that timed out are remembered for :data:`LATE_REPLY_WINDOW` seconds, so that their
+late responses are recognised and counted::
+
+    tracker = tacos2.correlation.tracker('/dev/ttyUSB0')
+    print(tracker.late_replies, tracker.max_lateness, tracker.unexpected_frames)
+
+"""
+
+import threading
+
+from tacos2.timing import _SECONDS_TO_NANOSECONDS, _now_ns
+
+LATE_REPLY_WINDOW = 2.0
+"""Time in seconds that a timed out request is remembered, to recognise its late response (float)."""
+
+_TRACKERS = {}  # RequestTracker per port name
+_TRACKERS_LOCK = threading.Lock()
+
+
+def _requestKey(requestFields):
+    """The key (das, sa, cmd) of a request, from its fields."""
+    return requestFields[0], requestFields[4], requestFields[5]
+
+
+def _responseKey(fields):
+    """The key (das, sa, cmd) of the request that a response answers, or None if the frame is not a response."""
+    das, dae, cw, _, sa, cmd = fields[:6]
+    if cw != 0x00 or das != dae:
+        return None
+    return sa, das, cmd
+
+
+def _matches(fields, requestFields):
+    """Return True if the response fields answer the request."""
+    return _responseKey(fields) == _requestKey(requestFields)
+
+
+class RequestTracker():
+    """In-flight requests and discarded frames of one port, see :func:`tracker`."""
+
+    def __init__(self, port):
+        self.port = port
+        """The port name (str)."""
+
+        self._lock = threading.Lock()
+        self._inFlight = {}  # Request key: send time in ns
+        self._expired = {}  # Request key: send time in ns, of the timed out requests
+
+        self.late_replies = 0
+        """Number of discarded responses to earlier, timed out requests (int)."""
+
+        self.unexpected_frames = 0
+        """Number of discarded frames that answer no known request (int)."""
+
+        self.total_lateness = 0.0
+        """Sum of the times in seconds from the late requests to their responses (float)."""
+
+        self.max_lateness = 0.0
+        """The longest time in seconds from a late request to its response (float)."""
+
+    def __repr__(self):
+        """String representation of the :class:`.RequestTracker` object."""
+        return "{}.{}<id=0x{:x}, port={!r}, in_flight={}, late_replies={}, unexpected_frames={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.port,
+            len(self._inFlight),
+            self.late_replies,
+            self.unexpected_frames,
+            )
+
+    @property
+    def inFlight(self):
+        """The keys (das, sa, cmd) of the requests waiting for a response (list of tuples)."""
+        with self._lock:
+            return list(self._inFlight)
+
+    def begin(self, requestFields):
+        """Record that a request has been sent. Returns its key."""
+        key = _requestKey(requestFields)
+        with self._lock:
+            self._inFlight[key] = _now_ns()
+            self._expired.pop(key, None)
+        return key
+
+    def complete(self, key):
+        """Record that the request has been answered."""
+        with self._lock:
+            self._inFlight.pop(key, None)
+
+    def expire(self, key):
+        """Record that the request timed out. Its late response is recognised for :data:`LATE_REPLY_WINDOW` seconds."""
+        with self._lock:
+            sent = self._inFlight.pop(key, None)
+            if sent is not None:
+                self._expired[key] = sent
+
+    def discard(self, fields):
+        """Record a received frame that does not answer the current request.
+
+        Returns:
+            :const:`True` if it is the late response to a timed out request, otherwise :const:`False`.
+
+        """
+        now = _now_ns()
+        key = _responseKey(fields)
+        with self._lock:
+            self._purge(now)
+            sent = self._expired.pop(key, None) if key is not None else None
+            if sent is None:
+                self.unexpected_frames += 1
+                return False
+            lateness = float(now - sent) / _SECONDS_TO_NANOSECONDS
+            self.late_replies += 1
+            self.total_lateness += lateness
+            self.max_lateness = max(self.max_lateness, lateness)
+            return True
+
+    def snapshot(self):
+        """Return the counters as a dict."""
+        with self._lock:
+            return {
+                'port': self.port,
+                'in_flight': len(self._inFlight),
+                'late_replies': self.late_replies,
+                'unexpected_frames': self.unexpected_frames,
+                'mean_lateness': self.total_lateness / self.late_replies if self.late_replies else 0.0,
+                'max_lateness': self.max_lateness,
+                }
+
+    def _purge(self, now):
+        oldest = now - int(LATE_REPLY_WINDOW * _SECONDS_TO_NANOSECONDS)
+        for key in [key for key, sent in self._expired.items() if sent < oldest]:
+            del self._expired[key]
+
+
+def tracker(port):
+    """Return the :class:`RequestTracker` of a port, shared by all instruments on it.
+
+    Args:
+        port (str): The port name.
+
+    """
+    with _TRACKERS_LOCK:
+        requestTracker = _TRACKERS.get(port)
+        if requestTracker is None:
+            requestTracker = _TRACKERS[port] = RequestTracker(port)
+        return requestTracker
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Bus discovery: find the addresses that have blinds, and cache the topology on disk.
+
+Each address is first probed with a short read timeout. Empty addresses do not answer
+at all, and are skipped after this single short probe. Only ambiguous addresses are
+retried with the normal timeout: garbled or truncated answers, and addresses that were
+present in the cached topology but did not answer the short probe.
+
+The topology is stored per serial port as a small JSON file, see :func:`topologyPath`.
+Use it to skip empty addresses in sweeps::
+
+    addresses = tacos2.discovery.loadTopology('/dev/ttyUSB0')
+    poller = tacos2.Poller(instrument, addresses=addresses)
+
+"""
+
+import json
+import os
+import re
+import time
+
+from tacos2.codec import GET, _checkResponse, _embedPayload, _extractPayload
+from tacos2.errors import FrameError, NoAnswerError
+from tacos2.timing import _SECONDS_TO_NANOSECONDS, _calculate_frame_time, _now_ns, _portBitsPerCharacter
+from tacos2.utils import _checkAddress, _checkInt, _checkNumerical
+
+TOPOLOGY_DIRECTORY = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'tacos2')
+"""Default directory for the topology files (str)."""
+
+_TURNAROUND_TIME = 0.01  # Time in seconds allowed for the slave to start answering
+_LONGEST_GET_EXCHANGE = 12 + 16  # Bytes in a GET request and the longest (escaped) answer
+
+_PRESENT = 'present'
+_ABSENT = 'absent'
+_AMBIGUOUS = 'ambiguous'
+
+
+class Discovery():
+    """Find the addresses with blinds on the bus of an instrument.
+
+    Args:
+        * instrument (:class:`tacos2.Instrument`): The instrument used for probing.
+        * probe_timeout (float or None): Read timeout in seconds for the first probe of each address.
+          Use None to calculate it from the baudrate (about 40 ms at 9600 baud).
+        * retry_timeout (float or None): Read timeout in seconds when retrying ambiguous addresses.
+          Use None for the timeout of the serial port.
+        * retries (int): Number of retries for ambiguous addresses.
+        * directory (str or None): Directory for the topology file. Use None for :data:`TOPOLOGY_DIRECTORY`.
+
+    """
+
+    def __init__(self, instrument, probe_timeout=None, retry_timeout=None, retries=2, directory=None):
+        if probe_timeout is None:
+            probe_timeout = _calculate_frame_time(_LONGEST_GET_EXCHANGE, instrument.serial.baudrate,
+                _portBitsPerCharacter(instrument.serial)) + _TURNAROUND_TIME
+        if retry_timeout is None:
+            retry_timeout = instrument.serial.timeout
+        _checkNumerical(probe_timeout, minvalue=0, description='probe timeout')
+        _checkNumerical(retry_timeout, minvalue=0, description='retry timeout')
+        _checkInt(retries, minvalue=0, description='number of retries')
+
+        self.instrument = instrument
+        """The :class:`tacos2.Instrument` used for probing."""
+
+        self.probe_timeout = probe_timeout
+        """Read timeout in seconds for the first probe of each address (float)."""
+
+        self.retry_timeout = retry_timeout
+        """Read timeout in seconds for retries of ambiguous addresses (float)."""
+
+        self.retries = retries
+        """Number of retries for ambiguous addresses (int)."""
+
+        self.directory = TOPOLOGY_DIRECTORY if directory is None else directory
+        """Directory for the topology file (str)."""
+
+        self.status = {}
+        """Height and angle found during the latest run, as a dict of address: (height, angle)."""
+
+        self.latencies = {}
+        """Roundtrip time in seconds (float) of the answering probe, as a dict of address: latency."""
+
+        self.ambiguous = set()
+        """Addresses that were still ambiguous after all retries in the latest run."""
+
+    def __repr__(self):
+        """String representation of the :class:`.Discovery` object."""
+        return "{}.{}<id=0x{:x}, probe_timeout={}, retry_timeout={}, retries={}, directory={!r}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.probe_timeout,
+            self.retry_timeout,
+            self.retries,
+            self.directory,
+            )
+
+    def run(self, das=0x01, dae=0xFF, save=True):
+        """Probe all addresses in a range.
+
+        Args:
+            * das (destination address start): First address to probe.
+            * dae (destination address end): Last address to probe.
+            * save (bool): Store the found addresses in the topology file. Cached addresses
+              outside the probed range are kept.
+
+        Returns:
+            The addresses that answered (sorted list of int).
+
+        Raises:
+            ValueError, TypeError, IOError
+
+        """
+        _checkAddress(das, dae)
+
+        port = self.instrument.serial.port
+        known = set(loadTopology(port, self.directory) or [])
+
+        self.status = {}
+        self.latencies = {}
+        ambiguous = set()
+
+        for address in range(das, dae + 1):
+            result = self._probe(address, self.probe_timeout)
+            if result == _AMBIGUOUS or (result == _ABSENT and address in known):
+                ambiguous.add(address)
+
+        for _ in range(self.retries):
+            for address in sorted(ambiguous):
+                if self._probe(address, self.retry_timeout) != _AMBIGUOUS:
+                    ambiguous.discard(address)
+
+        self.ambiguous = ambiguous
+        addresses = sorted(self.status)
+
+        if save:
+            outside = [address for address in known if not das <= address <= dae]
+            saveTopology(port, sorted(outside + addresses), self.directory)
+
+        return addresses
+
+    def _probe(self, address, timeout):
+        request = _embedPayload(address, address, 0x60, self.instrument.sax, self.instrument.sa, GET)
+
+        startTime = _now_ns()
+        try:
+            answer = self.instrument._communicate(request, GET, timeout=timeout)
+        except NoAnswerError:
+            return _ABSENT
+        except FrameError:
+            return _AMBIGUOUS  # Garbled or truncated answer, for example a collision
+
+        try:
+            height, angle = _checkResponse(_extractPayload(answer))
+        except (IOError, ValueError):
+            return _AMBIGUOUS  # Garbled or truncated answer, for example a collision
+
+        self.status[address] = (ord(height), ord(angle))
+        self.latencies[address] = float(_now_ns() - startTime) / _SECONDS_TO_NANOSECONDS
+        return _PRESENT
+
+
+##########################
+## Topology persistence ##
+##########################
+
+
+def topologyPath(port, directory=None):
+    """Return the path of the topology file for a serial port.
+
+    Args:
+        * port (str): The serial port name, for example ``/dev/ttyUSB0``.
+        * directory (str or None): Use None for :data:`TOPOLOGY_DIRECTORY`.
+
+    """
+    directory = TOPOLOGY_DIRECTORY if directory is None else directory
+    return os.path.join(directory, 'topology-' + re.sub(r'[^A-Za-z0-9_.-]', '_', port.strip('/')) + '.json')
+
+
+def loadTopology(port, directory=None):
+    """Load the cached topology of a serial port.
+
+    Args:
+        * port (str): The serial port name.
+        * directory (str or None): Use None for :data:`TOPOLOGY_DIRECTORY`.
+
+    Returns:
+        The addresses with blinds (sorted list of int), or None if there is no valid topology file.
+
+    """
+    try:
+        with open(topologyPath(port, directory)) as topologyFile:
+            topology = json.load(topologyFile)
+        return sorted(int(address) for address in topology['addresses'])
+    except (EnvironmentError, ValueError, KeyError, TypeError):
+        return None
+
+
+def saveTopology(port, addresses, directory=None):
+    """Store the topology of a serial port.
+
+    Args:
+        * port (str): The serial port name.
+        * addresses (iterable of int): The addresses with blinds.
+        * directory (str or None): Use None for :data:`TOPOLOGY_DIRECTORY`.
+
+    The file is replaced atomically, so concurrent readers never see a partial file.
+
+    """
+    path = topologyPath(port, directory)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    topology = {'port': port, 'time': time.time(), 'addresses': sorted(addresses)}
+
+    temporaryPath = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporaryPath, 'w') as topologyFile:
+        json.dump(topology, topologyFile)
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)  # os.rename does not replace files on Windows
+    os.rename(temporaryPath, path)
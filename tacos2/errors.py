@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Exceptions raised by Tacos2.
+
+All of them are subclasses of IOError, so code catching IOError keeps working.
+The :class:`FrameError` subclasses classify invalid answers.
+
+"""
+
+
+class NoAnswerError(IOError):
+    """The slave did not answer within the timeout (no bytes were received)."""
+
+
+class FrameError(IOError):
+    """An invalid frame was received.
+
+    Args:
+        * message (str): Description of the problem.
+        * frame (str): The received bytes.
+
+    """
+
+    def __init__(self, message, frame=''):
+        IOError.__init__(self, message)
+        self.frame = frame
+        """The received bytes (str)."""
+
+
+class NoiseError(FrameError):
+    """Bytes were received, but no frame start (DLE STX), or a frame with a wrong FCC."""
+
+
+class CollisionError(FrameError):
+    """A frame with a broken structure: wrong byte count, invalid DLE escape, or a new frame start inside the frame.
+
+    This is typical for two devices transmitting at the same time.
+
+    """
+
+
+class TruncatedFrameError(FrameError):
+    """A frame start was received, but the rest of the frame did not arrive within the timeout."""
+
+
+class WrongResponderError(FrameError):
+    """A valid frame was received, but not from the addressed slave, not to this master, or not for the command.
+
+    Frames answering other requests are discarded while waiting for a response, see :mod:`tacos2.correlation`.
+    """
+
+
+class DeadlineExpiredError(IOError):
+    """A command could not be started before its deadline, and was dropped without being sent."""
+
+
+class QueueFullError(IOError):
+    """The command queue of the bus was full, and the command was rejected or dropped, see :mod:`tacos2.queues`."""
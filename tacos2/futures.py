@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Completion handles for frames that are sent in the background.
+
+"""
+
+import threading
+
+
+class FrameFuture():
+    """Completion handle for a frame in the write queue of a serial port.
+
+    Returned by :meth:`Instrument.setNowait` and :meth:`Instrument.stopNowait`.
+
+    """
+
+    def __init__(self, frame):
+        self.frame = frame
+        """The raw frame to be written."""
+
+        self._event = threading.Event()
+        self._exception = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """String representation of the :class:`.FrameFuture` object."""
+        return "{}.{}<id=0x{:x}, done={}, frame={!r}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.done(),
+            self.frame,
+            )
+
+    def done(self):
+        """Return :const:`True` if the frame has been written (or has failed)."""
+        return self._event.is_set()
+
+    def exception(self, timeout=None):
+        """Wait for the frame to be written, and return the exception raised while writing it (or :const:`None`).
+
+        Args:
+            timeout (float or None): Maximum time in seconds to wait. Use None to wait forever.
+
+        Raises:
+            IOError if the frame has not been written within the timeout.
+
+        """
+        if not self._event.wait(timeout):
+            raise IOError('The frame was not written within the timeout ({} s): {!r}'.format(timeout, self.frame))
+        return self._exception
+
+    def result(self, timeout=None):
+        """Wait for the frame to be written.
+
+        Args:
+            timeout (float or None): Maximum time in seconds to wait. Use None to wait forever.
+
+        Raises:
+            IOError, or the exception raised while writing the frame.
+
+        """
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+
+    def add_done_callback(self, callback):
+        """Call ``callback(future)`` when the frame has been written.
+
+        If the frame already has been written, the callback is called immediately.
+
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self, exception=None):
+        with self._lock:
+            self._exception = exception
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
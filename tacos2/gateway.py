@@ -0,0 +1,517 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Local gateway: one process owns the serial ports, and clients talk to it over a TCP or Unix socket.
+
+The protocol is line based. A request is ``<id> <command> <port> <das> [<dae> [<height> <angle>]]``,
+where the command is SET, STOP or GET. The answer is ``<id> OK``, ``<id> OK <height> <angle>``
+(for GET) or ``<id> ERR <message>``. The id is chosen by the client, and is used to match the answers.
+
+A client may send many requests without waiting for the answers (pipelining). The ports work in
+parallel, so the answers may arrive out of order. SET and STOP requests go straight to the write
+queue of the port, so consecutive requests are written back to back, and are answered as soon as
+the frames have been written. GET requests for one port are executed in order. As on a local
+:class:`tacos2.Instrument`, the bus is scheduled by priority: a STOP is written before queued
+SET frames, and both before the GET requests still waiting in the gateway.
+
+Server::
+
+    server = tacos2.gateway.GatewayServer(('127.0.0.1', 4000), ['/dev/ttyUSB0', '/dev/ttyUSB1'])
+    server.start()
+
+Client, with the same methods as :class:`tacos2.Instrument`::
+
+    client = tacos2.gateway.GatewayClient(('127.0.0.1', 4000))
+    instrument = client.instrument('/dev/ttyUSB0')
+    instrument.set(1, 40, 50, 80)
+    height, angle = instrument.get(7)
+
+Use a str instead of a (host, port) tuple for a Unix socket.
+
+"""
+
+import os
+import socket
+import threading
+
+import tacos2
+from tacos2 import queues
+from tacos2.errors import QueueFullError
+from tacos2.utils import _checkAddress, _checkInt
+
+_COMMANDS = ('SET', 'STOP', 'GET')
+
+
+def _createSocket(address):
+    if isinstance(address, tuple):
+        return socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+
+def _readLines(connection):
+    """Yield the lines received on a socket, without the line ending, until it is closed."""
+    buffered = b''
+    while True:
+        try:
+            chunk = connection.recv(4096)
+        except EnvironmentError:
+            return
+        if not chunk:
+            return
+        buffered += chunk
+        lines = buffered.split(b'\n')
+        buffered = lines.pop()
+        for line in lines:
+            yield line.decode('latin1').strip()
+
+
+class GatewayServer():
+    """Serve the Tacos2 buses on a TCP or Unix socket.
+
+    Args:
+        * address (tuple or str): A (host, port) tuple for TCP, or a path for a Unix socket.
+        * ports (list of str): The serial ports that clients may use.
+        * sourceaddress (int): Source address of the master on all buses.
+        * configs (dict or None): :class:`tacos2.BusConfig` per port name. Ports without one use the module defaults.
+
+    Bind TCP sockets to localhost only, as there is no authentication.
+
+    """
+
+    def __init__(self, address, ports, sourceaddress=0x00, configs=None):
+        self.address = address
+        """The socket address (tuple or str)."""
+
+        self.ports = list(ports)
+        """The serial ports that clients may use (list of str)."""
+
+        self._sourceaddress = sourceaddress
+        self._configs = dict(configs or {})
+        self._executors = {}
+        self._listener = None
+        self._thread = None
+
+    def __repr__(self):
+        """String representation of the :class:`.GatewayServer` object."""
+        return "{}.{}<id=0x{:x}, address={!r}, ports={}, running={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.address,
+            self.ports,
+            self._listener is not None,
+            )
+
+    def start(self):
+        """Open the serial ports, and accept clients in a background thread."""
+        for port in self.ports:
+            executor = self._executors[port] = _PortExecutor(tacos2.Instrument(port,
+                sourceaddress=self._sourceaddress, config=self._configs.get(port)))
+            executor.start()
+
+        if not isinstance(self.address, tuple) and os.path.exists(self.address):
+            os.remove(self.address)  # Stale socket file from a previous run
+        self._listener = _createSocket(self.address)
+        if isinstance(self.address, tuple):
+            self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(self.address)
+        self._listener.listen(16)
+        if isinstance(self.address, tuple):
+            self.address = self._listener.getsockname()  # Resolves port 0 to the actual port
+
+        self._thread = threading.Thread(target=self._accept, name='tacos2-gateway')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Stop accepting clients. Requests already received are still executed."""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            try:
+                listener.shutdown(socket.SHUT_RDWR)
+            except EnvironmentError:
+                pass
+            listener.close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if not isinstance(self.address, tuple) and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def _accept(self):
+        while True:
+            listener = self._listener
+            if listener is None:
+                return
+            try:
+                connection, _ = listener.accept()
+            except EnvironmentError:
+                return
+            thread = threading.Thread(target=self._serve, args=(_ClientConnection(connection),),
+                name='tacos2-gateway-client')
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, client):
+        for line in _readLines(client.connection):
+            if not line:
+                continue
+            fields = line.split()
+            requestId = fields[0]
+            try:
+                command, port, arguments = self._parse(fields)
+            except ValueError as err:
+                client.send(requestId, 'ERR {}'.format(err))
+                continue
+            self._executors[port].submit(client, requestId, command, arguments)
+        client.close()
+
+    def _parse(self, fields):
+        if len(fields) < 4:
+            raise ValueError('Malformed request: {}'.format(' '.join(fields)))
+        command, port = fields[1].upper(), fields[2]
+        if command not in _COMMANDS:
+            raise ValueError('Unknown command: {}'.format(fields[1]))
+        if port not in self._executors:
+            raise ValueError('Unknown port: {}'.format(port))
+        try:
+            arguments = [int(field) for field in fields[3:]]
+        except ValueError:
+            raise ValueError('Malformed request: {}'.format(' '.join(fields)))
+        if len(arguments) > {'SET': 4, 'STOP': 2, 'GET': 1}[command]:
+            raise ValueError('Too many arguments: {}'.format(' '.join(fields)))
+        return command, port, arguments
+
+
+class _ClientConnection():
+    """A client socket of the gateway server. Answers from several ports are sent under a lock."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._lock = threading.Lock()
+
+    def send(self, requestId, answer):
+        with self._lock:
+            try:
+                self.connection.sendall('{} {}\n'.format(requestId, answer).encode('latin1'))
+            except EnvironmentError:
+                pass  # The client has gone, the answer is not needed any more
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+class _PortExecutor(threading.Thread):
+    """Execute the requests for one serial port.
+
+    SET and STOP requests are given to the write queue of the instrument at once, see
+    :meth:`tacos2.Instrument.setNowait`, so they never wait behind GET requests. The GET requests
+    wait in a :class:`tacos2.queues.BoundedQueue`, and are executed in the order they were received.
+    A request that fails, or is rejected or dropped, is answered with ERR, and a GET merged into
+    a newer one gets the same answer.
+
+    """
+
+    def __init__(self, instrument):
+        threading.Thread.__init__(self, name='tacos2-gateway-{}'.format(instrument.serial.port))
+        self.daemon = True
+        self.instrument = instrument
+        self._queue = queues.BoundedQueue(instrument.serial.port, 'gateway',
+            dropped=self._dropped, superseded=_supersede)
+
+    def submit(self, client, requestId, command, arguments):
+        requesters = [(client, requestId)]
+        if command == 'GET':
+            try:
+                self._queue.put((arguments[0], requesters), command, (arguments[0], arguments[0]))
+            except QueueFullError as err:
+                _answer(requesters, 'ERR {}'.format(_oneLine(err)))
+            return
+
+        das = arguments[0]
+        dae = arguments[1] if len(arguments) > 1 else das
+        try:
+            if command == 'SET':
+                future = self.instrument.setNowait(das, dae, *arguments[2:])
+            else:
+                future = self.instrument.stopNowait(das, dae)
+        except Exception as err:
+            _answer(requesters, 'ERR {}'.format(_oneLine(err)))
+            return
+
+        future.add_done_callback(lambda future: _answer(requesters,
+            'OK' if future.exception() is None else 'ERR {}'.format(_oneLine(future.exception()))))
+
+    def run(self):
+        while True:
+            address, requesters = self._queue.get()
+            try:
+                height, angle = self.instrument.get(address)
+            except Exception as err:  # Any error is answered, the thread must keep serving the port
+                _answer(requesters, 'ERR {}'.format(_oneLine(err)))
+            else:
+                _answer(requesters, 'OK {} {}'.format(ord(height), ord(angle)))
+
+    def _dropped(self, request, err):
+        _answer(request[1], 'ERR {}'.format(_oneLine(err)))
+
+
+def _supersede(old, new):
+    """Merge a queued GET into the newer GET of the same address, see :class:`tacos2.queues.BoundedQueue`."""
+    return new[0], old[1] + new[1]
+
+
+def _answer(requesters, answer):
+    for client, requestId in requesters:
+        client.send(requestId, answer)
+
+
+def _oneLine(err):
+    return ' '.join(str(err).split()) or err.__class__.__name__
+
+
+class GatewayReply():
+    """Completion handle for a request sent by :class:`GatewayClient`."""
+
+    def __init__(self, request):
+        self.request = request
+        """The request line, without the id."""
+
+        self._event = threading.Event()
+        self._answer = None
+
+    def __repr__(self):
+        """String representation of the :class:`.GatewayReply` object."""
+        return "{}.{}<id=0x{:x}, done={}, request={!r}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.done(),
+            self.request,
+            )
+
+    def done(self):
+        """Return :const:`True` if the answer has arrived."""
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Wait for the answer.
+
+        Args:
+            timeout (float or None): Maximum time in seconds to wait. Use None to wait forever.
+
+        Returns:
+            A tuple (height, angle) of int for GET, otherwise None.
+
+        Raises:
+            IOError if the gateway reports an error, or if there is no answer within the timeout.
+
+        """
+        if not self._event.wait(timeout):
+            raise IOError('No answer from the gateway within the timeout ({} s): {!r}'.format(timeout, self.request))
+        fields = self._answer.split(None, 1)
+        if not fields or fields[0] != 'OK':
+            raise IOError('The gateway reports an error for {!r}: {}'.format(
+                self.request, fields[1] if len(fields) > 1 else self._answer))
+        if len(fields) > 1:
+            height, angle = fields[1].split()
+            return int(height), int(angle)
+
+    def _finish(self, answer):
+        self._answer = answer
+        self._event.set()
+
+
+class GatewayClient():
+    """Connection to a :class:`GatewayServer`.
+
+    Args:
+        * address (tuple or str): A (host, port) tuple for TCP, or a path for a Unix socket.
+        * timeout (float or None): Default time in seconds to wait for an answer.
+
+    The client is thread safe, and any number of requests may be outstanding.
+
+    """
+
+    def __init__(self, address, timeout=5.0):
+        self.address = address
+        """The socket address of the gateway (tuple or str)."""
+
+        self.timeout = timeout
+        """Default time in seconds to wait for an answer (float or None)."""
+
+        self._connection = _createSocket(address)
+        self._connection.connect(address)
+        if isinstance(address, tuple):
+            self._connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._nextId = 0
+
+        self._reader = threading.Thread(target=self._read, name='tacos2-gateway-reader')
+        self._reader.daemon = True
+        self._reader.start()
+
+    def __repr__(self):
+        """String representation of the :class:`.GatewayClient` object."""
+        return "{}.{}<id=0x{:x}, address={!r}, pending={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.address,
+            len(self._pending),
+            )
+
+    def instrument(self, port):
+        """Return a :class:`RemoteInstrument` for a serial port of the gateway."""
+        return RemoteInstrument(self, port)
+
+    def request(self, command, port, *arguments):
+        """Send a request without waiting for the answer.
+
+        Args:
+            * command (str): SET, STOP or GET.
+            * port (str): The serial port name on the gateway.
+            * arguments (int): das, dae, height and angle, as far as needed by the command.
+
+        Returns:
+            A :class:`GatewayReply`.
+
+        """
+        line = ' '.join([command, port] + [str(argument) for argument in arguments])
+        reply = GatewayReply(line)
+        with self._lock:
+            if self._connection is None:
+                raise IOError('The connection to the gateway {!r} is closed'.format(self.address))
+            self._nextId += 1
+            requestId = str(self._nextId)
+            self._pending[requestId] = reply
+            self._connection.sendall('{} {}\n'.format(requestId, line).encode('latin1'))
+        return reply
+
+    def requestMany(self, requests):
+        """Send several requests in one write, without waiting for the answers.
+
+        Args:
+            requests (iterable of tuple): (command, port, arguments...) for each request.
+
+        Returns:
+            A list of :class:`GatewayReply`.
+
+        """
+        replies = []
+        lines = []
+        with self._lock:
+            if self._connection is None:
+                raise IOError('The connection to the gateway {!r} is closed'.format(self.address))
+            for request in requests:
+                line = ' '.join([request[0], request[1]] + [str(argument) for argument in request[2:]])
+                reply = GatewayReply(line)
+                self._nextId += 1
+                self._pending[str(self._nextId)] = reply
+                lines.append('{} {}\n'.format(self._nextId, line))
+                replies.append(reply)
+            self._connection.sendall(''.join(lines).encode('latin1'))
+        return replies
+
+    def close(self):
+        """Close the connection. Outstanding requests fail with IOError."""
+        with self._lock:
+            connection, self._connection = self._connection, None
+        if connection is not None:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except EnvironmentError:
+                pass
+            connection.close()
+        self._reader.join()
+
+    def _read(self):
+        for line in _readLines(self._connection):
+            fields = line.split(None, 1)
+            if not fields:
+                continue
+            with self._lock:
+                reply = self._pending.pop(fields[0], None)
+            if reply is not None:
+                reply._finish(fields[1] if len(fields) > 1 else '')
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._connection = None
+        for reply in pending.values():
+            reply._finish('ERR connection to the gateway lost')
+
+
+class RemoteInstrument():
+    """A serial port of a :class:`GatewayServer`, with the same methods as :class:`tacos2.Instrument`.
+
+    Args:
+        * client (:class:`GatewayClient`): The connection to the gateway.
+        * port (str): The serial port name on the gateway.
+
+    The nowait methods return a :class:`GatewayReply` instead of a :class:`tacos2.FrameFuture`,
+    with the same :meth:`~GatewayReply.done` and :meth:`~GatewayReply.result` methods.
+    The deadline and priority arguments are accepted for compatibility, but the requests are
+    scheduled by the gateway.
+
+    """
+
+    def __init__(self, client, port):
+        self.client = client
+        self.port = port
+
+    def __repr__(self):
+        """String representation of the :class:`.RemoteInstrument` object."""
+        return "{}.{}<id=0x{:x}, port={!r}, client={!r}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.port,
+            self.client,
+            )
+
+    def stop(self, das, dae, deadline=None):
+        """Stop the blinds das to dae. See :meth:`tacos2.Instrument.stop`."""
+        self.stopNowait(das, dae).result(self.client.timeout)
+
+    def set(self, das, dae, height=255, angle=255, deadline=None):
+        """Set height and angle of the blinds das to dae. See :meth:`tacos2.Instrument.set`."""
+        self.setNowait(das, dae, height, angle).result(self.client.timeout)
+
+    def get(self, das, deadline=None, priority=None):
+        """Read height and angle of a blind. See :meth:`tacos2.Instrument.get`."""
+        _checkAddress(das, das)
+        height, angle = self.client.request('GET', self.port, das).result(self.client.timeout)
+        return chr(height), chr(angle)
+
+    def stopNowait(self, das, dae, deadline=None):
+        """Send a STOP request without waiting for it to be written."""
+        _checkAddress(das, dae)
+        return self.client.request('STOP', self.port, das, dae)
+
+    def setNowait(self, das, dae, height=255, angle=255, deadline=None):
+        """Send a SET request without waiting for it to be written."""
+        _checkAddress(das, dae)
+        _checkInt(height, minvalue=0, maxvalue=255, description='height')
+        _checkInt(angle, minvalue=0, maxvalue=255, description='angle')
+        return self.client.request('SET', self.port, das, dae, height, angle)
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Historian: store the changes of the blind positions in compact columnar files, and query them.
+
+Feed it from a :class:`tacos2.Poller`, which reports only changes::
+
+    historian = tacos2.historian.Historian('/var/lib/tacos2/floor3')
+    poller.subscribe(historian.record)
+    ...
+    for timestamp, address, height, angle in historian.query(start=time.time() - 3600, das=1, dae=40):
+        print(timestamp, address, height, angle)
+
+Each change takes 7 bytes on disk, in one file per column:
+
+==========  =====================================================================
+File        Content per change
+==========  =====================================================================
+``time``    uint32: milliseconds since the base time of its block
+``address`` uint8
+``height``  uint8
+``angle``   uint8
+==========  =====================================================================
+
+The changes are grouped in blocks of :data:`BLOCK_SIZE` changes. The ``index`` file has, per block,
+the base time (int64, milliseconds since the epoch) and a bitmap of the addresses in the block.
+Queries map the files with :mod:`mmap`, skip the blocks outside the time range or without the
+requested addresses, and bisect the time column within a block.
+
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+
+from tacos2.utils import _checkAddress, _checkInt, _checkNumerical
+
+BLOCK_SIZE = 4096
+"""Maximum number of changes per block (int)."""
+
+_COLUMNS = ('time', 'address', 'height', 'angle')
+_INDEX = struct.Struct('<qQ32s')  # Base time in ms, first change, address bitmap
+_TIME = struct.Struct('<I')
+_MAXIMUM_DELTA = 0xFFFFFFFF
+
+
+def _bitmap(addresses):
+    bits = bytearray(32)
+    for address in addresses:
+        bits[address >> 3] |= 1 << (address & 7)
+    return bits
+
+
+def _addresses(bitmap):
+    return set(address for address in range(256) if bitmap[address >> 3] & (1 << (address & 7)))
+
+
+class Historian():
+    """Change history of the blinds on one bus, stored in a directory.
+
+    Args:
+        directory (str): Where the column files are stored. It is created if necessary.
+
+    Changes that do not differ from the latest stored status of the address are ignored,
+    also across restarts. Timestamps never go backwards: a change older than the latest
+    stored one is stored at the time of the latest one.
+
+    Recording, flushing and queries are serialized by a lock, so a :class:`tacos2.Poller`
+    can record from its thread while other threads query.
+
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        """The directory of the column files (str)."""
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._files = dict((column, open(self._path(column), 'ab')) for column in _COLUMNS + ('index',))
+        self._blocks = []  # [base time, first change, bitmap] per block
+        self._count = 0
+        self._newest = None
+        self._latest = {}
+        self._lock = threading.Lock()  # Guards the buffers, the files and the block index
+
+        self._load()
+
+    def __repr__(self):
+        """String representation of the :class:`.Historian` object."""
+        return "{}.{}<id=0x{:x}, directory={!r}, changes={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.directory,
+            self._count,
+            )
+
+    def __len__(self):
+        return self._count
+
+    def record(self, address, height, angle, timestamp=None):
+        """Store a change. Can be used as a :meth:`tacos2.Poller.subscribe` callback.
+
+        Args:
+            * address (int): The blind address.
+            * height (int): The height, 0 to 255.
+            * angle (int): The slat angle, 0 to 255.
+            * timestamp (float or None): Time of the change in seconds since the epoch. None for now.
+
+        Returns:
+            :const:`True` if the change was stored, :const:`False` if the status was unchanged.
+
+        Raises:
+            ValueError, TypeError
+
+        """
+        _checkInt(address, minvalue=0, maxvalue=255, description='address')
+        _checkInt(height, minvalue=0, maxvalue=255, description='height')
+        _checkInt(angle, minvalue=0, maxvalue=255, description='angle')
+        if timestamp is not None:
+            _checkNumerical(timestamp, minvalue=0, description='timestamp')
+
+        milliseconds = int(round((time.time() if timestamp is None else timestamp) * 1000))
+        with self._lock:
+            return self._record(address, height, angle, milliseconds)
+
+    def flush(self):
+        """Write the buffered changes to disk, so that they are visible to queries."""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Flush and close the files."""
+        with self._lock:
+            self._flush()
+            for openFile in self._files.values():
+                openFile.close()
+
+    def latest(self, address):
+        """Return the latest stored (height, angle) of an address, or None."""
+        with self._lock:
+            return self._latest.get(address)
+
+    def query(self, start=None, end=None, das=0x00, dae=0xFF):
+        """Return the stored changes within a time range and an address range.
+
+        Args:
+            * start (float or None): First time in seconds since the epoch (inclusive). None for the beginning.
+            * end (float or None): Last time in seconds since the epoch (exclusive). None for no limit.
+            * das (int): First address.
+            * dae (int): Last address.
+
+        Returns:
+            A list of (timestamp, address, height, angle) in time order, with the timestamp in seconds (float).
+
+        """
+        _checkAddress(das, dae)
+        with self._lock:
+            return self._query(start, end, das, dae)
+
+    def _query(self, start, end, das, dae):
+        self._flush()
+        if not self._count:
+            return []
+
+        startMs = None if start is None else int(round(start * 1000))
+        endMs = None if end is None else int(round(end * 1000))
+        wanted = _bitmap(range(das, dae + 1))
+        allAddresses = das == 0x00 and dae == 0xFF
+
+        columns = self._mapColumns()
+        try:
+            bases = [block[0] for block in self._blocks]
+            first = 0 if startMs is None else max(0, bisect.bisect_right(bases, startMs) - 1)
+            result = []
+            for number in range(first, len(self._blocks)):
+                base, firstChange, bitmap = self._blocks[number]
+                if endMs is not None and base >= endMs:
+                    break
+                if not any(bitmap[i] & wanted[i] for i in range(32)):
+                    continue
+                changes = self._blockRange(number)
+                result.extend(_queryBlock(columns, base, changes, startMs, endMs, das, dae, allAddresses))
+            return result
+        finally:
+            for mapped in columns.values():
+                mapped.close()
+
+    def _record(self, address, height, angle, milliseconds):
+        if self._latest.get(address) == (height, angle):
+            return False
+        self._latest[address] = (height, angle)
+
+        if self._newest is not None:
+            milliseconds = max(milliseconds, self._newest)
+        self._newest = milliseconds
+
+        if not self._blocks or self._count - self._blocks[-1][1] >= BLOCK_SIZE or \
+                milliseconds - self._blocks[-1][0] > _MAXIMUM_DELTA:
+            self._startBlock(milliseconds)
+
+        block = self._blocks[-1]
+        values = [_TIME.pack(milliseconds - block[0])] + [struct.pack('<B', value) for value in (address, height, angle)]
+        for column, value in zip(_COLUMNS, values):
+            self._files[column].write(value)
+        block[2][address >> 3] |= 1 << (address & 7)
+        self._count += 1
+        return True
+
+    def _flush(self):
+        for column in _COLUMNS + ('index',):
+            self._files[column].flush()
+        self._writeIndexEntry()
+
+    def _blockRange(self, number):
+        last = self._count if number + 1 == len(self._blocks) else self._blocks[number + 1][1]
+        return self._blocks[number][1], last
+
+    def _path(self, column):
+        return os.path.join(self.directory, column)
+
+    def _mapColumns(self):
+        columns = {}
+        for column in _COLUMNS:
+            with open(self._path(column), 'rb') as columnFile:
+                columns[column] = mmap.mmap(columnFile.fileno(), 0, access=mmap.ACCESS_READ)
+        return columns
+
+    def _startBlock(self, milliseconds):
+        self._writeIndexEntry()
+        self._blocks.append([milliseconds, self._count, bytearray(32)])
+        self._files['index'].write(_INDEX.pack(milliseconds, self._count, bytes(self._blocks[-1][2])))
+
+    def _writeIndexEntry(self):
+        """Rewrite the index entry of the latest block, with its updated address bitmap."""
+        if not self._blocks:
+            return
+        base, firstChange, bitmap = self._blocks[-1]
+        self._files['index'].flush()
+        with open(self._path('index'), 'r+b') as indexFile:
+            indexFile.seek((len(self._blocks) - 1) * _INDEX.size)
+            indexFile.write(_INDEX.pack(base, firstChange, bytes(bitmap)))
+
+    def _load(self):
+        """Read the block index, and the latest status of each address from the newest blocks containing it."""
+        with open(self._path('index'), 'rb') as indexFile:
+            index = indexFile.read()
+        for offset in range(0, len(index) - len(index) % _INDEX.size, _INDEX.size):
+            base, firstChange, bitmap = _INDEX.unpack_from(index, offset)
+            self._blocks.append([base, firstChange, bytearray(bitmap)])
+
+        self._count = min(os.path.getsize(self._path(column)) // _width(column) for column in _COLUMNS)
+        while self._blocks and self._blocks[-1][1] >= self._count:
+            self._blocks.pop()  # Started just before a crash, without any change on disk
+
+        # Cut the parts written by an interrupted record() or _startBlock(), as the files are appended
+        for column in _COLUMNS:
+            self._files[column].truncate(self._count * _width(column))
+        self._files['index'].truncate(len(self._blocks) * _INDEX.size)
+        if not self._count or not self._blocks:
+            return
+
+        columns = self._mapColumns()
+        try:
+            self._newest = self._blocks[-1][0] + _DeltaColumn(columns['time'])[self._count - 1]
+            unresolved = set(range(256))
+            for number in range(len(self._blocks) - 1, -1, -1):
+                base, firstChange, bitmap = self._blocks[number]
+                if not unresolved & _addresses(bitmap):
+                    continue
+                changes = self._blockRange(number)
+                for timestamp, address, height, angle in reversed(
+                        _queryBlock(columns, base, changes, None, None, 0x00, 0xFF, True)):
+                    if address in unresolved:
+                        unresolved.discard(address)
+                        self._latest[address] = (height, angle)
+                if not unresolved:
+                    break
+        finally:
+            for mapped in columns.values():
+                mapped.close()
+
+
+def _width(column):
+    """Return the size in bytes of one change in a column file."""
+    return _TIME.size if column == 'time' else 1
+
+
+def _queryBlock(columns, base, changes, startMs, endMs, das, dae, allAddresses):
+    first, last = changes
+    deltas = _DeltaColumn(columns['time'])
+
+    low = first if startMs is None or startMs <= base else bisect.bisect_left(deltas, startMs - base, first, last)
+    high = last if endMs is None else bisect.bisect_left(deltas, endMs - base, low, last)
+
+    addresses = bytearray(columns['address'][low:high])
+    heights = bytearray(columns['height'][low:high])
+    angles = bytearray(columns['angle'][low:high])
+    result = []
+    for offset in range(high - low):
+        address = addresses[offset]
+        if allAddresses or das <= address <= dae:
+            timestamp = (base + deltas[low + offset]) / 1000.0
+            result.append((timestamp, address, heights[offset], angles[offset]))
+    return result
+
+
+class _DeltaColumn():
+    """The time column as a sequence of int, for :mod:`bisect`."""
+
+    def __init__(self, mapped):
+        self._mapped = mapped
+
+    def __getitem__(self, position):
+        return _TIME.unpack_from(self._mapped, position * _TIME.size)[0]
+
+    def __len__(self):
+        return len(self._mapped) // _TIME.size
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Status polling with change notifications.
+
+Errors in the subscriber callbacks, and unexpected errors during a sweep in the background
+thread, are logged with the ``tacos2.polling`` logger, and polling goes on.
+
+"""
+
+import logging
+import threading
+
+from tacos2.scheduler import PRIORITY_BACKGROUND
+from tacos2.timing import _SECONDS_TO_NANOSECONDS, _now_ns
+from tacos2.utils import _checkAddress, _checkNumerical
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Poller():
+    """Poll the blind status of a range of addresses, and notify subscribers about changes.
+
+    Args:
+        * instrument (:class:`.Instrument`): The instrument used for sending the GET commands.
+        * das (destination address start): First address to poll.
+        * dae (destination address end): Last address to poll.
+        * interval (float): Time in seconds between the start of two sweeps, when running in the background.
+        * addresses (iterable of int or None): Only poll these addresses within the range, for example
+          the topology found by :class:`tacos2.discovery.Discovery`. Use None to poll all addresses in the range.
+
+    The GET commands have :data:`tacos2.PRIORITY_BACKGROUND`, so other commands on the bus go first.
+
+    The latest known height and angle of each responding address is kept in :attr:`status`.
+    Subscribers are only called when the height or angle of an address has changed
+    since the previous sweep, so consumers do not need to compare successive results themselves.
+
+    """
+
+    def __init__(self, instrument, das=0x01, dae=0xFF, interval=1.0, addresses=None):
+        _checkAddress(das, dae)
+        _checkNumerical(interval, minvalue=0, description='interval')
+
+        self.instrument = instrument
+        """The :class:`.Instrument` used for polling."""
+
+        if addresses is None:
+            addresses = range(das, dae + 1)
+
+        self.addresses = sorted(set(address for address in addresses if das <= address <= dae))
+        """The addresses that are polled in each sweep (list of int)."""
+
+        self.interval = interval
+        """Time in seconds between the start of two sweeps in the background thread."""
+
+        self.status = {}
+        """Latest known status, as a dict of address: (height, angle). Height and angle are integers."""
+
+        self.failed = set()
+        """Addresses that did not answer during the latest sweep."""
+
+        self.latencies = {}
+        """Roundtrip time in seconds (float) of the latest answered GET, as a dict of address: latency."""
+
+        self._subscribers = {}
+        self._nextToken = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopEvent = threading.Event()
+
+    def subscribe(self, callback, das=0x00, dae=0xFF):
+        """Register a callback for status changes.
+
+        Args:
+            * callback (callable): Called as ``callback(address, height, angle)`` for each change.
+            * das (destination address start): First address of interest.
+            * dae (destination address end): Last address of interest.
+
+        Returns:
+            A token (int) that can be given to :meth:`unsubscribe`.
+
+        Raises:
+            ValueError, TypeError
+
+        The callback is called from the polling thread (or from the thread calling :meth:`poll`).
+        An exception raised by the callback is logged, and does not affect the other subscribers.
+
+        """
+        if not callable(callback):
+            raise TypeError('The callback must be callable. Given: {0!r}'.format(callback))
+        _checkAddress(das, dae)
+
+        with self._lock:
+            token = self._nextToken
+            self._nextToken += 1
+            self._subscribers[token] = (callback, das, dae)
+        return token
+
+    def unsubscribe(self, token):
+        """Remove a callback registered with :meth:`subscribe`.
+
+        Raises:
+            KeyError if the token is unknown.
+
+        """
+        with self._lock:
+            del self._subscribers[token]
+
+    def poll(self):
+        """Run one sweep over all addresses, and notify subscribers about changes.
+
+        Returns:
+            The changes found in this sweep, as a dict of address: (height, angle).
+
+        Addresses that do not answer keep their previous status, and are listed in :attr:`failed`.
+
+        """
+        changes = {}
+        failed = set()
+
+        for address in self.addresses:
+            startTime = _now_ns()
+            try:
+                height, angle = self.instrument.get(address, priority=PRIORITY_BACKGROUND)
+            except (IOError, ValueError):
+                failed.add(address)
+                continue
+            self.latencies[address] = float(_now_ns() - startTime) / _SECONDS_TO_NANOSECONDS
+
+            newStatus = (ord(height), ord(angle))
+            if self.status.get(address) != newStatus:
+                self.status[address] = newStatus
+                changes[address] = newStatus
+
+        self.failed = failed
+        if changes:
+            self._notify(changes)
+        return changes
+
+    def start(self):
+        """Start polling in a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name='tacos2-poller')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread, and wait for the ongoing sweep to finish."""
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopEvent.is_set():
+            startTime = _now_ns()
+            try:
+                self.poll()
+            except Exception:
+                _LOGGER.exception('Polling sweep failed for %r, polling goes on', self.instrument)
+            elapsed = float(_now_ns() - startTime) / _SECONDS_TO_NANOSECONDS
+            self._stopEvent.wait(max(0, self.interval - elapsed))
+
+    def _notify(self, changes):
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+
+        for address in sorted(changes):
+            height, angle = changes[address]
+            for callback, das, dae in subscribers:
+                if das <= address <= dae:
+                    try:
+                        callback(address, height, angle)
+                    except Exception:
+                        _LOGGER.exception('Subscriber %r failed for the address %d', callback, address)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Profiling hooks for the phases of a command.
+
+A hook is an object with the methods ``enter(phase, timestamp, instrument)`` and
+``exit(phase, timestamp, instrument)``, called at the start and end of each phase.
+The timestamps are in nanoseconds, from :func:`tacos2.timing._now_ns` (``time.perf_counter_ns``
+where available). Without hooks the phases cost only a check of an empty list.
+
+The :class:`Profiler` aggregates the phase times::
+
+    with tacos2.profiling.Profiler() as profiler:
+        for _ in range(100):
+            instrument.get(1)
+    print(profiler.report())
+
+==================  ==========================================================================
+Phase               Time spent
+==================  ==========================================================================
+``command``         The whole command, in :meth:`tacos2.Instrument._genericCommand`
+``encode``          Building the request frame
+``schedule``        Waiting for the bus, see :mod:`tacos2.scheduler`
+``silent_period``   Waiting for the silent period before the request
+``write``           Writing the request to the port
+``echo``            Reading the local echo of the request
+``response``        Waiting for and reading the response of the slave
+``extract``         Extracting the payload of the response
+``check``           Checking the response and parsing height and angle
+==================  ==========================================================================
+
+Phases can end with an exception, for example ``response`` on a timeout. Their exit is still called.
+
+"""
+
+import threading
+
+from tacos2.timing import _SECONDS_TO_NANOSECONDS, _now_ns
+
+PHASES = ('command', 'encode', 'schedule', 'silent_period', 'write', 'echo', 'response', 'extract', 'check')
+"""The phases of a command, in order (tuple of str)."""
+
+_HOOKS = []  # Registered hooks. Replaced, not modified, so that it can be iterated without a lock.
+_HOOKS_LOCK = threading.Lock()
+
+
+def addHook(hook):
+    """Register a hook, called for the phases of the commands of all instruments.
+
+    Args:
+        hook: An object with the methods ``enter(phase, timestamp, instrument)`` and
+            ``exit(phase, timestamp, instrument)``.
+
+    """
+    global _HOOKS
+    with _HOOKS_LOCK:
+        _HOOKS = _HOOKS + [hook]
+
+
+def removeHook(hook):
+    """Unregister a hook registered with :func:`addHook`."""
+    global _HOOKS
+    with _HOOKS_LOCK:
+        _HOOKS = [registered for registered in _HOOKS if registered is not hook]
+
+
+def _enter(phase, instrument):
+    hooks = _HOOKS
+    if hooks:
+        timestamp = _now_ns()
+        for hook in hooks:
+            hook.enter(phase, timestamp, instrument)
+
+
+def _exit(phase, instrument):
+    hooks = _HOOKS
+    if hooks:
+        timestamp = _now_ns()
+        for hook in hooks:
+            hook.exit(phase, timestamp, instrument)
+
+
+class _Phase():
+    """Context manager calling the hooks at the start and end of a phase."""
+
+    def __init__(self, phase, instrument):
+        self.phase = phase
+        self.instrument = instrument
+
+    def __enter__(self):
+        _enter(self.phase, self.instrument)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _exit(self.phase, self.instrument)
+        return False
+
+
+class _NoPhase():
+    """Context manager doing nothing, used when no hooks are registered."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NO_PHASE = _NoPhase()
+
+
+def _phase(phase, instrument):
+    """Return a context manager for a phase of a command of the instrument."""
+    if _HOOKS:
+        return _Phase(phase, instrument)
+    return _NO_PHASE
+
+
+class Profiler():
+    """Hook aggregating the time spent in each phase.
+
+    Args:
+        instrument (:class:`tacos2.Instrument` or None): Only profile the commands of this instrument.
+            None for all instruments.
+
+    Use it as a context manager, or call :meth:`start` and :meth:`stop`. Thread safe: the phases
+    are timed per thread.
+
+    """
+
+    def __init__(self, instrument=None):
+        self.instrument = instrument
+        """The profiled instrument, or None for all (:class:`tacos2.Instrument`)."""
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._totals = {}  # Phase: [count, total ns, maximum ns]
+
+    def __repr__(self):
+        """String representation of the :class:`.Profiler` object."""
+        return "{}.{}<id=0x{:x}, commands={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self._totals.get('command', [0])[0],
+            )
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def start(self):
+        """Start profiling."""
+        addHook(self)
+
+    def stop(self):
+        """Stop profiling. The collected times are kept."""
+        removeHook(self)
+
+    def reset(self):
+        """Clear the collected times."""
+        with self._lock:
+            self._totals = {}
+
+    def enter(self, phase, timestamp, instrument):
+        """Called by the instrument at the start of a phase."""
+        if self.instrument is None or instrument is self.instrument:
+            if not hasattr(self._local, 'started'):
+                self._local.started = {}
+            self._local.started[phase] = timestamp
+
+    def exit(self, phase, timestamp, instrument):
+        """Called by the instrument at the end of a phase."""
+        if self.instrument is not None and instrument is not self.instrument:
+            return
+        started = getattr(self._local, 'started', {}).pop(phase, None)
+        if started is None:
+            return
+        duration = timestamp - started
+        with self._lock:
+            totals = self._totals.setdefault(phase, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] = max(totals[2], duration)
+
+    def report(self):
+        """Return the time per phase.
+
+        Returns:
+            A dict with a dict per phase that occurred: ``count``, and ``total``, ``mean`` and ``max``
+            in seconds. The ``share`` is the fraction of the total ``command`` time, when known.
+
+        """
+        with self._lock:
+            totals = dict((phase, list(values)) for phase, values in self._totals.items())
+        commandTime = totals.get('command', [0, 0, 0])[1]
+
+        report = {}
+        for phase, (count, total, maximum) in totals.items():
+            report[phase] = {
+                'count': count,
+                'total': float(total) / _SECONDS_TO_NANOSECONDS,
+                'mean': float(total) / count / _SECONDS_TO_NANOSECONDS,
+                'max': float(maximum) / _SECONDS_TO_NANOSECONDS,
+                'share': float(total) / commandTime if commandTime else None,
+                }
+        return report
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Bounded command queues per bus, with a policy for overload, and their metrics.
+
+When commands arrive faster than the bus can carry them, an unbounded queue only turns
+into growing memory use and minutes of stale commands. The queues of a bus (the write queue
+of the ``*Nowait`` methods, and the GET queue of a :class:`tacos2.gateway.GatewayServer`)
+hold at most ``queue_limit`` commands, see :class:`tacos2.config.BusConfig`. When a queue is full:
+
+=======================  =====================================================================
+Policy                   A new command
+=======================  =====================================================================
+``'block'``              waits until there is room.
+``'drop_oldest_get'``    drops the oldest queued GET, which fails with :class:`.QueueFullError`.
+                         Without a queued GET the new command is rejected.
+``'coalesce'``           replaces a queued command of the same kind for the same addresses,
+                         if no overlapping SET or STOP was queued after it, even when the queue
+                         is not full. Both complete with the result of the newer one.
+                         Otherwise it waits until there is room.
+``'reject'``             fails at once with :class:`.QueueFullError`.
+=======================  =====================================================================
+
+The queue depth and the time the commands waited are counted per queue::
+
+    print(tacos2.queues.queueMetrics('/dev/ttyUSB0'))
+
+"""
+
+import collections
+import threading
+
+from tacos2.errors import QueueFullError
+from tacos2.timing import _SECONDS_TO_NANOSECONDS, _now_ns
+
+POLICY_BLOCK = 'block'
+POLICY_DROP_OLDEST_GET = 'drop_oldest_get'
+POLICY_COALESCE = 'coalesce'
+POLICY_REJECT = 'reject'
+
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST_GET, POLICY_COALESCE, POLICY_REJECT)
+"""The queue policies (tuple of str)."""
+
+_QUEUE_SETTINGS = {}  # (limit, policy) per port, see tacos2.config.BusConfig
+_METRICS = {}  # Dict of queue name: QueueMetrics, per port
+_METRICS_LOCK = threading.Lock()
+
+
+def _queueSettings(port):
+    """Return the (limit, policy) of the queues of a port. A limit of None means unbounded."""
+    return _QUEUE_SETTINGS.get(port, (None, POLICY_BLOCK))
+
+
+def _isFull(depth, port):
+    """Check whether a queue of the port with *depth* commands is full."""
+    limit = _queueSettings(port)[0]
+    return limit is not None and depth >= limit
+
+
+def _coalesceIndex(entries, kind, key):
+    """Find the queued entry a new command may replace, under the ``'coalesce'`` policy.
+
+    Args:
+        * entries (list): The queued entries, oldest first, as (kind, key) tuples. The key is the (das, dae) range.
+          Any kind other than ``'GET'`` writes to the blinds.
+        * kind (str): The command of the new entry, for example ``'GET'``, ``'SET'`` or ``'STOP'``.
+        * key (tuple): The (das, dae) of the new entry.
+
+    Returns:
+        The index (int) of the newest entry with the same kind and key, without an overlapping
+        write (SET, STOP) after it, or None.
+
+    """
+    das, dae = key
+    for index in range(len(entries) - 1, -1, -1):
+        entryKind, entryKey = entries[index]
+        if entryKind == kind and entryKey == key:
+            return index
+        if entryKind != 'GET' and entryKey[0] <= dae and das <= entryKey[1]:
+            return None
+    return None
+
+
+def _mergeSet(old, new):
+    """Merge the (height, angle) of a SET into the (height, angle) of an older SET it replaces.
+
+    255 leaves a value unchanged, so the value of the older SET is kept for it.
+    """
+    return tuple(oldValue if newValue == 255 else newValue for oldValue, newValue in zip(old, new))
+
+
+class QueueMetrics():
+    """Depth and wait times of one queue, see :func:`queueMetrics`. The times are in seconds."""
+
+    def __init__(self, port, name):
+        self.port = port
+        """The port name (str)."""
+
+        self.name = name
+        """The name of the queue (str)."""
+
+        self._lock = threading.Lock()
+        self.reset()
+
+    def __repr__(self):
+        """String representation of the :class:`.QueueMetrics` object."""
+        return "{}.{}<id=0x{:x}, port={!r}, name={!r}, depth={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.port,
+            self.name,
+            self.depth,
+            )
+
+    def reset(self):
+        """Clear the counters. The current depth is kept."""
+        with self._lock:
+            self.depth = getattr(self, 'depth', 0)
+            """Number of queued commands (int)."""
+
+            self.max_depth = self.depth
+            """The largest number of queued commands (int)."""
+
+            self.completed = 0
+            """Number of commands taken from the queue (int)."""
+
+            self.rejected = 0
+            """Number of commands rejected because the queue was full (int)."""
+
+            self.dropped = 0
+            """Number of queued GET commands dropped for newer commands (int)."""
+
+            self.coalesced = 0
+            """Number of commands merged into a queued command (int)."""
+
+            self.blocked = 0
+            """Number of commands that waited for room in the queue (int)."""
+
+            self.total_wait = 0.0
+            """Sum of the times the commands waited in the queue (float)."""
+
+            self.max_wait = 0.0
+            """The longest time a command waited in the queue (float)."""
+
+    def snapshot(self):
+        """Return the metrics as a dict."""
+        with self._lock:
+            return {
+                'port': self.port,
+                'name': self.name,
+                'depth': self.depth,
+                'max_depth': self.max_depth,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'dropped': self.dropped,
+                'coalesced': self.coalesced,
+                'blocked': self.blocked,
+                'mean_wait': self.total_wait / self.completed if self.completed else 0.0,
+                'max_wait': self.max_wait,
+                }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _queued(self):
+        with self._lock:
+            self.depth += 1
+            self.max_depth = max(self.max_depth, self.depth)
+
+    def _removed(self):
+        with self._lock:
+            self.depth -= 1
+
+    def _taken(self, queuedAt):
+        """Record that a command, queued at the :func:`tacos2.timing._now_ns` time *queuedAt*, has been taken."""
+        wait = float(_now_ns() - queuedAt) / _SECONDS_TO_NANOSECONDS
+        with self._lock:
+            self.depth -= 1
+            self.completed += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+
+def _metrics(port, name):
+    """Return the :class:`QueueMetrics` of a queue of a port, created if necessary."""
+    with _METRICS_LOCK:
+        queues = _METRICS.setdefault(port, {})
+        metrics = queues.get(name)
+        if metrics is None:
+            metrics = queues[name] = QueueMetrics(port, name)
+        return metrics
+
+
+def queueMetrics(port):
+    """Return the metrics of the queues of a port.
+
+    Args:
+        port (str): The port name.
+
+    Returns:
+        A dict of queue name: dict, see :meth:`QueueMetrics.snapshot`. The write queue is
+        named ``'writer'`` and the GET queue of a gateway ``'gateway'``.
+
+    """
+    with _METRICS_LOCK:
+        queues = dict(_METRICS.get(port, {}))
+    return dict((name, metrics.snapshot()) for name, metrics in queues.items())
+
+
+class BoundedQueue():
+    """First in, first out queue of commands, bounded according to the settings of the port.
+
+    Args:
+        * port (str): The port name. The limit and policy are taken from :func:`_queueSettings` for each command.
+        * name (str): The name of the queue in :func:`queueMetrics`.
+        * dropped (callable or None): Called as ``dropped(item, error)`` for an item dropped by ``'drop_oldest_get'``.
+        * superseded (callable or None): Called as ``superseded(old, new)`` when *new* replaces the queued *old*
+          item under ``'coalesce'``. It returns the item that stays queued. None keeps *new*.
+
+    """
+
+    def __init__(self, port, name, dropped=None, superseded=None):
+        self.port = port
+        self.metrics = _metrics(port, name)
+        """The :class:`QueueMetrics` of the queue."""
+
+        self._dropped = dropped
+        self._superseded = superseded
+        self._entries = collections.deque()  # [item, kind, key, queued at]
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, item, kind, key):
+        """Queue an item.
+
+        Args:
+            * item: The command.
+            * kind (str): ``'GET'``, ``'SET'`` or ``'STOP'``.
+            * key (tuple): The (das, dae) of the command.
+
+        Raises:
+            QueueFullError if the item is rejected.
+
+        """
+        limit, policy = _queueSettings(self.port)
+        with self._condition:
+            if policy == POLICY_COALESCE:
+                index = _coalesceIndex([(entry[1], entry[2]) for entry in self._entries], kind, key)
+                if index is not None:
+                    old = self._entries[index][0]
+                    if self._superseded is not None:
+                        item = self._superseded(old, item)
+                    self._entries[index][0] = item
+                    self.metrics._count('coalesced')
+                    return
+
+            if _isFull(len(self._entries), self.port):
+                if policy == POLICY_REJECT:
+                    self.metrics._count('rejected')
+                    raise QueueFullError('The {} queue of {} is full ({} commands)'.format(self.metrics.name, self.port, limit))
+
+                if policy == POLICY_DROP_OLDEST_GET:
+                    self._dropOldestGet(limit)
+                else:
+                    self.metrics._count('blocked')
+                    while _isFull(len(self._entries), self.port):
+                        self._condition.wait()
+
+            self._entries.append([item, kind, key, _now_ns()])
+            self.metrics._queued()
+            self._condition.notify_all()
+
+    def get(self):
+        """Take the oldest item, waiting for one if necessary."""
+        with self._condition:
+            while not self._entries:
+                self._condition.wait()
+            item, _, _, queuedAt = self._entries.popleft()
+            self.metrics._taken(queuedAt)
+            self._condition.notify_all()
+            return item
+
+    def _dropOldestGet(self, limit):
+        for entry in self._entries:
+            if entry[1] == 'GET':
+                self._entries.remove(entry)
+                self.metrics._removed()
+                self.metrics._count('dropped')
+                if self._dropped is not None:
+                    self._dropped(entry[0], QueueFullError(
+                        'Dropped from the full {} queue of {} for a newer command'.format(self.metrics.name, self.port)))
+                return
+        self.metrics._count('rejected')
+        raise QueueFullError('The {} queue of {} is full ({} commands), without a GET to drop'.format(
+            self.metrics.name, self.port, limit))
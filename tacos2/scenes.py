@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Scenes: named target states for many blinds, compiled to a minimal sequence of SET frames.
+
+Example::
+
+    scenes = tacos2.scenes.SceneRegistry(topology=tacos2.discovery.loadTopology('/dev/ttyUSB0'))
+    scenes.define('meeting', dict((address, (20, 80)) for address in range(1, 21)))
+    scenes.activate(instrument, 'meeting').result()
+
+Addresses with the same target are grouped into DAS..DAE ranges, as the :class:`tacos2.zones.Zone`
+of each target. When the topology of the bus is known, ranges may also span empty addresses.
+The frames of each scene are encoded once and cached like those of :class:`tacos2.zones.ZoneRegistry`,
+so activating a scene only queues a burst of ready-made frames.
+
+"""
+
+import json
+
+from tacos2.codec import SET
+from tacos2.utils import _checkInt
+from tacos2.zones import Zone, _PlanRegistry
+
+
+class SceneRegistry(_PlanRegistry):
+    """Registry of named scenes.
+
+    Args:
+        topology (iterable of int or None): The addresses that have blinds, for example from
+            :func:`tacos2.discovery.loadTopology`. Other addresses may be included in the
+            ranges of the compiled frames. Use None if the topology is unknown.
+
+    """
+
+    def __init__(self, topology=None):
+        self._scenes = {}
+        _PlanRegistry.__init__(self, topology)
+
+    def __repr__(self):
+        """String representation of the :class:`.SceneRegistry` object."""
+        return "{}.{}<id=0x{:x}, scenes={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.names(),
+            )
+
+    def define(self, name, targets):
+        """Define (or replace) a scene.
+
+        Args:
+            * name (str): The scene name, for example ``'sun protection south'``.
+            * targets (dict): Target state as address: (height, angle). Use 255 to leave
+              the height or angle of an address unchanged.
+
+        Raises:
+            ValueError, TypeError
+
+        """
+        scene = {}
+        for address, (height, angle) in targets.items():
+            _checkInt(address, minvalue=0x00, maxvalue=0xFF, description='address')
+            _checkInt(height, minvalue=0, maxvalue=255, description='height')
+            _checkInt(angle, minvalue=0, maxvalue=255, description='angle')
+            scene[address] = (height, angle)
+
+        with self._lock:
+            self._scenes[name] = scene
+            self._forget(name)
+
+    def remove(self, name):
+        """Remove a scene.
+
+        Raises:
+            KeyError if the scene is unknown.
+
+        """
+        with self._lock:
+            del self._scenes[name]
+            self._forget(name)
+
+    def names(self):
+        """Return the scene names (sorted list of str)."""
+        with self._lock:
+            return sorted(self._scenes)
+
+    def targets(self, name):
+        """Return a copy of the targets of a scene, as a dict of address: (height, angle)."""
+        with self._lock:
+            return dict(self._scenes[name])
+
+    def ranges(self, name):
+        """Return the ranges of a scene, as a list of (das, dae, height, angle).
+
+        Raises:
+            KeyError if the scene is unknown.
+
+        """
+        with self._lock:
+            return _planRanges(self._scenes[name], self._bridgeable)
+
+    def compile(self, name, devicetype=0x00, sourceaddress=0x00):
+        """Return the encoded SET frames of a scene.
+
+        Args:
+            * name (str): The scene name.
+            * devicetype (int): Source device type of the master.
+            * sourceaddress (int): Source address of the master.
+
+        Returns:
+            The raw frames (list of str, or bytes for Python3). The list is cached; do not modify it.
+
+        Raises:
+            KeyError if the scene is unknown.
+
+        """
+        key = (name, devicetype, sourceaddress)
+        with self._lock:
+            targets = self._scenes[name]
+            return self._cachedFrames(key, lambda: [(das, dae, SET, height, angle)
+                for das, dae, height, angle in _planRanges(targets, self._bridgeable)], devicetype, sourceaddress)
+
+    def activate(self, instrument, name):
+        """Activate a scene.
+
+        Args:
+            * instrument (:class:`tacos2.Instrument`): The instrument for the bus.
+            * name (str): The scene name.
+
+        Returns:
+            A :class:`tacos2.FrameFuture`, completed when all frames have been written.
+
+        Raises:
+            KeyError if the scene is unknown.
+
+        The frames are queued as one burst in the write queue of the serial port, without
+        blocking the caller.
+
+        """
+        return instrument._genericBurstNowait(self.compile(name, instrument.sax, instrument.sa))
+
+    def save(self, path):
+        """Store all scenes in a JSON file."""
+        with self._lock:
+            data = dict((name, dict((str(address), list(target)) for address, target in scene.items()))
+                        for name, scene in self._scenes.items())
+        with open(path, 'w') as sceneFile:
+            json.dump(data, sceneFile, indent=2, sort_keys=True)
+
+    def load(self, path):
+        """Define the scenes stored in a JSON file by :meth:`save`. Existing scenes with the same names are replaced."""
+        with open(path) as sceneFile:
+            data = json.load(sceneFile)
+        for name, targets in data.items():
+            self.define(name, dict((int(address), tuple(target)) for address, target in targets.items()))
+
+
+def _planRanges(targets, bridgeable=None):
+    """Group addresses with the same target into ranges.
+
+    Args:
+        * targets (dict): Target state as address: (height, angle).
+        * bridgeable (:class:`tacos2.zones.Zone` or None): Addresses without blinds, which may be included in a range.
+
+    Returns:
+        A list of (das, dae, height, angle), sorted by address.
+
+    The addresses of each target are a :class:`tacos2.zones.Zone`. Its ranges may only span the
+    bridgeable addresses that are not in the scene, so the ranges of different targets never overlap.
+
+    """
+    groups = {}
+    for address, target in targets.items():
+        groups.setdefault(target, []).append(address)
+
+    gaps = Zone() if bridgeable is None else bridgeable - Zone(targets)
+    return sorted((das, dae) + target for target, addresses in groups.items()
+                  for das, dae in Zone(addresses).ranges(gaps))
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Per-bus scheduling of the transactions by priority and deadline.
+
+Each transaction (one frame, or a GET request with its response) gets the bus from the
+:class:`BusScheduler` of the port. When the bus is released, the waiting transaction with the
+highest priority goes next, so a STOP waits at most for the frame on the bus, also during a
+polling sweep. Within a priority, the earliest deadline goes first, then the oldest.
+
+A transaction that has not got the bus before its deadline is dropped with
+:class:`tacos2.errors.DeadlineExpiredError`, instead of being sent late::
+
+    instrument.set(1, 40, 50, 80, deadline=0.5)  # Give up if the bus is busy for more than 0.5 s
+
+"""
+
+import heapq
+import itertools
+import threading
+
+from tacos2.errors import DeadlineExpiredError
+from tacos2.timing import _SECONDS_TO_NANOSECONDS, _now_ns
+
+PRIORITY_STOP = 0
+"""Priority of STOP commands (int). Lower values go first."""
+
+PRIORITY_SET = 1
+"""Priority of SET commands (int)."""
+
+PRIORITY_GET = 2
+"""Priority of GET commands (int)."""
+
+PRIORITY_BACKGROUND = 3
+"""Priority of background work, like the GET commands of a :class:`tacos2.Poller` (int)."""
+
+_NO_DEADLINE = float('inf')
+
+
+def _absoluteDeadline(deadline):
+    """Convert a deadline in seconds from now (float or None) to a :func:`tacos2.timing._now_ns` time (int or None)."""
+    if deadline is None:
+        return None
+    return _now_ns() + int(deadline * _SECONDS_TO_NANOSECONDS)
+
+
+class BusScheduler():
+    """Give the bus of a port to one transaction at a time, by priority and deadline.
+
+    Args:
+        port (str): The serial port name.
+
+    The scheduler is reentrant: a thread holding the bus can acquire it again.
+
+    """
+
+    def __init__(self, port):
+        self.port = port
+        """The serial port name (str)."""
+
+        self.expired = 0
+        """The number of transactions dropped because of their deadline (int)."""
+
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._owner = None
+        self._depth = 0
+
+    def __repr__(self):
+        """String representation of the :class:`.BusScheduler` object."""
+        return "{}.{}<id=0x{:x}, port={!r}, busy={}, waiting={}, expired={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.port,
+            self._owner is not None,
+            len(self._waiting),
+            self.expired,
+            )
+
+    def acquire(self, priority=PRIORITY_GET, deadline=None):
+        """Wait until the bus is free, and no transaction with a higher priority is waiting.
+
+        Args:
+            * priority (int): One of the PRIORITY constants.
+            * deadline (int or None): Latest start time, see :func:`tacos2.timing._now_ns`. None for no deadline.
+
+        Raises:
+            DeadlineExpiredError if the bus could not be acquired before the deadline.
+
+        """
+        me = threading.current_thread()
+        with self._condition:
+            if self._owner is me:
+                self._depth += 1
+                return
+
+            entry = (priority, _NO_DEADLINE if deadline is None else deadline, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    if deadline is not None and _now_ns() >= deadline:
+                        self.expired += 1
+                        raise DeadlineExpiredError('The deadline expired while waiting for the bus on {}'.format(self.port))
+                    if self._owner is None and self._waiting[0] is entry:
+                        break
+                    if deadline is None:
+                        self._condition.wait()
+                    else:
+                        self._condition.wait(float(deadline - _now_ns()) / _SECONDS_TO_NANOSECONDS)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+                raise
+
+            heapq.heappop(self._waiting)
+            self._owner = me
+            self._depth = 1
+
+    def release(self):
+        """Release the bus, and let the next transaction go."""
+        with self._condition:
+            self._depth -= 1
+            if self._depth == 0:
+                self._owner = None
+                self._condition.notify_all()
+
+    def transaction(self, priority=PRIORITY_GET, deadline=None):
+        """Return a context manager holding the bus, see :meth:`acquire`."""
+        return _Transaction(self, priority, deadline)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class _Transaction():
+
+    def __init__(self, scheduler, priority, deadline):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.deadline = deadline
+
+    def __enter__(self):
+        self.scheduler.acquire(self.priority, self.deadline)
+        return self.scheduler
+
+    def __exit__(self, *exc_info):
+        self.scheduler.release()
@@ -0,0 +1,644 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Serial port management: sharing, write queues and recovery after port failures.
+
+This module imports pySerial, and is loaded on first use by :class:`tacos2.Instrument`.
+
+"""
+
+import heapq
+import itertools
+import os
+import serial
+import sys
+import threading
+import time
+
+import tacos2
+from tacos2 import capacity as _capacity
+from tacos2 import correlation
+from tacos2 import queues
+from tacos2.codec import SET, STOP, _FRAME_START, _checkFrame, _embedPayload, _frameLength
+from tacos2.errors import FrameError, NoAnswerError, NoiseError, QueueFullError, TruncatedFrameError
+from tacos2.futures import FrameFuture
+from tacos2.scheduler import PRIORITY_SET, PRIORITY_STOP
+from tacos2.timing import _SECONDS_TO_NANOSECONDS, _calculate_frame_time, _markBusIdle, _now_ns, _portBitsPerCharacter, \
+    _silentPeriod, _waitForSilentPeriod
+from tacos2.transports import MemoryTransport, SocketTransport, _splitUrl
+from tacos2.utils import _hexlify, _print_out
+
+# Several instrument instances can share the same serialport
+_SERIALPORTS = {}
+_SCHEDULERS = {}  # tacos2.scheduler.BusScheduler per port
+_PORTWRITERS = {}
+_PORTWRITERS_LOCK = threading.Lock()
+
+# Whether the adaptor on each port echoes the transmitted data, when detected automatically
+_LOCAL_ECHO = {}
+
+_ECHO_LATENCY = 0.01
+"""Time in seconds an adaptor may take, on top of the frame time, to return the local echo (float)."""
+
+
+class _PortWriter(threading.Thread):
+    """Background writer for frames that have no response (SET and STOP).
+
+    Args:
+        serialport: The serial port object (as defined by the pySerial module).
+
+    There is one writer per serial port. STOP frames are written before SET frames,
+    and otherwise the frames are written in the order they were queued. Instead of letting
+    the caller sleep, the writer thread schedules each frame at the end of the silent
+    period, based on the time of the latest bus activity in :data:`tacos2.timing._LATEST_READ_TIMES`.
+
+    As a STOP overtakes the SET frames already queued, those are trimmed to the addresses
+    outside the STOP range, so that the latest command for each address wins.
+
+    """
+
+    def __init__(self, serialport):
+        threading.Thread.__init__(self, name='tacos2-writer-{}'.format(serialport.port))
+        self.daemon = True
+        self.serial = serialport
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._busy = False
+        self._kinds = {}  # (kind, (das, dae)) of the queued jobs per sequence number, see tacos2.queues
+        self._metrics = queues._metrics(serialport.port, 'writer')
+
+    def submit(self, frame, instrument, deadline=None):
+        """Queue a frame for writing.
+
+        Args:
+            * frame (str): The raw frame.
+            * instrument (:class:`.Instrument`): Its settings (debug, local echo and port closure) are used while writing.
+            * deadline (int or None): Latest start time, see :mod:`tacos2.scheduler`.
+
+        Returns:
+            A :class:`.FrameFuture`.
+
+        """
+        return self.submitBurst([frame], instrument, deadline)
+
+    def submitBurst(self, frames, instrument, deadline=None):
+        """Queue several frames, to be written back to back.
+
+        Args:
+            * frames (list of str): The raw frames.
+            * instrument (:class:`.Instrument`): Its settings are used while writing.
+            * deadline (int or None): Latest start time, see :mod:`tacos2.scheduler`.
+
+        Returns:
+            A :class:`.FrameFuture` for the whole burst. If the deadline expires
+            before the burst could be started, it fails with :class:`tacos2.errors.DeadlineExpiredError`.
+
+        Raises:
+            :class:`tacos2.errors.QueueFullError` if the queue is full, and its policy rejects the burst.
+
+        The frames are written while holding the port, so no other command is interleaved.
+        Only the silent period is waited between the frames.
+
+        The queue holds at most the ``queue_limit`` of the port, see :mod:`tacos2.queues`. A burst
+        with a STOP is always queued, so that it can overtake the queued SET frames. As there are no
+        GET frames in this queue, the ``'drop_oldest_get'`` policy rejects the burst when the queue is full.
+        Under the ``'coalesce'`` policy, a single SET frame replaces a queued SET frame for the same addresses.
+
+        """
+        frames = list(frames)
+        future = FrameFuture(frames[0][:0].join(frames) if frames else '')
+        fieldsList = [_checkFrame(_latin1(frame)) for frame in frames]
+        stopRanges = [fields[:2] for fields in fieldsList if fields[5] == STOP]
+        priority = PRIORITY_STOP if stopRanges else PRIORITY_SET
+        port = self.serial.port
+        policy = queues._queueSettings(port)[1]
+        with self._condition:
+            for das, dae in stopRanges:
+                self.trim(das, dae)
+
+            kind = _jobKind(fieldsList)
+            if policy == queues.POLICY_COALESCE and kind is not None and kind[0] == 'SET' and \
+                    self._coalesce(kind[1], fieldsList[0], future, instrument, deadline):
+                self._metrics._count('coalesced')
+                return future
+
+            if priority != PRIORITY_STOP and queues._isFull(len(self._queue), port):
+                if policy not in (queues.POLICY_BLOCK, queues.POLICY_COALESCE):
+                    self._metrics._count('rejected')
+                    raise QueueFullError('The write queue of {} is full ({} commands)'.format(
+                        port, queues._queueSettings(port)[0]))
+                self._metrics._count('blocked')
+                while queues._isFull(len(self._queue), port):
+                    self._condition.wait()
+
+            sequence = next(self._sequence)
+            if kind is not None:
+                self._kinds[sequence] = kind
+            heapq.heappush(self._queue, (priority, sequence, [future], frames, instrument, deadline, _now_ns()))
+            self._metrics._queued()
+            self._condition.notify_all()
+        return future
+
+    def trim(self, das, dae):
+        """Trim the queued SET frames to the addresses outside das to dae, for a STOP that overtakes them."""
+        with self._condition:
+            for job in self._queue:
+                frames = _withoutRange(job[3], das, dae)
+                if frames != job[3]:
+                    job[3][:] = frames
+                    self._kinds.pop(job[1], None)
+                    kind = _jobKind([_checkFrame(_latin1(frame)) for frame in frames])
+                    if kind is not None:
+                        self._kinds[job[1]] = kind
+
+    def flush(self):
+        """Wait until all queued frames have been written."""
+        with self._condition:
+            while self._queue or self._busy:
+                self._condition.wait()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                priority, sequence, futures, frames, instrument, deadline, queuedAt = heapq.heappop(self._queue)
+                self._kinds.pop(sequence, None)
+                self._metrics._taken(queuedAt)
+                self._busy = True
+                self._condition.notify_all()
+
+            try:
+                with _SCHEDULERS[self.serial.port].transaction(priority, deadline):
+                    self._writeFrames(frames, instrument)
+            except Exception as err:
+                for future in futures:
+                    future._finish(err)
+            else:
+                for future in futures:
+                    future._finish()
+
+            with self._condition:
+                self._busy = False
+                self._condition.notify_all()
+
+    def _coalesce(self, key, fields, future, instrument, deadline):
+        """Merge a SET frame into the newest queued SET frame for the same addresses, see :func:`tacos2.queues._coalesceIndex`.
+
+        Returns:
+            :const:`True` if the frame was merged, :const:`False` if it must be queued.
+
+        """
+        sequences = sorted(self._kinds)
+        index = queues._coalesceIndex([self._kinds[sequence] for sequence in sequences], 'SET', key)
+        if index is None:
+            return False
+
+        position = [job[1] for job in self._queue].index(sequences[index])
+        priority, sequence, futures, frames, _, _, queuedAt = self._queue[position]
+        height, angle = queues._mergeSet(_checkFrame(_latin1(frames[0]))[6:8], fields[6:8])
+        frame = _embedPayload(key[0], key[1], fields[2], fields[3], fields[4], SET, height, angle)
+        if sys.version_info[0] > 2:
+            frame = bytes(frame, encoding='latin1')  # Convert types to make it Python3 compatible
+        self._queue[position] = (priority, sequence, futures + [future], [frame], instrument, deadline, queuedAt)
+        self._condition.notify_all()
+        return True
+
+    def _writeFrames(self, frames, instrument):
+        written = 0
+        replayed = False
+        while written < len(frames):
+            try:
+                self._write(frames[written], instrument)
+            except EnvironmentError as err:
+                if replayed or not _isPortFailure(err):
+                    raise
+                _reopenPort(self.serial, err, instrument.debug)
+                if not instrument.replay_after_reconnect:
+                    raise IOError('The serial port {} was disconnected and has been reopened. '.format(self.serial.port) + \
+                        'The frame was not replayed: {!r}'.format(frames[written]))
+                replayed = True
+                continue
+            written += 1
+
+        if instrument.close_port_after_each_call:
+            self.serial.close()
+
+    def _write(self, frame, instrument):
+        _waitForSilentPeriod(self.serial.port, _silentPeriod(self.serial))
+
+        if not self.serial.isOpen():
+            self.serial.open()
+
+        writeTime = _now_ns()
+        self.serial.write(frame)
+        self.serial.flush()  # Wait until the frame has left the UART
+
+        _readLocalEcho(self.serial, frame, instrument.handle_local_echo)
+
+        _markBusIdle(self.serial.port)
+        _capacity._recordExchange(self.serial, writeTime, frame)
+
+        if instrument.debug:
+            _print_out('Tacos2 debug mode. Frame written by the write queue: {!r} ({})'.format(
+                frame, _hexlify(frame)))
+
+
+def _openPort(port, config):
+    """Open the transport for a port name.
+
+    Args:
+        * port (str): A serial port name, or a URL. See :mod:`tacos2.transports`.
+        * config (:class:`tacos2.config.BusConfig`): The bus settings.
+
+    Returns:
+        The serial port object (as defined by the pySerial module), or another transport with the same interface.
+
+    """
+    scheme = _splitUrl(port)[0]
+    if scheme == 'tcp':
+        return SocketTransport(port, baudrate=config.baudrate, timeout=config.timeout)
+    if scheme == 'memory':
+        return MemoryTransport(port, baudrate=config.baudrate, timeout=config.timeout)
+    if scheme:
+        return serial.serial_for_url(port, **config.openArguments())
+    return serial.Serial(port=port, **config.openArguments())
+
+
+def _readLocalEcho(serialport, request, handleLocalEcho):
+    """Read and discard the local echo of a request, comparing it with the request as the bytes arrive.
+
+    Args:
+        * serialport: The serial port object (as defined by the pySerial module).
+        * request (str): The request that has just been written.
+        * handleLocalEcho (bool or None): Whether the adaptor echoes, see :attr:`tacos2.Instrument.handle_local_echo`.
+          Use None to detect it on the first request, and remember the result for the port.
+
+    Returns:
+        The received bytes that are not part of the echo (str), which are the beginning of the response.
+        Empty if there are none.
+
+    Raises:
+        IOError as soon as a byte differs from the request, or if the echo stops before its end.
+
+    """
+    if handleLocalEcho is None:
+        handleLocalEcho = _LOCAL_ECHO.get(serialport.port)
+        if handleLocalEcho is None:
+            return _detectLocalEcho(serialport, request)
+    if not handleLocalEcho:
+        return request[:0]
+
+    position = 0
+    while position < len(request):
+        chunk = serialport.read(_chunkSize(serialport, len(request) - position))
+        if not chunk:
+            raise IOError('Local echo handling is enabled, but the local echo stopped after {} of {} bytes. Request: {!r}'.format(
+                position, len(request), request))
+
+        difference = _firstDifference(chunk, request[position:])
+        if difference is not None:
+            template = 'Local echo handling is enabled, but the local echo differs from the request at byte {}. ' + \
+                'Request: {!r} ({} bytes), local echo: {!r}.'
+            raise IOError(template.format(position + difference, request, len(request), request[:position] + chunk))
+        position += len(chunk)
+
+    return request[:0]
+
+
+def _detectLocalEcho(serialport, request):
+    """Detect whether the adaptor echoes, see :func:`_readLocalEcho`.
+
+    Waits at most the frame time of the request and :data:`_ECHO_LATENCY` for the echo.
+    Bytes that differ from the request are the beginning of the response, and are returned.
+
+    """
+    previousTimeout = serialport.timeout
+    serialport.timeout = _calculate_frame_time(len(request), serialport.baudrate, _portBitsPerCharacter(serialport)) + \
+        _ECHO_LATENCY
+    received = request[:0]
+    try:
+        while len(received) < len(request):
+            chunk = serialport.read(_chunkSize(serialport, len(request) - len(received)))
+            if not chunk:
+                break
+            received += chunk
+            if _firstDifference(received, request) is not None:
+                break
+    finally:
+        serialport.timeout = previousTimeout
+
+    if received == request:
+        _LOCAL_ECHO[serialport.port] = True
+        return request[:0]
+    if received and _firstDifference(received, request) is None:
+        raise IOError('The local echo stopped after {} of {} bytes. Request: {!r}'.format(len(received), len(request), request))
+
+    _LOCAL_ECHO[serialport.port] = False
+    return received
+
+
+def _readFrame(serialport, received=''):
+    """Read one valid frame, reading exactly the number of bytes given by its byte count.
+
+    Args:
+        * serialport: The serial port object (as defined by the pySerial module).
+        * received (str): Bytes already received, for example with the local echo.
+
+    Returns:
+        A tuple (frame, fields, skipped): the frame (str, also for Python3), its unescaped fields
+        (see :func:`tacos2.codec._checkFrame`) and the number of noise bytes skipped before it.
+
+    Raises:
+        NoAnswerError if nothing was received, otherwise a :class:`tacos2.errors.FrameError`
+        subclass for the first invalid frame (or the noise).
+
+    Bytes before DLE STX are skipped. When a frame is invalid, the search continues at the next
+    DLE STX among the bytes already received, without waiting for more, so that a noisy byte
+    costs no timeout.
+
+    """
+    buffer = _latin1(received)
+    skipped = 0
+    firstError = None
+    exhausted = False
+
+    while True:
+        start = buffer.find(_FRAME_START)
+        if start < 0:
+            keep = 1 if buffer.endswith(_FRAME_START[0]) else 0  # Possibly the first half of DLE STX
+            skipped += len(buffer) - keep
+            buffer = buffer[len(buffer) - keep:]
+            if exhausted:
+                break
+            needed = 3 - len(buffer)
+            chunk = _readMore(serialport, needed, firstError is None)
+            exhausted = len(chunk) < needed  # The timeout has passed, or nothing more has been received
+            buffer += chunk
+            continue
+
+        skipped += start
+        buffer = buffer[start:]
+        try:
+            length = _frameLength(buffer)
+            while length is None or len(buffer) < length:
+                if exhausted:
+                    raise TruncatedFrameError('Truncated frame: {!r}'.format(buffer), buffer)
+                needed = (4 if length is None else length) - len(buffer)
+                chunk = _readMore(serialport, needed, firstError is None)
+                exhausted = len(chunk) < needed
+                buffer += chunk
+                if length is None:
+                    length = _frameLength(buffer)
+            frame = buffer[:length]
+            return frame, _checkFrame(frame), skipped
+        except TruncatedFrameError as err:
+            firstError = firstError or err
+            break
+        except FrameError as err:
+            firstError = firstError or err
+            skipped += 2
+            buffer = buffer[2:]  # Resynchronise at the next DLE STX
+            exhausted = False
+
+    if firstError is not None:
+        raise firstError
+    if skipped or buffer:
+        raise NoiseError('Only noise was received: {} bytes without a frame start'.format(skipped + len(buffer)))
+    raise NoAnswerError('No communication with the instrument (no answer)')
+
+
+def _readResponse(serialport, requestFields, received='', debug=False):
+    """Read the response to a request, discarding the frames that do not answer it.
+
+    Args:
+        * serialport: The serial port object (as defined by the pySerial module).
+        * requestFields (list of int): The fields of the request, see :func:`tacos2.codec._checkFrame`.
+        * received (str): Bytes already received, for example with the local echo.
+        * debug (bool): Print the discarded frames.
+
+    Returns:
+        A tuple (frame, fields, skipped), see :func:`_readFrame`. The skipped count includes the
+        bytes of the discarded frames.
+
+    Raises:
+        NoAnswerError if no matching response was received within the timeout of the port,
+        otherwise the errors of :func:`_readFrame`. The timeout applies to all the frames together.
+
+    Discarded frames, for example late responses to earlier requests that timed out, are counted
+    by the :class:`tacos2.correlation.RequestTracker` of the port.
+
+    """
+    requestTracker = correlation.tracker(serialport.port)
+    timeout = serialport.timeout
+    giveUp = _now_ns() + int((timeout or 0) * _SECONDS_TO_NANOSECONDS)
+    discardedFrames = 0
+    discardedBytes = 0
+    try:
+        while True:
+            frame, fields, skipped = _readFrame(serialport, received)
+            received = ''
+            if correlation._matches(fields, requestFields):
+                return frame, fields, skipped + discardedBytes
+
+            late = requestTracker.discard(fields)
+            discardedFrames += 1
+            discardedBytes += skipped + len(frame)
+            if debug:
+                _print_out('Tacos2 debug mode. Discarded {} frame: {!r} ({})'.format(
+                    'a late' if late else 'an unexpected', frame, _hexlify(frame)))
+
+            remaining = giveUp - _now_ns()
+            if remaining <= 0:
+                raise NoAnswerError('No communication with the instrument (no answer, {} other frames discarded)'.format(
+                    discardedFrames))
+            serialport.timeout = float(remaining) / _SECONDS_TO_NANOSECONDS  # One deadline for all the frames
+    finally:
+        if serialport.timeout != timeout:
+            serialport.timeout = timeout
+
+
+def _discardStaleInput(serialport, debug=False):
+    """Read and discard the bytes received since the previous exchange, before a request is written.
+
+    Args:
+        * serialport: The serial port object (as defined by the pySerial module).
+        * debug (bool): Print the discarded bytes.
+
+    Returns:
+        The number of discarded bytes (int).
+
+    The complete frames among them, typically late responses to requests that timed out, are counted
+    by the :class:`tacos2.correlation.RequestTracker` of the port.
+
+    """
+    stale = _readMore(serialport, getattr(serialport, 'in_waiting', 0), False)
+    if not stale:
+        return 0
+
+    requestTracker = correlation.tracker(serialport.port)
+    position = stale.find(_FRAME_START)
+    while position >= 0:
+        try:
+            length = _frameLength(stale[position:])
+            if length is not None and position + length <= len(stale):
+                requestTracker.discard(_checkFrame(stale[position:position + length]))
+                position = stale.find(_FRAME_START, position + length)
+                continue
+        except FrameError:
+            pass
+        position = stale.find(_FRAME_START, position + 1)
+
+    if debug:
+        _print_out('Tacos2 debug mode. Discarded {} stale bytes before the request: {!r} ({})'.format(
+            len(stale), stale, _hexlify(stale)))
+    return len(stale)
+
+
+def _readMore(serialport, size, wait):
+    """Read up to *size* bytes, at least 1. Without *wait*, only bytes that already have been received are read."""
+    size = max(1, size)
+    if not wait:
+        size = min(size, getattr(serialport, 'in_waiting', 0))
+        if not size:
+            return ''
+    return _latin1(serialport.read(size))
+
+
+def _latin1(data):
+    if sys.version_info[0] > 2 and isinstance(data, bytes):
+        return str(data, encoding='latin1')  # Convert types to make it Python3 compatible
+    return data
+
+
+def _chunkSize(serialport, remaining):
+    """Number of bytes to read: the bytes already waiting, but at least 1 so that the read waits for the next byte."""
+    return max(1, min(remaining, getattr(serialport, 'in_waiting', 0)))
+
+
+def _firstDifference(received, expected):
+    """Return the index of the first byte in *received* that differs from *expected*, or None."""
+    for index in range(min(len(received), len(expected))):
+        if received[index] != expected[index]:
+            return index
+    if len(received) > len(expected):
+        return len(expected)
+    return None
+
+
+def _withoutRange(frames, das, dae):
+    """Return the frames, with the SET frames trimmed to the addresses outside das to dae."""
+    result = []
+    for frame in frames:
+        fields = _checkFrame(_latin1(frame))
+        frameDas, frameDae, cw, sax, sa, cmd = fields[:6]
+        if cmd != SET or frameDae < das or frameDas > dae:
+            result.append(frame)
+            continue
+        for start, end in ((frameDas, das - 1), (dae + 1, frameDae)):
+            if start <= end:
+                trimmed = _embedPayload(start, end, cw, sax, sa, SET, fields[6], fields[7])
+                if sys.version_info[0] > 2:
+                    trimmed = bytes(trimmed, encoding='latin1')  # Convert types to make it Python3 compatible
+                result.append(trimmed)
+    return result
+
+
+def _jobKind(fieldsList):
+    """Return the (kind, (das, dae)) of the queued frames, as used by :func:`tacos2.queues._coalesceIndex`.
+
+    A single SET or STOP frame gives ``'SET'`` or ``'STOP'``, several frames give ``'BURST'``
+    with the range spanning all of them. None for no frames.
+
+    """
+    if not fieldsList:
+        return None
+    key = (min(fields[0] for fields in fieldsList), max(fields[1] for fields in fieldsList))
+    if len(fieldsList) > 1:
+        return 'BURST', key
+    return ('STOP' if fieldsList[0][5] == STOP else 'SET'), key
+
+
+def _getPortWriter(serialport):
+    """Return the :class:`_PortWriter` of the serial port, and start it if necessary."""
+    with _PORTWRITERS_LOCK:
+        writer = _PORTWRITERS.get(serialport.port)
+        if writer is None:
+            writer = _PORTWRITERS[serialport.port] = _PortWriter(serialport)
+            writer.start()
+        return writer
+
+
+def _isPortFailure(err):
+    """Check whether an exception comes from the serial port itself, rather than from the communication with the slave.
+
+    Args:
+        err (Exception): An exception raised during communication.
+
+    Returns:
+        :const:`True` for pySerial exceptions and operating system errors (for example a disconnected USB adaptor).
+
+    """
+    return isinstance(err, serial.SerialException) or getattr(err, 'errno', None) is not None
+
+
+def _reopenPort(serialport, err=None, debug=False):
+    """Reopen a failed serial port, with exponential backoff.
+
+    Args:
+        * serialport: The serial port object (as defined by the pySerial module).
+        * err (Exception or None): The exception that indicated the failure. Used in messages.
+        * debug (bool): Print the reopen attempts.
+
+    Raises:
+        IOError if the port could not be reopened within :data:`tacos2.RECONNECT_ATTEMPTS` attempts.
+
+    Device nodes that have vanished (for example ``/dev/ttyUSB0`` of an unplugged adaptor)
+    are waited for, instead of trying to open them.
+
+    """
+    try:
+        serialport.close()
+    except EnvironmentError:
+        pass
+
+    delay = tacos2.RECONNECT_DELAY
+    latestError = err
+    for attempt in range(1, tacos2.RECONNECT_ATTEMPTS + 1):
+        if debug:
+            _print_out('Tacos2 debug mode. Reopening serial port {} (attempt {} of {}) after error: {}'.format(
+                serialport.port, attempt, tacos2.RECONNECT_ATTEMPTS, latestError))
+
+        if not serialport.port.startswith('/dev/') or os.path.exists(serialport.port):
+            try:
+                serialport.open()
+                return
+            except EnvironmentError as openError:
+                latestError = openError
+        else:
+            latestError = 'The device node {} does not exist'.format(serialport.port)
+
+        time.sleep(delay)
+        delay = min(2 * delay, tacos2.RECONNECT_MAX_DELAY)
+
+    raise IOError('Could not reopen the serial port {} after {} attempts. Latest error: {}'.format(
+        serialport.port, tacos2.RECONNECT_ATTEMPTS, latestError))
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Slave side simulation: a bank of virtual blinds answering a master on a bus.
+
+The :class:`BlindBank` keeps the height and angle of the simulated addresses. With a path it is
+a small state file mapped into memory and updated in place, so that a restarted simulator comes
+back with the positions it had, without any warm-up::
+
+    bank = tacos2.simulator.BlindBank('/var/lib/tacos2/demo.state', addresses=range(1, 201))
+    simulator = tacos2.simulator.Simulator('/dev/ttyUSB1', bank)
+    simulator.start()
+    ...
+    simulator.stop()
+    bank.close()
+
+A single slave :class:`tacos2.Instrument` can keep its state in a bank too, see
+:attr:`tacos2.Instrument.state`.
+
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import sys
+import threading
+
+import tacos2
+from tacos2.codec import GET, SET, _embedResponse
+from tacos2.errors import FrameError, NoAnswerError
+from tacos2.utils import _LazyModule, _checkAddress, _checkInt, _print_out
+
+_serialport = _LazyModule('tacos2.serialport')
+
+_NUMBER_OF_ADDRESSES = 256
+_MAGIC = b'T2BB'
+_BANK_VERSION = 1
+
+# Header: magic, version. Followed by the columns of the heights, the angles and the present flags.
+_HEADER = struct.Struct('<4sH10x')
+_HEIGHTS = _HEADER.size
+_ANGLES = _HEIGHTS + _NUMBER_OF_ADDRESSES
+_PRESENT = _ANGLES + _NUMBER_OF_ADDRESSES
+
+_FILLS = [struct.pack('<B', value) * _NUMBER_OF_ADDRESSES for value in range(256)]  # For slice assignments
+_UNCHANGED = 255  # Height or angle value in a SET that leaves it unchanged
+_RESPONSE_CONTROLWORD = 0x00
+
+
+class BlindBank():
+    """Height and angle of virtual blinds, for the addresses 0 to 255.
+
+    Args:
+        * path (str or None): The state file. It is created if it does not exist, otherwise its
+          state is used. None for a bank in memory only.
+        * addresses (iterable of int): Addresses to add to the bank, see :meth:`add`.
+
+    Raises:
+        IOError if the file is not a blind bank state file.
+
+    """
+
+    SIZE = _PRESENT + _NUMBER_OF_ADDRESSES
+    """Size of a state file in bytes (int)."""
+
+    def __init__(self, path=None, addresses=()):
+        self.path = path
+        """The state file (str), or None for a bank in memory only."""
+
+        self._responses = [None] * _NUMBER_OF_ADDRESSES  # Encoded GET responses per master address, see response()
+
+        if path is None:
+            self._memory = mmap.mmap(-1, self.SIZE)
+            self._memory[:_HEADER.size] = _HEADER.pack(_MAGIC, _BANK_VERSION)
+        else:
+            self._memory = self._mapFile(path)
+
+        self._indexRuns()
+        for address in addresses:
+            self.add(address)
+
+    def __repr__(self):
+        """String representation of the :class:`.BlindBank` object."""
+        return "{}.{}<id=0x{:x}, path={!r}, addresses={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.path,
+            len(self.addresses),
+            )
+
+    def __contains__(self, address):
+        return 0 <= address < _NUMBER_OF_ADDRESSES and self._byte(_PRESENT + address) != 0
+
+    @property
+    def addresses(self):
+        """The addresses in the bank (list of int)."""
+        addresses = []
+        for first, last in self._runs:
+            addresses.extend(range(first, last + 1))
+        return addresses
+
+    @property
+    def ranges(self):
+        """The addresses in the bank as contiguous ranges (list of (first, last) tuples)."""
+        return list(self._runs)
+
+    def add(self, das, dae=None, height=0, angle=0):
+        """Add an address, or a range of addresses, with an initial height and angle.
+
+        Addresses already in the bank keep their height and angle.
+
+        """
+        dae = das if dae is None else dae
+        _checkAddress(das, dae)
+        missing = self._missing(das, dae)
+        for first, last in missing:
+            self._fill(_HEIGHTS, first, last, height)
+            self._fill(_ANGLES, first, last, angle)
+            self._fill(_PRESENT, first, last, 1)
+            self._responses[first:last + 1] = [None] * (last - first + 1)
+        if missing:
+            self._indexRuns()
+
+    def remove(self, das, dae=None):
+        """Remove an address, or a range of addresses."""
+        dae = das if dae is None else dae
+        _checkAddress(das, dae)
+        self._fill(_PRESENT, das, dae, 0)
+        self._responses[das:dae + 1] = [None] * (dae - das + 1)
+        self._indexRuns()
+
+    def status(self, address):
+        """Return the (height, angle) of an address, or None if it is not in the bank."""
+        if address not in self:
+            return None
+        return self._byte(_HEIGHTS + address), self._byte(_ANGLES + address)
+
+    def set(self, das, dae, height=_UNCHANGED, angle=_UNCHANGED):
+        """Apply a SET command to the addresses of the bank in a range.
+
+        A height or angle of 255 leaves it unchanged, as for :meth:`tacos2.Instrument.set`.
+
+        Returns:
+            The number of addresses that were changed (int).
+
+        The addresses in the range are found with an index of the contiguous ranges of the bank,
+        and each of those ranges is written with one slice assignment, so that a SET to a range
+        costs the same as a SET to a single address.
+
+        """
+        _checkAddress(das, dae)
+        _checkInt(height, minvalue=0, maxvalue=255, description='height')
+        _checkInt(angle, minvalue=0, maxvalue=255, description='angle')
+        changed = 0
+        for first, last in self._overlapping(das, dae):
+            if height != _UNCHANGED:
+                self._fill(_HEIGHTS, first, last, height)
+            if angle != _UNCHANGED:
+                self._fill(_ANGLES, first, last, angle)
+            self._responses[first:last + 1] = [None] * (last - first + 1)
+            changed += last - first + 1
+        return changed
+
+    def response(self, address, master=0x00):
+        """Return the encoded response to a GET request, or None if the address is not in the bank.
+
+        Args:
+            * address (int): The requested address.
+            * master (int): The source address of the master, which is the destination of the response.
+
+        Returns:
+            The response frame (str, bytes for Python3), ready to be written. It is encoded once,
+            and again only after the height or angle of the address has changed.
+
+        """
+        responses = self._responses[address]
+        if responses is not None and master in responses:
+            return responses[master]
+
+        status = self.status(address)
+        if status is None:
+            return None
+        response = _embedResponse(master, address, *status)
+        if sys.version_info[0] > 2:
+            response = bytes(response, encoding='latin1')  # Convert types to make it Python3 compatible
+        if responses is None:
+            responses = self._responses[address] = {}
+        responses[master] = response
+        return response
+
+    def flush(self):
+        """Write the state to the file now. Otherwise the operating system writes it in the background."""
+        self._memory.flush()
+
+    def close(self):
+        """Flush and unmap the state."""
+        if self.path is not None:
+            self.flush()
+        self._memory.close()
+
+    def _indexRuns(self):
+        """Rebuild the index of the contiguous ranges of addresses in the bank."""
+        present = bytearray(self._memory[_PRESENT:_PRESENT + _NUMBER_OF_ADDRESSES])
+        runs = []
+        first = None
+        for address in range(_NUMBER_OF_ADDRESSES + 1):
+            if address < _NUMBER_OF_ADDRESSES and present[address]:
+                if first is None:
+                    first = address
+            elif first is not None:
+                runs.append((first, address - 1))
+                first = None
+        self._runs = runs
+        self._firsts = [run[0] for run in runs]
+
+    def _overlapping(self, das, dae):
+        """Return the parts of the ranges of the bank within das to dae (list of (first, last) tuples)."""
+        index = max(0, bisect.bisect_right(self._firsts, das) - 1)
+        parts = []
+        for first, last in self._runs[index:]:
+            if first > dae:
+                break
+            if last >= das:
+                parts.append((max(first, das), min(last, dae)))
+        return parts
+
+    def _missing(self, das, dae):
+        """Return the ranges within das to dae that are not in the bank (list of (first, last) tuples)."""
+        missing = []
+        start = das
+        for first, last in self._overlapping(das, dae):
+            if first > start:
+                missing.append((start, first - 1))
+            start = last + 1
+        if start <= dae:
+            missing.append((start, dae))
+        return missing
+
+    def _fill(self, column, first, last, value):
+        self._memory[column + first:column + last + 1] = _FILLS[value][:last - first + 1]
+
+    def _byte(self, offset):
+        return bytearray(self._memory[offset:offset + 1])[0]
+
+    def _mapFile(self, path):
+        descriptor = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(descriptor).st_size
+            if size == 0:
+                os.write(descriptor, _HEADER.pack(_MAGIC, _BANK_VERSION) + b'\0' * (self.SIZE - _HEADER.size))
+            elif size != self.SIZE:
+                raise IOError('Not a blind bank state file (wrong size {}): {}'.format(size, path))
+            memory = mmap.mmap(descriptor, self.SIZE)
+        finally:
+            os.close(descriptor)
+
+        magic, version = _HEADER.unpack(memory[:_HEADER.size])
+        if magic != _MAGIC or version != _BANK_VERSION:
+            memory.close()
+            raise IOError('Not a blind bank state file, or an unsupported version: {}'.format(path))
+        return memory
+
+
+class Simulator():
+    """Simulated slaves for the addresses of a :class:`BlindBank`, answering a master on a port.
+
+    Args:
+        * port (str): The port name, see :class:`tacos2.Instrument`.
+        * bank (:class:`BlindBank`): The simulated blinds. Its state changes with the SET commands.
+        * config (:class:`tacos2.config.BusConfig` or None): Settings of the bus.
+
+    SET commands are applied to all the addresses of the bank in their range. GET commands are
+    answered for single addresses in the bank. Responses on the bus, also the own responses
+    seen in a local echo, are ignored.
+
+    """
+
+    def __init__(self, port, bank, config=None):
+        self.instrument = tacos2.Instrument(port, config=config)
+        """The instrument for the port (:class:`tacos2.Instrument`)."""
+
+        self.bank = bank
+        """The simulated blinds (:class:`BlindBank`)."""
+
+        self.debug = False
+        """Set this to :const:`True` to print the handled commands."""
+
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def __repr__(self):
+        """String representation of the :class:`.Simulator` object."""
+        return "{}.{}<id=0x{:x}, port={!r}, bank={!r}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.instrument.serial.port,
+            self.bank,
+            )
+
+    def respond(self):
+        """Wait for a frame from the master until the port timeout, and handle it.
+
+        Returns:
+            The handled command (int), or None if no valid request was received.
+
+        """
+        try:
+            frame, fields, skipped = _serialport._readFrame(self.instrument.serial)
+        except NoAnswerError:
+            return None
+        except FrameError as err:
+            if self.debug:
+                _print_out('Tacos2 debug mode. Simulator skipping an invalid frame: {}'.format(err))
+            return None
+
+        das, dae, cw, sax, sa, cmd = fields[:6]
+        if cw == _RESPONSE_CONTROLWORD or das > dae:
+            return None
+
+        if cmd == SET and len(fields) >= 8:
+            self.bank.set(das, dae, fields[6], fields[7])
+        elif cmd == GET and das == dae:
+            response = self.bank.response(das, sa)
+            if response is not None:
+                self.instrument.serial.write(response)
+
+        if self.debug:
+            _print_out('Tacos2 debug mode. Simulator handled command 0x{:02X} for {}-{}'.format(cmd, das, dae))
+        return cmd
+
+    def serve(self):
+        """Handle the requests until :meth:`stop` is called."""
+        while not self._stopping.is_set():
+            self.respond()
+
+    def start(self):
+        """Handle the requests in a background thread."""
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self.serve, name='tacos2-simulator')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop handling requests, after the current read. The state of the bank is flushed."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.bank.path is not None:
+            self.bank.flush()
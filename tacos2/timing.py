@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Timing of the bus communication: silent periods, frame times and bus idle tracking.
+
+"""
+
+import sys
+import time
+
+from tacos2.utils import _checkInt, _checkNumerical
+
+_SECONDS_TO_MILLISECONDS = 1000
+_SECONDS_TO_NANOSECONDS = 1000000000
+
+_LATEST_READ_TIMES = {}  # Time of _now_ns() in nanoseconds when each bus went idle, see _markBusIdle()
+_SILENT_PERIODS = {}  # Fixed silent periods in seconds per port, see tacos2.config.BusConfig
+
+############################################
+## Serial communication utility functions ##
+############################################
+
+
+def _bitsPerCharacter(bytesize=8, parity='N', stopbits=1):
+    """Return the number of bit times (int or float) for one character on the wire.
+
+    A start bit, the data bits, a parity bit unless the parity is ``'N'``, and the stop bits.
+    The defaults are the framing of :data:`tacos2.BYTESIZE`, :data:`tacos2.PARITY` and :data:`tacos2.STOPBITS`.
+
+    """
+    return 1 + bytesize + (0 if parity == 'N' else 1) + stopbits
+
+
+def _portBitsPerCharacter(serialport):
+    """Return the number of bit times for one character with the framing of a serial port object.
+
+    Transports without framing settings (see :mod:`tacos2.transports`) use the default framing.
+
+    """
+    return _bitsPerCharacter(getattr(serialport, 'bytesize', 8), getattr(serialport, 'parity', 'N'),
+        getattr(serialport, 'stopbits', 1))
+
+
+def _calculate_minimum_silent_period(baudrate, bitsPerCharacter=None):
+    """Calculate the silent period length to comply with the 3.5 character silence between messages.
+
+    Args:
+        * baudrate (numerical): The baudrate for the serial port
+        * bitsPerCharacter (numerical or None): Bit times per character, see :func:`_bitsPerCharacter`.
+          None for the default framing.
+
+    Returns:
+        The number of seconds (float) that should pass between each message on the bus.
+
+    Raises:
+        ValueError, TypeError.
+
+    """
+    _checkNumerical(baudrate, minvalue=1, description='baudrate')  # Avoid division by zero
+
+    MINIMUM_SILENT_CHARACTERTIMES = 3.5
+
+    if bitsPerCharacter is None:
+        bitsPerCharacter = _bitsPerCharacter()
+    bittime = 1 / float(baudrate)
+    return bittime * bitsPerCharacter * MINIMUM_SILENT_CHARACTERTIMES
+
+def _silentPeriod(serialport):
+    """Return the silent period in seconds (float) for a serial port object.
+
+    This is the fixed silent period of the port if one has been configured, otherwise 3.5 character times.
+
+    """
+    silentPeriod = _SILENT_PERIODS.get(serialport.port)
+    if silentPeriod is None:
+        return _calculate_minimum_silent_period(serialport.baudrate, _portBitsPerCharacter(serialport))
+    return silentPeriod
+
+
+def _calculate_frame_time(numberOfBytes, baudrate, bitsPerCharacter=None):
+    """Calculate the time it takes to transmit a number of bytes on the bus.
+
+    Args:
+        * numberOfBytes (int): The number of bytes (characters).
+        * baudrate (numerical): The baudrate for the serial port
+        * bitsPerCharacter (numerical or None): Bit times per character, see :func:`_bitsPerCharacter`.
+          None for the default framing.
+
+    Returns:
+        The transmission time in seconds (float).
+
+    Raises:
+        ValueError, TypeError.
+
+    """
+    _checkInt(numberOfBytes, minvalue=0, description='number of bytes')
+    _checkNumerical(baudrate, minvalue=1, description='baudrate')
+
+    if bitsPerCharacter is None:
+        bitsPerCharacter = _bitsPerCharacter()
+    return numberOfBytes * bitsPerCharacter / float(baudrate)
+
+
+##########
+# Timing #
+##########
+
+_CLOCK_MONOTONIC = 1  # clockid_t of CLOCK_MONOTONIC on Linux
+
+
+def _linuxMonotonicNs():
+    """Return a function for the Linux ``clock_gettime(CLOCK_MONOTONIC)`` in nanoseconds via ctypes, or None.
+
+    Used on Python 2, which has no monotonic clock in the time module.
+
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        import ctypes
+        for library in ('librt.so.1', 'libc.so.6'):
+            try:
+                clock_gettime = ctypes.CDLL(library, use_errno=True).clock_gettime
+                break
+            except (OSError, AttributeError):
+                continue
+        else:
+            return None
+    except ImportError:
+        return None
+
+    class _Timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+
+    def monotonicNs():
+        """Return the time of CLOCK_MONOTONIC in nanoseconds (int)."""
+        timespec = _Timespec()
+        if clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(timespec)) != 0:
+            raise OSError(ctypes.get_errno(), 'clock_gettime(CLOCK_MONOTONIC) failed')
+        return timespec.tv_sec * _SECONDS_TO_NANOSECONDS + timespec.tv_nsec
+
+    return monotonicNs
+
+
+def _secondsToNs(clock):
+    """Return a function for a clock in seconds (float), in nanoseconds (int)."""
+    def nowNs():
+        return int(clock() * _SECONDS_TO_NANOSECONDS)
+    return nowNs
+
+
+def _selectClock():
+    """Return the clock for :func:`_now_ns`, and whether it is monotonic (bool).
+
+    In order of preference: the ns clocks of Python 3.7 and later, :func:`time.perf_counter` of
+    Python 3.3 and later, the ``monotonic`` package from PyPI if it is installed, and
+    ``clock_gettime(CLOCK_MONOTONIC)`` on Linux. Otherwise :func:`time.time` is used, which is
+    not monotonic: changes of the system clock then disturb the silent periods, deadlines and
+    latency measurements.
+
+    """
+    for name in ('perf_counter_ns', 'monotonic_ns'):
+        if hasattr(time, name):
+            return getattr(time, name), True
+    if hasattr(time, 'perf_counter'):
+        return _secondsToNs(time.perf_counter), True
+    try:
+        from monotonic import monotonic
+    except (ImportError, RuntimeError):  # RuntimeError: the package found no monotonic clock
+        pass
+    else:
+        return _secondsToNs(monotonic), True
+    clock = _linuxMonotonicNs()
+    if clock is not None:
+        return clock, True
+    return _secondsToNs(time.time), False
+
+
+_now_ns, _MONOTONIC = _selectClock()
+"""High-resolution clock in nanoseconds (int), used for all bus timing. See :func:`_selectClock`."""
+
+_SPIN_THRESHOLD_NS = 16000000 if sys.platform.startswith('win') else 1000000
+"""Remaining wait time in nanoseconds below which :func:`_waitUntil` spins instead of sleeping.
+Roughly the resolution of :func:`time.sleep` on the platform."""
+
+
+def _waitUntil(deadline):
+    """Wait until the time given by :func:`_now_ns` has reached *deadline*.
+
+    Args:
+        deadline (int): Time in nanoseconds.
+
+    Sleeps for the coarse part of the wait, and spins for the last :data:`_SPIN_THRESHOLD_NS`,
+    so that also sub-millisecond waits end on time.
+
+    """
+    while True:
+        remaining = deadline - _now_ns()
+        if remaining <= 0:
+            return
+        if remaining > _SPIN_THRESHOLD_NS:
+            time.sleep(float(remaining - _SPIN_THRESHOLD_NS) / _SECONDS_TO_NANOSECONDS)
+
+
+def _markBusIdle(port, timestamp=None):
+    """Record when the bus on the port went idle (or will go idle, when a frame is still being transmitted).
+
+    Args:
+        * port (str): The serial port name.
+        * timestamp (int or None): Time in nanoseconds, see :func:`_now_ns`. None means now.
+
+    """
+    _LATEST_READ_TIMES[port] = _now_ns() if timestamp is None else timestamp
+
+
+def _waitForSilentPeriod(port, minimum_silent_period):
+    """Wait until the bus on the port has been idle for the silent period.
+
+    Args:
+        * port (str): The serial port name.
+        * minimum_silent_period (float): The silent period in seconds.
+
+    """
+    _waitUntil(_LATEST_READ_TIMES.get(port, 0) + int(minimum_silent_period * _SECONDS_TO_NANOSECONDS))
+
+
+def busIdleTime(port):
+    """Return how long the bus on the port has been idle.
+
+    Args:
+        port (str): The serial port name.
+
+    Returns:
+        The idle time in seconds (float), 0.0 while a frame is being transmitted,
+        or None if there has been no communication on the port.
+
+    """
+    idleSince = _LATEST_READ_TIMES.get(port)
+    if idleSince is None:
+        return None
+    return max(0.0, float(_now_ns() - idleSince) / _SECONDS_TO_NANOSECONDS)
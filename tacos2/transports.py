@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Transports other than a local serial port.
+
+The port name given to :class:`tacos2.Instrument` selects the transport:
+
+==============================  ===============================================================
+Port name                       Transport
+==============================  ===============================================================
+``/dev/ttyUSB0``, ``COM4``      Local serial port (:class:`serial.Serial`).
+``tcp://192.168.0.7:4001``      :class:`SocketTransport`, for RS-485 to Ethernet converters.
+``memory://bus1``               :class:`MemoryTransport`, an in-memory bus for simulators and tests.
+``rfc2217://...``, ``loop://``  Other pySerial URLs, via :func:`serial.serial_for_url`.
+==============================  ===============================================================
+
+The transports have the part of the pySerial interface used by Tacos2: ``port``, ``baudrate``,
+``timeout``, ``in_waiting``, ``open()``, ``close()``, ``isOpen()``, ``read(size)``, ``write(data)`` and ``flush()``.
+The ``baudrate`` of a network transport is the baudrate of the RS-485 bus behind it, and is used
+for the silent period and the other timing calculations.
+
+"""
+
+import errno
+import socket
+import threading
+
+from tacos2.timing import _SECONDS_TO_NANOSECONDS, _now_ns
+
+# In-memory buses, by name
+_MEMORY_BUSES = {}
+_MEMORY_BUSES_LOCK = threading.Lock()
+
+
+def _splitUrl(port):
+    """Split a port URL into (scheme, location, options). A plain port name has the scheme ''."""
+    scheme, separator, rest = port.partition('://')
+    if not separator:
+        return '', port, ()
+    location, _, query = rest.partition('?')
+    return scheme, location, tuple(option for option in query.split('&') if option)
+
+
+def _remainingTimeout(deadline):
+    """Seconds left until a :func:`_now_ns` deadline (None for no deadline), at least 0."""
+    if deadline is None:
+        return None
+    return max(0.0, float(deadline - _now_ns()) / _SECONDS_TO_NANOSECONDS)
+
+
+def _deadline(timeout):
+    return None if timeout is None else _now_ns() + int(timeout * _SECONDS_TO_NANOSECONDS)
+
+
+class SocketTransport():
+    """A TCP connection to an RS-485 to Ethernet converter, in raw (transparent) mode.
+
+    Args:
+        * port (str): ``tcp://host:port``.
+        * baudrate (int): Baudrate of the RS-485 bus behind the converter.
+        * timeout (float or None): Read timeout in seconds.
+
+    Received data is buffered, so a read of a few bytes does not need a system call per byte.
+
+    """
+
+    def __init__(self, port, baudrate, timeout):
+        scheme, location, _ = _splitUrl(port)
+        host, separator, portNumber = location.rpartition(':')
+        if scheme != 'tcp' or not separator or not portNumber.isdigit():
+            raise ValueError('The port name must be tcp://host:port, not {!r}'.format(port))
+
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self._address = (host, int(portNumber))
+        self._socket = None
+        self._buffer = bytearray()
+        self.open()
+
+    def __repr__(self):
+        """String representation of the :class:`.SocketTransport` object."""
+        return "{}.{}<id=0x{:x}, port={!r}, baudrate={}, open={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.port,
+            self.baudrate,
+            self.isOpen(),
+            )
+
+    @property
+    def in_waiting(self):
+        return len(self._buffer)
+
+    def isOpen(self):
+        return self._socket is not None
+
+    def open(self):
+        self.close()
+        connection = socket.create_connection(self._address, 5.0 if self.timeout is None else max(self.timeout, 1.0))
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket = connection
+        self._buffer = bytearray()
+
+    def close(self):
+        connection, self._socket = self._socket, None
+        if connection is not None:
+            connection.close()
+
+    def write(self, data):
+        if self._socket is None:
+            raise IOError(errno.ENOTCONN, 'The connection to {} is closed'.format(self.port))
+        self._socket.sendall(data)
+        return len(data)
+
+    def flush(self):
+        pass  # The data has been handed to the TCP stack, there is no way to wait for the converter
+
+    def read(self, size=1):
+        if self._socket is None:
+            raise IOError(errno.ENOTCONN, 'The connection to {} is closed'.format(self.port))
+
+        deadline = _deadline(self.timeout)
+        while len(self._buffer) < size:
+            timeout = _remainingTimeout(deadline)
+            if timeout == 0.0:
+                break
+            self._socket.settimeout(timeout)
+            try:
+                chunk = self._socket.recv(4096)
+            except socket.timeout:
+                break
+            if not chunk:
+                self.close()
+                raise IOError(errno.ECONNRESET, 'The connection to {} was closed by the converter'.format(self.port))
+            self._buffer += chunk
+
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class _MemoryBus():
+    """The shared state of the :class:`MemoryTransport` endpoints with the same name."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.endpoints = []
+
+
+class MemoryTransport():
+    """An endpoint of an in-memory RS-485 bus.
+
+    Args:
+        * port (str): ``memory://name``, optionally with options like ``?echo&id=slave3``.
+        * baudrate (int): Baudrate used for the timing calculations.
+        * timeout (float or None): Read timeout in seconds.
+
+    All endpoints with the same name are on the same bus: the data written by one endpoint
+    is received by all the others, like on a multidrop line. With ``echo`` the endpoint also
+    receives its own data, like an RS-485 adaptor with local echo. Master and slave instruments
+    (see :meth:`tacos2.Instrument.respond`) can be connected this way without hardware.
+
+    Instruments with the same port name share a transport, so give each endpoint its own
+    port name, for example ``memory://bus1`` for the master and ``memory://bus1?id=3`` for a slave.
+    Unknown options are ignored.
+
+    """
+
+    def __init__(self, port, baudrate, timeout):
+        scheme, name, options = _splitUrl(port)
+        if scheme != 'memory' or not name:
+            raise ValueError('The port name must be memory://name, not {!r}'.format(port))
+
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.echo = 'echo' in options
+        """Receive the own written data (bool)."""
+
+        self._buffer = bytearray()
+        with _MEMORY_BUSES_LOCK:
+            self._bus = _MEMORY_BUSES.setdefault(name, _MemoryBus())
+        self._open = False
+        self.open()
+
+    def __repr__(self):
+        """String representation of the :class:`.MemoryTransport` object."""
+        return "{}.{}<id=0x{:x}, port={!r}, baudrate={}, open={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.port,
+            self.baudrate,
+            self._open,
+            )
+
+    @property
+    def in_waiting(self):
+        return len(self._buffer)
+
+    def isOpen(self):
+        return self._open
+
+    def open(self):
+        with self._bus.condition:
+            if not self._open:
+                self._bus.endpoints.append(self)
+                self._open = True
+
+    def close(self):
+        with self._bus.condition:
+            if self._open:
+                self._bus.endpoints.remove(self)
+                self._open = False
+                self._buffer = bytearray()
+
+    def write(self, data):
+        with self._bus.condition:
+            if not self._open:
+                raise IOError(errno.ENOTCONN, 'The memory bus {} is closed'.format(self.port))
+            for endpoint in self._bus.endpoints:
+                if endpoint is not self or self.echo:
+                    endpoint._buffer += data
+            self._bus.condition.notify_all()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def read(self, size=1):
+        deadline = _deadline(self.timeout)
+        with self._bus.condition:
+            if not self._open:
+                raise IOError(errno.ENOTCONN, 'The memory bus {} is closed'.format(self.port))
+            while len(self._buffer) < size:
+                timeout = _remainingTimeout(deadline)
+                if timeout == 0.0:
+                    break
+                self._bus.condition.wait(timeout)
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
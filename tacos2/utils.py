@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Conversions, error checking and development tools used by the other Tacos2 modules.
+
+"""
+
+import importlib
+import sys
+
+if sys.version > '3':
+    import binascii
+
+# Allow long also in Python3
+# http://python3porting.com/noconv.html
+if sys.version > '3':
+    long = int
+
+##############################
+# String and num conversions #
+##############################
+
+def _hexencode(bytestring, insert_spaces = False):
+    """Convert a byte string to a hex encoded string.
+
+    For example 'J' will return '4A', and ``'\\x04'`` will return '04'.
+
+    Args:
+        bytestring (str): Can be for example ``'A\\x01B\\x45'``.
+        insert_spaces (bool): Insert space characters between pair of characters to increase readability.
+
+    Returns:
+        A string of twice the length, with characters in the range '0' to '9' and 'A' to 'F'.
+        The string will be longer if spaces are inserted.
+
+    Raises:
+        TypeError, ValueError
+
+    """
+    _checkString(bytestring, description='byte string')
+
+    separator = '' if not insert_spaces else ' '
+    
+    # Use plain string formatting instead of binhex.hexlify,
+    # in order to have it Python 2.x and 3.x compatible
+
+    byte_representions = []
+    for c in bytestring:
+        byte_representions.append( '{0:02X}'.format(ord(c)) )
+    return separator.join(byte_representions).strip()
+
+
+def _hexdecode(hexstring):
+    """Convert a hex encoded string to a byte string.
+
+    For example '4A' will return 'J', and '04' will return ``'\\x04'`` (which has length 1).
+
+    Args:
+        hexstring (str): Can be for example 'A3' or 'A3B4'. Must be of even length.
+        Allowed characters are '0' to '9', 'a' to 'f' and 'A' to 'F' (not space).
+
+    Returns:
+        A string of half the length, with characters corresponding to all 0-255 values for each byte.
+
+    Raises:
+        TypeError, ValueError
+
+    """
+    # Note: For Python3 the appropriate would be: raise TypeError(new_error_message) from err
+    # but the Python2 interpreter will indicate SyntaxError.
+    # Thus we need to live with this warning in Python3:
+    # 'During handling of the above exception, another exception occurred'
+
+    _checkString(hexstring, description='hexstring')
+
+    if len(hexstring) % 2 != 0:
+        raise ValueError('The input hexstring must be of even length. Given: {!r}'.format(hexstring))
+
+    if sys.version_info[0] > 2:
+        by = bytes(hexstring, 'latin1')
+        try:
+            return str(binascii.unhexlify(by), encoding='latin1')
+        except binascii.Error as err:
+            new_error_message = 'Hexdecode reported an error: {!s}. Input hexstring: {}'.format(err.args[0], hexstring)
+            raise TypeError(new_error_message)
+
+    else:
+        try:
+            return hexstring.decode('hex')
+        except TypeError as err:
+            raise TypeError('Hexdecode reported an error: {}. Input hexstring: {}'.format(err.message, hexstring))
+
+
+def _hexlify(bytestring):
+    """Convert a byte string to a hex encoded string, with spaces for easier reading.
+    
+    This is just a facade for _hexencode() with insert_spaces = True.
+    
+    See _hexencode() for details.
+
+    """
+    return _hexencode(bytestring, insert_spaces = True)
+
+
+def _bitResponseToValue(bytestring):
+    """Convert a response string to a numerical value.
+
+    Args:
+        bytestring (str): A string of length 1. Can be for example ``\\x01``.
+
+    Returns:
+        The converted value (int).
+
+    Raises:
+        TypeError, ValueError
+
+    """
+    _checkString(bytestring, description='bytestring', minlength=1, maxlength=1)
+
+    RESPONSE_ON  = '\x01'
+    RESPONSE_OFF = '\x00'
+
+    if bytestring == RESPONSE_ON:
+        return 1
+    elif bytestring == RESPONSE_OFF:
+        return 0
+    else:
+        raise ValueError('Could not convert bit response to a value. Input: {0!r}'.format(bytestring))
+
+
+############################
+# Error checking functions #
+############################
+
+def _checkNumerical(inputvalue, minvalue=None, maxvalue=None, description='inputvalue'):
+    """Check that the given numerical value is valid.
+
+    Args:
+        * inputvalue (numerical): The value to be checked.
+        * minvalue (numerical): Minimum value  Use None to skip this part of the test.
+        * maxvalue (numerical): Maximum value. Use None to skip this part of the test.
+        * description (string): Used in error messages for the checked inputvalue
+
+    Raises:
+        TypeError, ValueError
+
+    Note: Can not use the function :func:`_checkString`, as it uses this function internally.
+
+    """
+    # Type checking
+    if not isinstance(description, str):
+        raise TypeError('The description should be a string. Given: {0!r}'.format(description))
+
+    if not isinstance(inputvalue, (int, long, float)):
+        raise TypeError('The {0} must be numerical. Given: {1!r}'.format(description, inputvalue))
+
+    if not isinstance(minvalue, (int, float, long, type(None))):
+        raise TypeError('The minvalue must be numeric or None. Given: {0!r}'.format(minvalue))
+
+    if not isinstance(maxvalue, (int, float, long, type(None))):
+        raise TypeError('The maxvalue must be numeric or None. Given: {0!r}'.format(maxvalue))
+
+    # Consistency checking
+    if (not minvalue is None) and (not maxvalue is None):
+        if maxvalue < minvalue:
+            raise ValueError('The maxvalue must not be smaller than minvalue. Given: {0} and {1}, respectively.'.format( \
+                maxvalue, minvalue))
+
+    # Value checking
+    if not minvalue is None:
+        if inputvalue < minvalue:
+            raise ValueError('The {0} is too small: {1}, but minimum value is {2}.'.format( \
+                description, inputvalue, minvalue))
+
+    if not maxvalue is None:
+        if inputvalue > maxvalue:
+            raise ValueError('The {0} is too large: {1}, but maximum value is {2}.'.format( \
+                description, inputvalue, maxvalue))
+
+
+def _checkString(inputstring, description, minlength=0, maxlength=None):
+    """Check that the given string is valid.
+
+    Args:
+        * inputstring (string): The string to be checked
+        * description (string): Used in error messages for the checked inputstring
+        * minlength (int): Minimum length of the string
+        * maxlength (int or None): Maximum length of the string
+
+    Raises:
+        TypeError, ValueError
+
+    Uses the function :func:`_checkInt` internally.
+
+    """
+    # Type checking
+    if not isinstance(description, str):
+        raise TypeError('The description should be a string. Given: {0!r}'.format(description))
+
+    if not isinstance(inputstring, str):
+        raise TypeError('The {0} should be a string. Given: {1!r}'.format(description, inputstring))
+
+    if not isinstance(maxlength, (int, type(None))):
+        raise TypeError('The maxlength must be an integer or None. Given: {0!r}'.format(maxlength))
+
+    # Check values
+    _checkInt(minlength, minvalue=0, maxvalue=None, description='minlength')
+
+    if len(inputstring) < minlength:
+        raise ValueError('The {0} is too short: {1}, but minimum value is {2}. Given: {3!r}'.format( \
+            description, len(inputstring), minlength, inputstring))
+
+    if not maxlength is None:
+        if maxlength < 0:
+            raise ValueError('The maxlength must be positive. Given: {0}'.format(maxlength))
+
+        if maxlength < minlength:
+            raise ValueError('The maxlength must not be smaller than minlength. Given: {0} and {1}'.format( \
+                maxlength, minlength))
+
+        if len(inputstring) > maxlength:
+            raise ValueError('The {0} is too long: {1}, but maximum value is {2}. Given: {3!r}'.format( \
+                description, len(inputstring), maxlength, inputstring))
+
+def _checkInt(inputvalue, minvalue=None, maxvalue=None, description='inputvalue'):
+    """Check that the given integer is valid.
+
+    Args:
+        * inputvalue (int or long): The integer to be checked
+        * minvalue (int or long, or None): Minimum value of the integer
+        * maxvalue (int or long, or None): Maximum value of the integer
+        * description (string): Used in error messages for the checked inputvalue
+
+    Raises:
+        TypeError, ValueError
+
+    Note: Can not use the function :func:`_checkString`, as that function uses this function internally.
+
+    """
+    if not isinstance(description, str):
+        raise TypeError('The description should be a string. Given: {0!r}'.format(description))
+
+    if not isinstance(inputvalue, (int, long)):
+        raise TypeError('The {0} must be an integer. Given: {1!r}'.format(description, inputvalue))
+
+    if not isinstance(minvalue, (int, long, type(None))):
+        raise TypeError('The minvalue must be an integer or None. Given: {0!r}'.format(minvalue))
+
+    if not isinstance(maxvalue, (int, long, type(None))):
+        raise TypeError('The maxvalue must be an integer or None. Given: {0!r}'.format(maxvalue))
+
+    _checkNumerical(inputvalue, minvalue, maxvalue, description)
+
+
+#####################
+# Development tools #
+#####################
+
+
+def _print_out(inputstring):
+    """Print the inputstring. To make it compatible with Python2 and Python3.
+
+    Args:
+        inputstring (str): The string that should be printed.
+
+    Raises:
+        TypeError
+
+    """
+    _checkString(inputstring, description='string to print')
+
+    sys.stdout.write(inputstring + '\n')
+
+
+def _checkAddress(das, dae):
+    """ Check das is equal to or less than dae.
+
+    Args:
+        * das (destination address start)
+        * dae (destination address end)
+    Raises:
+        ValueError
+
+    """
+    if not(das <= dae):
+        raise ValueError('The DAS{0} must be equal to or less than DAE{0}'.format(das, dae))
+
+
+class _LazyModule(object):
+    """Stand-in for a module that is imported on first attribute access.
+
+    Args:
+        name (str): The full module name, for example ``'serial'``.
+
+    Setting an attribute also imports the module, and sets the attribute on it.
+
+    """
+
+    def __init__(self, name):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+
+    def __repr__(self):
+        """String representation of the :class:`._LazyModule` object."""
+        return "{}.{}<name={}, loaded={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            self._name,
+            self._module is not None,
+            )
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def _load(self):
+        if self._module is None:
+            object.__setattr__(self, '_module', importlib.import_module(self._name))
+        return self._module
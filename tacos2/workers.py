@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Multi-process gateway: one worker process per serial port, publishing the blind status in shared memory.
+
+Each :class:`BusWorker` process owns one serial port. It polls the blinds continuously,
+and writes their status into a :class:`StatusTable`, which has a fixed-width record per
+address in shared memory. Commands are sent to the worker over a pipe, and are executed
+between two polls. Readers get the status directly from the shared memory, without any
+round trip to the worker::
+
+    gateway = tacos2.workers.ProcessGateway({'/dev/ttyUSB0': range(1, 41), '/dev/ttyUSB1': None})
+    gateway.start()
+    gateway.set('/dev/ttyUSB0', 1, 40, 50, 80)
+    print(gateway.status('/dev/ttyUSB0', 7))
+    gateway.close()
+
+With Python 3.8 or later the tables use :mod:`multiprocessing.shared_memory`, so other
+processes can attach to them by name with :meth:`StatusTable.attach`. Otherwise anonymous
+shared memory is used, which is inherited by the worker processes.
+
+"""
+
+import mmap
+import multiprocessing
+import struct
+import time
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None  # Python < 3.8
+
+from tacos2.timing import _SECONDS_TO_NANOSECONDS, _now_ns
+from tacos2.utils import _checkAddress, _checkInt, _checkNumerical
+
+_NUMBER_OF_ADDRESSES = 256
+_MAGIC = b'T2ST'
+_TABLE_VERSION = 1
+
+# Header: magic, version, number of records, number of failed commands
+_HEADER = struct.Struct('<4sHHI4x')
+
+# Record: sequence number (odd while being written), flags, height, angle, timestamp (time.time())
+_RECORD = struct.Struct('<IBBBxd')
+
+_FLAG_VALID = 0x01
+_FLAG_FAILED = 0x02
+
+
+class StatusTable():
+    """Blind status of all addresses of a bus, in shared memory.
+
+    Use :meth:`create` or :meth:`attach` instead of the constructor.
+
+    There is a single writer (the worker process of the bus). Each record has a sequence
+    number that is odd while the record is being written, so readers never get a torn record.
+
+    """
+
+    SIZE = _HEADER.size + _NUMBER_OF_ADDRESSES * _RECORD.size
+    """Size of a table in bytes (int)."""
+
+    def __init__(self, buffer, name=None, sharedMemory=None):
+        self._buffer = buffer
+        self._sharedMemory = sharedMemory
+
+        self.name = name
+        """Name for :meth:`attach` (str), or None for anonymous shared memory."""
+
+    @classmethod
+    def create(cls, name=None):
+        """Create a new, empty table.
+
+        Args:
+            name (str or None): Name of the shared memory block. Use None for an automatic name.
+
+        """
+        if shared_memory is None:
+            table = cls(mmap.mmap(-1, cls.SIZE))
+        else:
+            block = shared_memory.SharedMemory(name=name, create=True, size=cls.SIZE)
+            table = cls(block.buf, block.name, block)
+        _HEADER.pack_into(table._buffer, 0, _MAGIC, _TABLE_VERSION, _NUMBER_OF_ADDRESSES, 0)
+        return table
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to an existing table created by another process (Python 3.8 or later).
+
+        Raises:
+            ValueError if the shared memory block is not a status table.
+
+        """
+        if shared_memory is None:
+            raise IOError('Attaching to a status table requires multiprocessing.shared_memory (Python 3.8 or later)')
+        block = shared_memory.SharedMemory(name=name)
+        table = cls(block.buf, block.name, block)
+        magic, version, records, _ = _HEADER.unpack_from(table._buffer, 0)
+        if magic != _MAGIC or version != _TABLE_VERSION or records != _NUMBER_OF_ADDRESSES:
+            raise ValueError('The shared memory block {!r} is not a tacos2 status table'.format(name))
+        return table
+
+    def __reduce__(self):
+        if self.name is None:
+            raise TypeError('An anonymous status table can only be shared with forked processes')
+        return (StatusTable.attach, (self.name,))
+
+    def __repr__(self):
+        """String representation of the :class:`.StatusTable` object."""
+        return "{}.{}<id=0x{:x}, name={!r}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.name,
+            )
+
+    def read(self, address):
+        """Read the status of an address.
+
+        Returns:
+            A tuple (height, angle, timestamp), or None if the address has not answered yet.
+            The timestamp is the :func:`time.time` of the latest answer.
+            If the latest poll of the address failed, the previous status is returned.
+
+        """
+        while True:
+            offset = _HEADER.size + address * _RECORD.size
+            sequence, flags, height, angle, timestamp = _RECORD.unpack_from(self._buffer, offset)
+            if sequence % 2 == 0 and _RECORD.unpack_from(self._buffer, offset)[0] == sequence:
+                break
+        if not flags & _FLAG_VALID:
+            return None
+        return height, angle, timestamp
+
+    def failed(self, address):
+        """Return :const:`True` if the latest poll of the address failed."""
+        return bool(_RECORD.unpack_from(self._buffer, _HEADER.size + address * _RECORD.size)[1] & _FLAG_FAILED)
+
+    def snapshot(self):
+        """Return the status of all answering addresses, as a dict of address: (height, angle, timestamp)."""
+        result = {}
+        for address in range(_NUMBER_OF_ADDRESSES):
+            status = self.read(address)
+            if status is not None:
+                result[address] = status
+        return result
+
+    def commandErrors(self):
+        """Return the number of commands that have failed in the worker (int)."""
+        return _HEADER.unpack_from(self._buffer, 0)[3]
+
+    def write(self, address, height, angle, timestamp=None):
+        """Write the status of an address. Only to be used by the single writer of the table."""
+        self._update(address, _FLAG_VALID, height, angle, time.time() if timestamp is None else timestamp)
+
+    def markFailed(self, address):
+        """Mark that the latest poll of an address failed, keeping its previous status."""
+        offset = _HEADER.size + address * _RECORD.size
+        _, flags, height, angle, timestamp = _RECORD.unpack_from(self._buffer, offset)
+        self._update(address, flags | _FLAG_FAILED, height, angle, timestamp)
+
+    def close(self):
+        """Detach from the shared memory."""
+        if self._sharedMemory is not None:
+            self._buffer = None
+            self._sharedMemory.close()
+        else:
+            self._buffer.close()
+
+    def unlink(self):
+        """Remove the shared memory block (by its creator, after all workers have stopped)."""
+        if self._sharedMemory is not None:
+            self._sharedMemory.unlink()
+
+    def _update(self, address, flags, height, angle, timestamp):
+        offset = _HEADER.size + address * _RECORD.size
+        sequence = _RECORD.unpack_from(self._buffer, offset)[0] + 1
+        struct.pack_into('<I', self._buffer, offset, sequence)
+        _RECORD.pack_into(self._buffer, offset, sequence, flags, height, angle, timestamp)
+        struct.pack_into('<I', self._buffer, offset, sequence + 1)
+
+    def _countCommandError(self):
+        magic, version, records, errors = _HEADER.unpack_from(self._buffer, 0)
+        _HEADER.pack_into(self._buffer, 0, magic, version, records, errors + 1)
+
+
+class BusWorker(multiprocessing.Process):
+    """Worker process owning one serial port.
+
+    Args:
+        * port (str): The serial port name.
+        * table (:class:`StatusTable`): Where the status is published.
+        * commands (:class:`multiprocessing.Connection`): Receiving end of the command pipe.
+        * addresses (iterable of int or None): The addresses to poll. Use None for all addresses 1 to 255.
+        * interval (float): Minimum time in seconds between the start of two sweeps.
+        * config (:class:`tacos2.BusConfig` or None): Settings of the bus. Use None for the module defaults.
+
+    Commands are executed between two polls, so they never wait for a whole sweep.
+    After a SET or STOP, the affected addresses are polled next.
+
+    """
+
+    def __init__(self, port, table, commands, addresses=None, interval=0.0, config=None):
+        multiprocessing.Process.__init__(self, name='tacos2-worker-{}'.format(port))
+        self.daemon = True
+        self.port = port
+        self.table = table
+        self.commands = commands
+        self.addresses = list(range(0x01, 0x100)) if addresses is None else sorted(set(addresses))
+        self.interval = interval
+        self.config = config
+
+    def run(self):
+        import tacos2
+
+        instrument = tacos2.Instrument(self.port, config=self.config)
+        urgent = []
+        position = 0
+        sweepStart = _now_ns()
+
+        while True:
+            timeout = 0
+            if not self.addresses and not urgent:
+                timeout = None
+            elif position == 0 and not urgent:
+                elapsed = float(_now_ns() - sweepStart) / _SECONDS_TO_NANOSECONDS
+                timeout = max(0, self.interval - elapsed)
+
+            if self.commands.poll(timeout):
+                command = self.commands.recv()
+                if command[0] == 'quit':
+                    return
+                urgent.extend(self._execute(instrument, command))
+                continue
+
+            if urgent:
+                self._poll(instrument, urgent.pop(0))
+                continue
+
+            if position == 0:
+                sweepStart = _now_ns()
+            self._poll(instrument, self.addresses[position])
+            position = (position + 1) % len(self.addresses)
+
+    def _execute(self, instrument, command):
+        name, das, dae = command[:3]
+        try:
+            if name == 'set':
+                instrument.set(das, dae, *command[3:])
+            elif name == 'stop':
+                instrument.stop(das, dae)
+            else:
+                raise ValueError('Unknown command: {!r}'.format(command))
+        except (IOError, ValueError):
+            self.table._countCommandError()
+            return []
+        return [address for address in self.addresses if das <= address <= dae]
+
+    def _poll(self, instrument, address):
+        try:
+            height, angle = instrument.get(address)
+        except (IOError, ValueError):
+            self.table.markFailed(address)
+        else:
+            self.table.write(address, ord(height), ord(angle))
+
+
+class ProcessGateway():
+    """Run one :class:`BusWorker` process per serial port.
+
+    Args:
+        * ports (dict): The addresses to poll per port, as port name: iterable of int (or None for all addresses).
+        * interval (float): Minimum time in seconds between the start of two sweeps on each bus.
+        * configs (dict or None): :class:`tacos2.BusConfig` per port name. Ports without one use the module defaults.
+
+    """
+
+    def __init__(self, ports, interval=0.0, configs=None):
+        _checkNumerical(interval, minvalue=0, description='interval')
+        self._ports = dict(ports)
+        self._interval = interval
+        self._configs = dict(configs or {})
+        self._workers = {}
+        self._connections = {}
+        self._tables = {}
+
+    def __repr__(self):
+        """String representation of the :class:`.ProcessGateway` object."""
+        return "{}.{}<id=0x{:x}, ports={}, running={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            sorted(self._ports),
+            bool(self._workers),
+            )
+
+    def start(self):
+        """Create the status tables, and start the worker processes."""
+        for port, addresses in self._ports.items():
+            table = self._tables[port] = StatusTable.create()
+            receiving, sending = multiprocessing.Pipe(duplex=False)
+            self._connections[port] = sending
+            worker = self._workers[port] = BusWorker(port, table, receiving, addresses,
+                self._interval, self._configs.get(port))
+            worker.start()
+
+    def close(self):
+        """Stop the worker processes, and release the status tables."""
+        for port, connection in self._connections.items():
+            try:
+                connection.send(('quit',))
+            except EnvironmentError:
+                pass
+        for worker in self._workers.values():
+            worker.join(5)
+            if worker.is_alive():
+                worker.terminate()
+        for table in self._tables.values():
+            table.close()
+            table.unlink()
+        self._workers.clear()
+        self._connections.clear()
+        self._tables.clear()
+
+    def table(self, port):
+        """Return the :class:`StatusTable` of a port. Its :attr:`~StatusTable.name` can be given to other processes."""
+        return self._tables[port]
+
+    def status(self, port, address):
+        """Read the status of an address from shared memory. See :meth:`StatusTable.read`."""
+        _checkInt(address, minvalue=0x00, maxvalue=0xFF, description='address')
+        return self._tables[port].read(address)
+
+    def set(self, port, das, dae, height=255, angle=255):
+        """Send a SET command to the worker of a port, without waiting for it to be executed."""
+        _checkAddress(das, dae)
+        self._connections[port].send(('set', das, dae, height, angle))
+
+    def stopBlinds(self, port, das, dae):
+        """Send a STOP command to the worker of a port, without waiting for it to be executed."""
+        _checkAddress(das, dae)
+        self._connections[port].send(('stop', das, dae))
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Zones: named groups of addresses (facade, floor, room), commanded with the fewest frames.
+
+Example::
+
+    zones = tacos2.zones.ZoneRegistry(topology=tacos2.discovery.loadTopology('/dev/ttyUSB0'))
+    zones.define('south', range(1, 41))
+    zones.define('meeting room', [12, 13, 14, 15])
+    zones.set(instrument, zones.zone('south') - zones.zone('meeting room'), 80, 45).result()
+    zones.stop(instrument, 'south')
+
+A :class:`Zone` is a bitset over the addresses 0 to 255, with the set operators
+``|``, ``&``, ``-`` and ``^``. Its minimal contiguous DAS..DAE ranges are computed once per zone.
+When the topology of the bus is known, the ranges may also span empty addresses, as for
+:mod:`tacos2.scenes`. The encoded frames of a command to a zone are cached, so repeating it
+only queues a burst of ready-made frames.
+
+"""
+
+import json
+import sys
+import threading
+
+from tacos2.codec import SET, STOP, _embedPayload
+from tacos2.utils import _checkInt
+
+_ALL_ADDRESSES = (1 << 0x100) - 1
+_MAXIMUM_CACHED_PLANS = 1024  # The cache of encoded frames is cleared when it grows larger
+
+
+def _lowestBit(bits):
+    return (bits & -bits).bit_length() - 1
+
+
+class Zone():
+    """An immutable set of addresses, stored as a bitset.
+
+    Args:
+        addresses (iterable of int): The addresses, 0 to 255.
+
+    Raises:
+        ValueError, TypeError for invalid addresses.
+
+    """
+
+    def __init__(self, addresses=()):
+        bits = 0
+        for address in addresses:
+            _checkInt(address, minvalue=0x00, maxvalue=0xFF, description='address')
+            bits |= 1 << address
+        self.bits = bits
+        """The addresses as bits of an int: bit n is set for address n (int)."""
+
+        self._ranges = None
+
+    @classmethod
+    def fromBits(cls, bits):
+        """Return the zone for a bitset, see :attr:`bits`."""
+        zone = cls()
+        zone.bits = bits & _ALL_ADDRESSES
+        return zone
+
+    @classmethod
+    def fromRanges(cls, ranges):
+        """Return the zone for a list of (das, dae) ranges."""
+        bits = 0
+        for das, dae in ranges:
+            _checkInt(das, minvalue=0x00, maxvalue=0xFF, description='das')
+            _checkInt(dae, minvalue=das, maxvalue=0xFF, description='dae')
+            bits |= ((1 << (dae - das + 1)) - 1) << das
+        return cls.fromBits(bits)
+
+    def __repr__(self):
+        """String representation of the :class:`.Zone` object."""
+        return "{}.{}<id=0x{:x}, ranges={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.ranges(),
+            )
+
+    def __contains__(self, address):
+        return 0 <= address <= 0xFF and bool(self.bits >> address & 1)
+
+    def __iter__(self):
+        for das, dae in self.ranges():
+            for address in range(das, dae + 1):
+                yield address
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __bool__(self):
+        return self.bits != 0
+
+    __nonzero__ = __bool__
+
+    def __eq__(self, other):
+        return isinstance(other, Zone) and self.bits == other.bits
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __or__(self, other):
+        return Zone.fromBits(self.bits | other.bits)
+
+    def __and__(self, other):
+        return Zone.fromBits(self.bits & other.bits)
+
+    def __sub__(self, other):
+        return Zone.fromBits(self.bits & ~other.bits)
+
+    def __xor__(self, other):
+        return Zone.fromBits(self.bits ^ other.bits)
+
+    def union(self, *others):
+        """Return the zone with the addresses of this zone and the others."""
+        bits = self.bits
+        for other in others:
+            bits |= other.bits
+        return Zone.fromBits(bits)
+
+    def difference(self, *others):
+        """Return the zone with the addresses of this zone that are in none of the others."""
+        bits = self.bits
+        for other in others:
+            bits &= ~other.bits
+        return Zone.fromBits(bits)
+
+    def ranges(self, bridgeable=None):
+        """Return the minimal contiguous ranges covering the zone.
+
+        Args:
+            bridgeable (:class:`Zone` or None): Addresses without blinds, which may be included in a range.
+
+        Returns:
+            A list of (das, dae), sorted by address. Each range starts and ends with an address of the zone.
+
+        """
+        if bridgeable is None or not bridgeable.bits:
+            if self._ranges is None:
+                self._ranges = _runs(self.bits)
+            return list(self._ranges)
+
+        ranges = []
+        for das, dae in _runs(self.bits | bridgeable.bits):
+            inside = self.bits & (((1 << (dae - das + 1)) - 1) << das)
+            if inside:
+                ranges.append((_lowestBit(inside), inside.bit_length() - 1))
+        return ranges
+
+
+def _runs(bits):
+    """Return the runs of set bits of an int, as a list of (first, last) bit numbers."""
+    runs = []
+    while bits:
+        first = _lowestBit(bits)
+        shifted = bits >> first
+        length = _lowestBit(~shifted)
+        runs.append((first, first + length - 1))
+        bits &= ~(((1 << length) - 1) << first)
+    return runs
+
+
+def _encodeFrames(commands, devicetype, sourceaddress):
+    """Encode the frames of a plan.
+
+    Args:
+        * commands (iterable of tuple): The commands as (das, dae, cmd, height, angle).
+        * devicetype (int): Source device type of the master.
+        * sourceaddress (int): Source address of the master.
+
+    Returns:
+        The raw frames (list of str, or bytes for Python3).
+
+    """
+    frames = []
+    for das, dae, cmd, height, angle in commands:
+        frame = _embedPayload(das, dae, 0xC0, devicetype, sourceaddress, cmd, height, angle)
+        if sys.version_info[0] > 2:
+            frame = bytes(frame, encoding='latin1')  # Convert types to make it Python3 compatible
+        frames.append(frame)
+    return frames
+
+
+class _PlanRegistry():
+    """Base class of the registries that compile named groups of addresses to cached frames.
+
+    Args:
+        topology (iterable of int or None): The addresses that have blinds. See :class:`ZoneRegistry`.
+
+    Used by :class:`ZoneRegistry` and :class:`tacos2.scenes.SceneRegistry`. The subclasses call
+    :meth:`_cachedFrames` while holding ``_lock``.
+
+    """
+
+    def __init__(self, topology=None):
+        self._plans = {}
+        self._lock = threading.Lock()
+        self._bridgeable = Zone()
+        self.setTopology(topology)
+
+    def setTopology(self, topology):
+        """Set the addresses that have blinds. See the class documentation."""
+        with self._lock:
+            if topology is None:
+                self._bridgeable = Zone()
+            else:
+                self._bridgeable = Zone.fromBits(_ALL_ADDRESSES & ~Zone(topology).bits)
+            self._plans.clear()
+
+    def _cachedFrames(self, key, plan, devicetype, sourceaddress):
+        """Return the cached frames for *key*, or encode and cache the commands returned by *plan()*, see :func:`_encodeFrames`."""
+        frames = self._plans.get(key)
+        if frames is None:
+            frames = _encodeFrames(plan(), devicetype, sourceaddress)
+            if len(self._plans) >= _MAXIMUM_CACHED_PLANS:
+                self._plans.clear()
+            self._plans[key] = frames
+        return frames
+
+    def _forget(self, name):
+        """Remove the cached frames with keys starting with *name*."""
+        for key in [key for key in self._plans if key[0] == name]:
+            del self._plans[key]
+
+
+class ZoneRegistry(_PlanRegistry):
+    """Registry of named zones.
+
+    Args:
+        topology (iterable of int or None): The addresses that have blinds, for example from
+            :func:`tacos2.discovery.loadTopology`. Other addresses may be included in the
+            ranges of the frames. Use None if the topology is unknown.
+
+    The methods taking a zone accept a zone name or a :class:`Zone`, for example the result
+    of set operations on named zones.
+
+    """
+
+    def __init__(self, topology=None):
+        self._zones = {}
+        _PlanRegistry.__init__(self, topology)
+
+    def __repr__(self):
+        """String representation of the :class:`.ZoneRegistry` object."""
+        return "{}.{}<id=0x{:x}, zones={}>".format(
+            self.__module__,
+            self.__class__.__name__,
+            id(self),
+            self.names(),
+            )
+
+    def define(self, name, addresses):
+        """Define (or replace) a zone.
+
+        Args:
+            * name (str): The zone name, for example ``'floor 3'``.
+            * addresses (iterable of int or :class:`Zone`): The addresses of the zone.
+
+        Raises:
+            ValueError, TypeError
+
+        """
+        zone = addresses if isinstance(addresses, Zone) else Zone(addresses)
+        with self._lock:
+            self._zones[name] = zone
+
+    def remove(self, name):
+        """Remove a zone.
+
+        Raises:
+            KeyError if the zone is unknown.
+
+        """
+        with self._lock:
+            del self._zones[name]
+
+    def names(self):
+        """Return the zone names (sorted list of str)."""
+        with self._lock:
+            return sorted(self._zones)
+
+    def zone(self, name):
+        """Return a zone by name (:class:`Zone`).
+
+        Raises:
+            KeyError if the zone is unknown.
+
+        """
+        with self._lock:
+            return self._zones[name]
+
+    def union(self, *zones):
+        """Return the :class:`Zone` with the addresses of all the given zones."""
+        return Zone().union(*[self._resolve(zone) for zone in zones])
+
+    def difference(self, zone, *others):
+        """Return the :class:`Zone` with the addresses of *zone* that are in none of the others."""
+        return self._resolve(zone).difference(*[self._resolve(other) for other in others])
+
+    def ranges(self, zone):
+        """Return the ranges for commanding a zone, as a list of (das, dae)."""
+        zone = self._resolve(zone)
+        with self._lock:
+            bridgeable = self._bridgeable
+        return zone.ranges(bridgeable)
+
+    def compile(self, zone, cmd, height=255, angle=255, devicetype=0x00, sourceaddress=0x00):
+        """Return the encoded frames of a command to a zone.
+
+        Args:
+            * zone (str or :class:`Zone`): The zone.
+            * cmd (int): SET or STOP, see :mod:`tacos2.codec`.
+            * height, angle (int): For SET. Use 255 to leave it unchanged.
+            * devicetype (int): Source device type of the master.
+            * sourceaddress (int): Source address of the master.
+
+        Returns:
+            The raw frames (list of str, or bytes for Python3). The list is cached; do not modify it.
+
+        Raises:
+            KeyError if the zone is unknown. ValueError for other commands than SET and STOP.
+
+        """
+        if cmd not in (SET, STOP):
+            raise ValueError('Only SET and STOP can be sent to a zone. Given: {!r}'.format(cmd))
+        _checkInt(height, minvalue=0, maxvalue=255, description='height')
+        _checkInt(angle, minvalue=0, maxvalue=255, description='angle')
+
+        zone = self._resolve(zone)
+        key = (zone, cmd, height, angle, devicetype, sourceaddress)
+        with self._lock:
+            return self._cachedFrames(key, lambda: [(das, dae, cmd, height, angle)
+                for das, dae in zone.ranges(self._bridgeable)], devicetype, sourceaddress)
+
+    def set(self, instrument, zone, height=255, angle=255):
+        """Set the height and angle of the blinds of a zone.
+
+        Args:
+            * instrument (:class:`tacos2.Instrument`): The instrument for the bus.
+            * zone (str or :class:`Zone`): The zone.
+            * height, angle (int): Use 255 to leave it unchanged.
+
+        Returns:
+            A :class:`tacos2.FrameFuture`, completed when all frames have been written.
+
+        The frames are queued as one burst in the write queue of the serial port, without
+        blocking the caller.
+
+        """
+        return instrument._genericBurstNowait(self.compile(zone, SET, height, angle, instrument.sax, instrument.sa))
+
+    def stop(self, instrument, zone):
+        """Stop the blinds of a zone. See :meth:`set`."""
+        return instrument._genericBurstNowait(self.compile(zone, STOP, devicetype=instrument.sax, sourceaddress=instrument.sa))
+
+    def save(self, path):
+        """Store all zones in a JSON file, as lists of ranges."""
+        with self._lock:
+            data = dict((name, [list(addressRange) for addressRange in zone.ranges()])
+                        for name, zone in self._zones.items())
+        with open(path, 'w') as zoneFile:
+            json.dump(data, zoneFile, indent=2, sort_keys=True)
+
+    def load(self, path):
+        """Define the zones stored in a JSON file by :meth:`save`. Existing zones with the same names are replaced."""
+        with open(path) as zoneFile:
+            data = json.load(zoneFile)
+        for name, ranges in data.items():
+            self.define(name, Zone.fromRanges(ranges))
+
+    def _resolve(self, zone):
+        if isinstance(zone, Zone):
+            return zone
+        with self._lock:
+            return self._zones[zone]
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Property-based conformance checks of the frame codec in :mod:`tacos2.codec`.
+
+Random frames are encoded, stuffed and parsed, with and without injected byte errors, and the
+results are cross-checked against the straightforward reference implementation in this file.
+A codec rewrite for speed must keep these passing.
+
+The number of random frames per check is :data:`ITERATIONS`. Set the environment variable
+``TACOS2_FUZZ_ITERATIONS`` for longer runs, and ``TACOS2_FUZZ_SEED`` to repeat a run.
+
+"""
+
+import os
+import random
+import unittest
+
+from tacos2.codec import DLE, STX, ETX, STOP, SET, GET, \
+    _calculateFcc, _checkEsc, _checkFrame, _checkResponse, _checkResponseFields, _embedPayload, _extractPayload, \
+    _frameLength
+from tacos2.errors import FrameError
+
+ITERATIONS = int(os.environ.get('TACOS2_FUZZ_ITERATIONS', 5000))
+"""Number of random frames per check (int)."""
+
+SEED = int(os.environ.get('TACOS2_FUZZ_SEED', random.randrange(1 << 32)))
+"""Seed of the random frames (int). Shown in the failure messages."""
+
+_INTERESTING_VALUES = (0x00, 0x01, STX, ETX, DLE, 0x11, 0x7F, 0x80, GET, SET, STOP, 0xFE, 0xFF)
+
+
+############################
+# Reference implementation #
+############################
+
+
+def _referenceStuff(values):
+    """Escape a list of int, doubling each DLE."""
+    stuffed = []
+    for value in values:
+        stuffed.append(value)
+        if value == DLE:
+            stuffed.append(DLE)
+    return stuffed
+
+
+def _referenceEncode(fields):
+    """Encode the fields [das, dae, cw, sax, sa, cmd, data...] to a frame (str)."""
+    body = _referenceStuff(fields) + [DLE, ETX]
+    counted = _referenceStuff([len(body)]) + body
+    fcc = (256 - sum(counted) % 256) % 256
+    return ''.join(chr(value) for value in [DLE, STX] + counted + [fcc])
+
+
+def _referenceDecode(frame):
+    """Decode a complete frame (str) to its fields, or return None if it is not a valid frame."""
+    values = [ord(character) for character in frame]
+    if values[:2] != [DLE, STX] or len(values) < 4:
+        return None
+
+    position = 2
+    bytecount = values[position]
+    if bytecount == DLE:
+        position += 1
+        if values[position] != DLE:
+            return None
+    position += 1
+    body = values[position:-1]
+    if len(body) != bytecount or body[-2:] != [DLE, ETX]:
+        return None
+    if sum(values[2:]) % 256 != 0:
+        return None
+
+    fields = []
+    escaped = body[:-2]
+    index = 0
+    while index < len(escaped):
+        if escaped[index] == DLE:
+            if escaped[index + 1:index + 2] != [DLE]:
+                return None
+            index += 1
+        fields.append(escaped[index])
+        index += 1
+    if len(fields) < 6:
+        return None
+    return fields
+
+
+def _randomFields(generator):
+    """Random request or response fields, with a bias to the values that need care."""
+    def value():
+        if generator.random() < 0.3:
+            return generator.choice(_INTERESTING_VALUES)
+        return generator.randrange(256)
+
+    cmd = generator.choice((STOP, SET, GET))
+    fields = [value() for _ in range(5)] + [cmd]
+    if cmd != STOP and generator.random() < 0.7:
+        fields += [value(), value()]
+    return fields
+
+
+def _mutate(generator, frame):
+    """Inject one to three byte errors: replaced, inserted or deleted bytes."""
+    data = list(frame)
+    for _ in range(generator.randint(1, 3)):
+        position = generator.randrange(len(data) + 1)
+        kind = generator.randrange(3)
+        if kind == 0 and position < len(data):
+            data[position] = chr(generator.choice((generator.randrange(256), DLE, STX, ETX)))
+        elif kind == 1:
+            data.insert(position, chr(generator.choice((generator.randrange(256), DLE))))
+        elif position < len(data) and len(data) > 1:
+            del data[position]
+    return ''.join(data)
+
+
+#########
+# Tests #
+#########
+
+
+class TestCodecConformance(unittest.TestCase):
+
+    def setUp(self):
+        self.generator = random.Random(SEED)
+
+    def _message(self, text):
+        return '{} (TACOS2_FUZZ_SEED={})'.format(text, SEED)
+
+    def testEscapeEveryValue(self):
+        for value in range(256):
+            self.assertEqual(_checkEsc(value), ''.join(chr(stuffed) for stuffed in _referenceStuff([value])))
+
+    def testFccMatchesReference(self):
+        for _ in range(ITERATIONS):
+            payload = ''.join(chr(self.generator.randrange(256)) for _ in range(self.generator.randrange(40)))
+            self.assertEqual(_calculateFcc(payload), (256 - sum(map(ord, payload)) % 256) % 256,
+                self._message(repr(payload)))
+
+    def testEncodeMatchesReference(self):
+        for _ in range(ITERATIONS):
+            fields = _randomFields(self.generator)
+            if fields[5] == SET and len(fields) == 6:
+                fields += [255, 255]
+            frame = _embedPayload(*fields)
+            expected = fields if fields[5] == SET else fields[:6]
+            self.assertEqual(frame, _referenceEncode(expected), self._message(repr(fields)))
+
+    def testRoundTrip(self):
+        for _ in range(ITERATIONS):
+            fields = _randomFields(self.generator)
+            frame = _referenceEncode(fields)
+            message = self._message(repr(frame))
+
+            self.assertEqual(_frameLength(frame + chr(DLE) + chr(STX)), len(frame), message)
+            self.assertEqual(_checkFrame(frame), fields, message)
+            self.assertEqual(_extractPayload(frame + 'trailing noise'), frame[2:-1], message)
+            expected = (chr(fields[6]), chr(fields[7])) if fields[5] == GET and len(fields) == 8 else None
+            if fields[5] != GET or expected is not None:
+                self.assertEqual(_checkResponse(_extractPayload(frame)), expected, message)
+
+    def testResponseForEveryHeightAndAngle(self):
+        request = _embedPayload(0x10, 0x10, 0x60, 0, 0x01, GET)
+        for height in range(256):
+            for angle in (0x00, DLE, height, 0xFF):
+                response = _referenceEncode([0x01, 0x01, 0x00, 0x00, 0x10, GET, height, angle])
+                fields = _checkFrame(response)
+                _checkResponseFields(fields, _checkFrame(request), response)
+                self.assertEqual(_checkResponse(_extractPayload(response)), (chr(height), chr(angle)))
+
+    def testInjectedErrorsMatchReference(self):
+        for _ in range(ITERATIONS):
+            frame = _mutate(self.generator, _referenceEncode(_randomFields(self.generator)))
+            message = self._message(repr(frame))
+
+            try:
+                length = _frameLength(frame)
+                fields = None if length is None or length > len(frame) else _checkFrame(frame[:length])
+            except FrameError:
+                fields = None
+                length = None
+
+            if frame[:2] != chr(DLE) + chr(STX) or length is None or length > len(frame):
+                expected = None
+            else:
+                expected = _referenceDecode(frame[:length])
+            self.assertEqual(fields, expected, message)
+
+    def testSingleByteErrorsAreDetected(self):
+        for _ in range(ITERATIONS):
+            frame = _referenceEncode(_randomFields(self.generator))
+            position = self.generator.randrange(2, len(frame))
+            replacement = chr((ord(frame[position]) + self.generator.randrange(1, 256)) % 256)
+            corrupted = frame[:position] + replacement + frame[position + 1:]
+            message = self._message(repr(corrupted))
+
+            try:
+                length = _frameLength(corrupted)
+                if length is None or length > len(corrupted):
+                    continue  # Would be a truncated frame on the wire
+                _checkFrame(corrupted[:length])
+            except FrameError:
+                continue
+            self.fail(message)
+
+
+if __name__ == '__main__':
+    unittest.main()
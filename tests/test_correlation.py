@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Tests of the correlation of responses with requests, on a ``memory://`` bus.
+
+"""
+
+import sys
+import threading
+import time
+import unittest
+
+import tacos2
+from tacos2 import correlation, serialport
+from tacos2.codec import GET, _embedResponse
+
+MASTER_TIMEOUT = 0.2
+"""Read timeout in seconds of the master (float)."""
+
+
+def _bytes(frame):
+    if sys.version_info[0] > 2:
+        return bytes(frame, encoding='latin1')  # Convert types to make it Python3 compatible
+    return frame
+
+
+class _Slave(threading.Thread):
+    """A slave on a memory bus, that answers each GET with the frames returned by *answer(address, count)*."""
+
+    def __init__(self, port, answer):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.instrument = tacos2.Instrument(port)
+        self.instrument.serial.timeout = 0.05
+        self.answer = answer
+        self.requests = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            try:
+                _, fields, _ = serialport._readFrame(self.instrument.serial)
+            except IOError:
+                continue
+            if fields[2] == 0x00 or fields[5] != GET:
+                continue  # A response, or no response needed
+            self.requests += 1
+            for delay, frame in self.answer(fields[0], self.requests):
+                time.sleep(delay)
+                self.instrument.serial.write(_bytes(frame))
+
+    def stop(self):
+        self.running = False
+        self.join()
+
+
+class TestCorrelation(unittest.TestCase):
+
+    def _connect(self, name, answer):
+        slave = _Slave('memory://{}?id=slave'.format(name), answer)
+        slave.start()
+        self.addCleanup(slave.stop)
+        master = tacos2.Instrument('memory://{}?id=master'.format(name))
+        master.serial.timeout = MASTER_TIMEOUT
+        return master
+
+    def testStaleFrameIsDiscarded(self):
+        def answer(address, count):
+            return [(0, _embedResponse(0, address + 1, 99, 99)), (0, _embedResponse(0, address, 40, 60))]
+        master = self._connect('correlation-stale', answer)
+
+        height, angle = master.get(5)
+        self.assertEqual((ord(height), ord(angle)), (40, 60))
+        self.assertEqual(correlation.tracker(master.serial.port).unexpected_frames, 1)
+
+    def testRetryIgnoresLateAnswer(self):
+        def answer(address, count):
+            if count == 1:
+                return [(2 * MASTER_TIMEOUT, _embedResponse(0, address, 11, 11))]  # Too late
+            return [(0, _embedResponse(0, address, 22, 22))]
+        master = self._connect('correlation-retry', answer)
+
+        self.assertRaises(tacos2.NoAnswerError, master.get, 3)
+        time.sleep(2 * MASTER_TIMEOUT)  # The late answer arrives before the retry
+
+        height, angle = master.get(3)
+        self.assertEqual((ord(height), ord(angle)), (22, 22))
+        self.assertEqual(correlation.tracker(master.serial.port).late_replies, 1)
+
+    def testStaleFramesDoNotExtendTheTimeout(self):
+        def answer(address, count):
+            return [(0.4 * MASTER_TIMEOUT, _embedResponse(0, address + 1, 99, 99))]
+        master = self._connect('correlation-deadline', answer)
+
+        start = time.time()
+        self.assertRaises(tacos2.NoAnswerError, master.get, 7)
+        self.assertLess(time.time() - start, 1.3 * MASTER_TIMEOUT)
+        self.assertEqual(master.serial.timeout, MASTER_TIMEOUT)
+
+
+if __name__ == '__main__':
+    unittest.main()
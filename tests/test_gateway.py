@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Tests of the gateway server and client, with simulated blinds on a ``memory://`` bus.
+
+"""
+
+import struct
+import unittest
+
+import tacos2
+from tacos2 import serialport
+from tacos2.codec import STOP
+from tacos2.errors import NoAnswerError
+from tacos2.gateway import GatewayClient, GatewayServer
+from tacos2.simulator import BlindBank, Simulator
+
+
+class TestGateway(unittest.TestCase):
+
+    def _serve(self, name, addresses=range(1, 11)):
+        """Serve memory://name with simulated blinds. Returns the port name, a client and a listener on the bus."""
+        port = 'memory://{}'.format(name)
+        simulator = Simulator('{}?id=slave'.format(port), BlindBank(addresses=addresses))
+        simulator.instrument.serial.timeout = 0.05
+        simulator.start()
+        self.addCleanup(simulator.stop)
+
+        listener = tacos2.Instrument('{}?id=listener'.format(port))
+        listener.serial.timeout = 0.05
+
+        self.server = GatewayServer(('127.0.0.1', 0), [port])
+        self.server.start()
+        self.addCleanup(self.server.close)
+        self.server._executors[port].instrument.serial.timeout = 0.05
+        client = GatewayClient(self.server.address)
+        self.addCleanup(client.close)
+        return port, client, listener
+
+    def _commands(self, listener):
+        """Return the commands of the requests written on the bus so far, skipping the responses."""
+        commands = []
+        while True:
+            try:
+                _, fields, _ = serialport._readFrame(listener.serial)
+            except NoAnswerError:
+                return commands
+            if fields[2] != 0x00:
+                commands.append(fields[5])
+
+    def testRoundTrip(self):
+        port, client, listener = self._serve('gateway-roundtrip')
+        instrument = client.instrument(port)
+
+        instrument.set(3, 5, 40, 50)
+        self.assertEqual(instrument.get(4), (chr(40), chr(50)))
+        self.assertEqual(instrument.get(6), (chr(0), chr(0)))
+        instrument.stop(1, 10)
+
+    def testPipelinedRequests(self):
+        port, client, listener = self._serve('gateway-pipelined')
+
+        replies = client.requestMany([('SET', port, address, address, 10 * address, address) for address in range(1, 11)])
+        self.assertEqual([reply.result(10.0) for reply in replies], [None] * 10)
+
+        replies = client.requestMany([('GET', port, address) for address in range(10, 0, -1)])
+        self.assertEqual([reply.result(10.0) for reply in replies],
+            [(10 * address, address) for address in range(10, 0, -1)])
+
+    def testErrorReplies(self):
+        port, client, listener = self._serve('gateway-errors')
+
+        for request in (('GET', 'memory://unknown', 1), ('MOVE', port, 1), ('SET', port), ('GET', port, 1, 2),
+                        ('GET', port, 20)):
+            self.assertRaises(IOError, client.request(*request).result, 10.0)
+        self.assertEqual(client.request('GET', port, 1).result(10.0), (0, 0))
+
+    def testUnexpectedErrorKeepsServing(self):
+        port, client, listener = self._serve('gateway-unexpected')
+
+        def failingGet(address):
+            executor.instrument.get = originalGet
+            raise struct.error('unexpected')
+        executor = self.server._executors[port]
+        originalGet = executor.instrument.get
+        executor.instrument.get = failingGet
+
+        self.assertRaises(IOError, client.request('GET', port, 1).result, 10.0)
+        self.assertEqual(client.request('GET', port, 1).result(10.0), (0, 0))
+
+    def testStopOvertakesQueuedGets(self):
+        port, client, listener = self._serve('gateway-priority')
+
+        replies = client.requestMany([('GET', port, 1 + number % 10) for number in range(40)] + [('STOP', port, 1, 10)])
+        for reply in replies:
+            reply.result(10.0)
+
+        commands = self._commands(listener)
+        self.assertEqual(len(commands), 41)
+        self.assertLess(commands.index(STOP), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Tests of the historian, storing blind changes in columnar files.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from tacos2 import historian
+from tacos2.historian import Historian
+
+
+class TestHistorian(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _open(self):
+        store = Historian(self.directory)
+        self.addCleanup(store.close)
+        return store
+
+    def testQueryByTimeAndAddress(self):
+        store = self._open()
+        self.assertTrue(store.record(1, 10, 20, 1000.0))
+        self.assertTrue(store.record(2, 30, 40, 1001.0))
+        self.assertFalse(store.record(1, 10, 20, 1002.0))  # Unchanged
+        self.assertTrue(store.record(1, 11, 20, 1003.0))
+
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.query(), [(1000.0, 1, 10, 20), (1001.0, 2, 30, 40), (1003.0, 1, 11, 20)])
+        self.assertEqual(store.query(start=1001.0, end=1003.0), [(1001.0, 2, 30, 40)])
+        self.assertEqual(store.query(das=1, dae=1), [(1000.0, 1, 10, 20), (1003.0, 1, 11, 20)])
+        self.assertEqual(store.latest(1), (11, 20))
+        self.assertEqual(store.latest(3), None)
+
+    def testTimestampsNeverGoBackwards(self):
+        store = self._open()
+        store.record(1, 10, 20, 1000.0)
+        store.record(2, 30, 40, 999.0)
+        self.assertEqual(store.query(), [(1000.0, 1, 10, 20), (1000.0, 2, 30, 40)])
+
+    def testQueryAcrossBlocks(self):
+        self.addCleanup(setattr, historian, 'BLOCK_SIZE', historian.BLOCK_SIZE)
+        historian.BLOCK_SIZE = 4
+        store = self._open()
+        for number in range(10):
+            store.record(number % 3, number, 0, 1000.0 + number)
+
+        self.assertEqual(len(store._blocks), 3)
+        self.assertEqual([change[2] for change in store.query(das=2, dae=2)], [2, 5, 8])
+        self.assertEqual([change[2] for change in store.query(start=1003.0, end=1006.0)], [3, 4, 5])
+
+    def testReopenKeepsTheLatestStatus(self):
+        store = Historian(self.directory)
+        store.record(1, 10, 20, 1000.0)
+        store.record(2, 30, 40, 1001.0)
+        store.close()
+
+        store = self._open()
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.latest(2), (30, 40))
+        self.assertFalse(store.record(2, 30, 40, 1002.0))
+        self.assertTrue(store.record(2, 31, 40, 1003.0))
+        self.assertEqual(store.query(das=2, dae=2), [(1001.0, 2, 30, 40), (1003.0, 2, 31, 40)])
+
+    def testInvalidValueLeavesTheColumnsAligned(self):
+        store = self._open()
+        store.record(4, 1, 1, 1000.0)
+        self.assertRaises(ValueError, store.record, 5, 256, 0, 1010.0)
+        self.assertRaises(ValueError, store.record, 256, 0, 0, 1010.0)
+        self.assertRaises(TypeError, store.record, 5, 1.5, 0, 1010.0)
+
+        self.assertTrue(store.record(6, 1, 1, 1020.0))
+        self.assertEqual(store.query(), [(1000.0, 4, 1, 1), (1020.0, 6, 1, 1)])
+        self.assertEqual(store.latest(5), None)
+
+    def testReopenCutsAnInterruptedRecord(self):
+        store = Historian(self.directory)
+        store.record(1, 10, 20, 1000.0)
+        store.close()
+        for column, garbage in (('time', b'\x01\x00'), ('address', b'\x07')):
+            with open(os.path.join(self.directory, column), 'ab') as columnFile:
+                columnFile.write(garbage)  # A record() interrupted after the first columns
+
+        store = self._open()
+        self.assertEqual(len(store), 1)
+        store.record(2, 30, 40, 1001.0)
+        self.assertEqual(store.query(), [(1000.0, 1, 10, 20), (1001.0, 2, 30, 40)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Tests of the status polling, with an instrument that needs no bus.
+
+"""
+
+import logging
+import threading
+import unittest
+
+from tacos2.polling import Poller
+
+
+class _CountingInstrument():
+    """Answers each GET with the number of the sweep as the height. Raises *error* in the first sweep."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.sweeps = 0
+
+    def get(self, address, priority=None):
+        if address == 1:
+            self.sweeps += 1
+        if self.error is not None and self.sweeps == 1:
+            raise self.error
+        return chr(self.sweeps), chr(0)
+
+
+class TestPoller(unittest.TestCase):
+
+    def setUp(self):
+        logging.getLogger('tacos2.polling').disabled = True  # The logged errors are expected
+        self.addCleanup(setattr, logging.getLogger('tacos2.polling'), 'disabled', False)
+
+    def _pollUntil(self, poller, changes, count):
+        done = threading.Event()
+
+        def record(address, height, angle):
+            changes.append((address, height))
+            if len(changes) >= count:
+                done.set()
+        poller.subscribe(record)
+        poller.start()
+        self.addCleanup(poller.stop)
+        self.assertTrue(done.wait(5), 'Polling stopped after {}'.format(changes))
+
+    def testRaisingSubscriberDoesNotStopPolling(self):
+        def fail(address, height, angle):
+            raise RuntimeError('Broken subscriber')
+
+        poller = Poller(_CountingInstrument(), 1, 2, interval=0.01)
+        poller.subscribe(fail)
+        changes = []
+        self._pollUntil(poller, changes, 4)
+        self.assertEqual(changes[:4], [(1, 1), (2, 1), (1, 2), (2, 2)])
+
+    def testUnexpectedErrorDoesNotStopPolling(self):
+        poller = Poller(_CountingInstrument(TypeError('Unexpected')), 1, 2, interval=0.01)
+        changes = []
+        self._pollUntil(poller, changes, 2)
+        self.assertEqual(changes[:2], [(1, 2), (2, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
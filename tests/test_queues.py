@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Tests of the overload policies of the bounded command queues.
+
+"""
+
+import threading
+import unittest
+
+from tacos2 import queues
+from tacos2.errors import QueueFullError
+
+
+class TestBoundedQueue(unittest.TestCase):
+
+    def _queue(self, policy, limit=2, **callbacks):
+        port = 'test-queues-{}'.format(policy)
+        queues._QUEUE_SETTINGS[port] = (limit, policy)
+        self.addCleanup(queues._QUEUE_SETTINGS.pop, port)
+        return queues.BoundedQueue(port, self.id(), **callbacks)
+
+    def _drain(self, queue):
+        return [queue.get() for _ in range(len(queue))]
+
+    def testRejectRaisesWhenFull(self):
+        queue = self._queue(queues.POLICY_REJECT)
+        queue.put('set 1', 'SET', (1, 1))
+        queue.put('set 2', 'SET', (2, 2))
+
+        self.assertRaises(QueueFullError, queue.put, 'set 3', 'SET', (3, 3))
+        self.assertEqual(queue.metrics.rejected, 1)
+        self.assertEqual(self._drain(queue), ['set 1', 'set 2'])
+
+    def testDropOldestGetDropsOnlyGets(self):
+        dropped = []
+        queue = self._queue(queues.POLICY_DROP_OLDEST_GET, limit=3,
+            dropped=lambda item, error: dropped.append(item))
+        queue.put('set 1', 'SET', (1, 1))
+        queue.put('get 2', 'GET', (2, 2))
+        queue.put('get 3', 'GET', (3, 3))
+
+        queue.put('set 4', 'SET', (4, 4))
+        self.assertEqual(dropped, ['get 2'])
+        queue.put('stop 5', 'STOP', (5, 5))
+        self.assertEqual(dropped, ['get 2', 'get 3'])
+        self.assertRaises(QueueFullError, queue.put, 'set 6', 'SET', (6, 6))  # No GET left to drop
+
+        self.assertEqual(self._drain(queue), ['set 1', 'set 4', 'stop 5'])
+        self.assertEqual((queue.metrics.dropped, queue.metrics.rejected), (2, 1))
+
+    def testCoalesceMergesSetsToTheSameAddresses(self):
+        superseded = []
+
+        def supersede(old, new):
+            superseded.append(old)
+            return new[0], queues._mergeSet(old[1], new[1])
+        queue = self._queue(queues.POLICY_COALESCE, superseded=supersede)
+        queue.put(('set 1', (10, 20)), 'SET', (1, 1))
+        queue.put(('set 1 again', (30, 255)), 'SET', (1, 1))
+
+        self.assertEqual(superseded, [('set 1', (10, 20))])
+        self.assertEqual(self._drain(queue), [('set 1 again', (30, 20))])
+        self.assertEqual(queue.metrics.coalesced, 1)
+
+    def testCoalesceKeepsTheOrderAroundOverlappingWrites(self):
+        queue = self._queue(queues.POLICY_COALESCE, limit=3)
+        queue.put('set 1-5', 'SET', (1, 5))
+        queue.put('stop 3', 'STOP', (3, 3))
+        queue.put('set 1-5 again', 'SET', (1, 5))
+
+        self.assertEqual(self._drain(queue), ['set 1-5', 'stop 3', 'set 1-5 again'])
+        self.assertEqual(queue.metrics.coalesced, 0)
+
+    def testBlockWaitsForRoom(self):
+        queue = self._queue(queues.POLICY_BLOCK, limit=1)
+        queue.put('set 1', 'SET', (1, 1))
+        thread = threading.Thread(target=queue.put, args=('set 2', 'SET', (2, 2)))
+        thread.start()
+        thread.join(0.05)
+        self.assertTrue(thread.is_alive())
+
+        self.assertEqual(queue.get(), 'set 1')
+        thread.join(5)
+        self.assertEqual(queue.get(), 'set 2')
+        self.assertEqual(queue.metrics.blocked, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Tests of the scheduling of the bus by priority and deadline, on a ``memory://`` bus.
+
+"""
+
+import threading
+import time
+import unittest
+
+import tacos2
+from tacos2 import serialport
+from tacos2.codec import GET, STOP
+
+
+class _BusHolder(threading.Thread):
+    """Holds the bus of a port from another thread, until :meth:`release` is called."""
+
+    def __init__(self, scheduler):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.scheduler = scheduler
+        self.holding = threading.Event()
+        self._done = threading.Event()
+
+    def run(self):
+        self.scheduler.acquire(tacos2.PRIORITY_STOP)
+        self.holding.set()
+        self._done.wait()
+        self.scheduler.release()
+
+    def release(self):
+        self._done.set()
+        self.join()
+
+
+class TestBusScheduler(unittest.TestCase):
+
+    def _connect(self, name):
+        master = tacos2.Instrument('memory://{}?id=master'.format(name))
+        master.serial.timeout = 0.05
+        listener = tacos2.Instrument('memory://{}?id=listener'.format(name))
+        listener.serial.timeout = 0.05
+        scheduler = serialport._SCHEDULERS[master.serial.port]
+        holder = _BusHolder(scheduler)
+        holder.start()
+        holder.holding.wait()
+        self.addCleanup(holder.release)
+        return master, listener, scheduler, holder
+
+    def _waitForWaiting(self, scheduler, count):
+        for _ in range(500):
+            if len(scheduler._waiting) >= count:
+                return
+            time.sleep(0.001)
+        self.fail('Only {} transactions are waiting for the bus'.format(len(scheduler._waiting)))
+
+    def testStopOvertakesBackgroundGet(self):
+        master, listener, scheduler, holder = self._connect('scheduler-priority')
+
+        def poll():
+            try:
+                master.get(1, priority=tacos2.PRIORITY_BACKGROUND)
+            except tacos2.NoAnswerError:
+                pass  # No slave on the bus
+        getThread = threading.Thread(target=poll)
+        getThread.start()
+        self._waitForWaiting(scheduler, 1)
+        stopThread = threading.Thread(target=master.stop, args=(1, 1))
+        stopThread.start()
+        self._waitForWaiting(scheduler, 2)
+
+        holder.release()
+        getThread.join()
+        stopThread.join()
+
+        commands = [serialport._readFrame(listener.serial)[1][5] for _ in range(2)]
+        self.assertEqual(commands, [STOP, GET])
+
+    def testExpiredDeadlineDoesNotTouchTheBus(self):
+        master, listener, scheduler, holder = self._connect('scheduler-deadline')
+
+        self.assertRaises(tacos2.DeadlineExpiredError, master.get, 1, deadline=0.01)
+        holder.release()
+
+        self.assertEqual(scheduler.expired, 1)
+        self.assertEqual(listener.serial.read(1), listener.serial.read(0))  # Nothing was written
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Tests of the simulated blinds, of their state file, and of a simulator on a ``memory://`` bus.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import tacos2
+from tacos2.simulator import BlindBank, Simulator
+
+
+class TestBlindBank(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'blinds.state')
+
+    def testAddKeepsExistingPositions(self):
+        bank = BlindBank(addresses=[3, 4])
+        bank.set(3, 4, 40, 50)
+        bank.add(2, 6, height=7, angle=8)
+
+        self.assertEqual(bank.ranges, [(2, 6)])
+        self.assertEqual([bank.status(address) for address in range(1, 8)],
+            [None, (7, 8), (40, 50), (40, 50), (7, 8), (7, 8), None])
+
+        bank.remove(4)
+        self.assertEqual(bank.ranges, [(2, 3), (5, 6)])
+        self.assertNotIn(4, bank)
+
+    def testResponseFollowsTheState(self):
+        bank = BlindBank(addresses=[9])
+        response = bank.response(9)
+        self.assertIs(bank.response(9), response)  # Encoded once
+
+        bank.set(9, 9, 40, 255)
+        self.assertNotEqual(bank.response(9), response)
+        self.assertNotEqual(bank.response(9, master=0x10), bank.response(9))
+        self.assertEqual(bank.response(10), None)
+
+    def testReopenRestoresTheState(self):
+        bank = BlindBank(self.path, addresses=range(1, 201))
+        bank.set(10, 20, 40, 50)
+        bank.remove(100)
+        bank.close()
+        self.assertEqual(os.path.getsize(self.path), BlindBank.SIZE)
+
+        bank = BlindBank(self.path)
+        self.addCleanup(bank.close)
+        self.assertEqual(bank.ranges, [(1, 99), (101, 200)])
+        self.assertEqual(bank.status(15), (40, 50))
+        self.assertEqual(bank.status(21), (0, 0))
+        self.assertEqual(bank.status(100), None)
+
+    def testRejectsOtherFiles(self):
+        with open(self.path, 'wb') as stateFile:
+            stateFile.write(b'\0' * 10)
+        self.assertRaises(IOError, BlindBank, self.path)
+
+        with open(self.path, 'wb') as stateFile:
+            stateFile.write(b'\0' * BlindBank.SIZE)
+        self.assertRaises(IOError, BlindBank, self.path)
+
+
+class TestSimulator(unittest.TestCase):
+
+    def _simulate(self, name, addresses):
+        bank = BlindBank(addresses=addresses)
+        simulator = Simulator('memory://{}?id=slave'.format(name), bank)
+        simulator.instrument.serial.timeout = 0.05
+        simulator.start()
+        self.addCleanup(simulator.stop)
+        master = tacos2.Instrument('memory://{}'.format(name))
+        master.serial.timeout = 0.2
+        return master, bank
+
+    def _heights(self, bank, das, dae):
+        return [None if bank.status(address) is None else bank.status(address)[0] for address in range(das, dae + 1)]
+
+    def testRangeSetUpdatesTheAddressedSlice(self):
+        master, bank = self._simulate('simulator-range', range(0, 256))
+
+        master.set(250, 255, 40, 50)
+        master.set(0, 0, 7, 255)
+        master.set(1, 1, 8, 9)
+        self.assertEqual(master.get(255), (chr(40), chr(50)))  # Answered after the SET frames were handled
+
+        self.assertEqual(self._heights(bank, 0, 2), [7, 8, 0])
+        self.assertEqual(self._heights(bank, 248, 255), [0, 0, 40, 40, 40, 40, 40, 40])
+        self.assertEqual(bank.status(0), (7, 0))
+        self.assertEqual(bank.status(249), (0, 0))
+        self.assertEqual(bank.status(250), (40, 50))
+
+    def testRangeSetSkipsTheGaps(self):
+        master, bank = self._simulate('simulator-sparse', list(range(10, 21)) + list(range(30, 41)) + [255])
+
+        master.set(15, 35, 60, 255)
+        master.set(200, 255, 70, 80)
+        master.stop(10, 40)
+        self.assertEqual(master.get(255), (chr(70), chr(80)))
+
+        self.assertEqual(self._heights(bank, 9, 16), [None, 0, 0, 0, 0, 0, 60, 60])
+        self.assertEqual(self._heights(bank, 20, 22), [60, None, None])
+        self.assertEqual(self._heights(bank, 29, 41), [None] + [60] * 6 + [0] * 5 + [None])
+        self.assertEqual(bank.status(35), (60, 0))
+        self.assertEqual(bank.addresses, list(range(10, 21)) + list(range(30, 41)) + [255])
+
+
+if __name__ == '__main__':
+    unittest.main()
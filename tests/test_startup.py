@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Startup time checks for tacos2, for short-lived scripts and cron jobs.
+
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+IMPORT_TIME_BUDGET = 0.1
+"""Maximum time in seconds for ``import tacos2`` (float)."""
+
+_REPOSITORY_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _runPython(code):
+    """Run Python code in a fresh interpreter, and return its output (str)."""
+    environment = dict(os.environ, PYTHONPATH=_REPOSITORY_DIRECTORY)
+    output = subprocess.check_output([sys.executable, '-c', code], env=environment)
+    return output.decode('latin1').strip()
+
+
+class TestStartup(unittest.TestCase):
+
+    def testImportDoesNotLoadSerial(self):
+        output = _runPython("import sys, tacos2; print(sorted(m for m in ('serial', 'tacos2.serialport') if m in sys.modules))")
+        self.assertEqual(output, '[]')
+
+    def testImportTimeBudget(self):
+        code = "import time; t = time.time(); import tacos2; print(time.time() - t)"
+        importTime = min(float(_runPython(code)) for _ in range(3))
+        self.assertLess(importTime, IMPORT_TIME_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,7 +9,7 @@ if __name__ == "__main__":
     instr = tacos2.Instrument('dummy')
     instr.debug = True
 
-    print instr.get(0x1)
+    print(instr.get(0x1))
 
     instr.set(0x1, 0x6, 50, 80)
 
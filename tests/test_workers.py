@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+#
+#   Copyright 2017 Kazuhiro Matsuda
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+
+.. moduleauthor:: Kazuhiro Matsuda <kazuhiro.matsuda@ane.cmc.osaka-u.ac.jp>
+
+Tests of the status table in shared memory.
+
+"""
+
+import struct
+import threading
+import time
+import unittest
+
+from tacos2 import workers
+from tacos2.workers import StatusTable
+
+
+class TestStatusTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = StatusTable.create()
+        self.addCleanup(self.table.unlink)
+        self.addCleanup(self.table.close)
+
+    def _offset(self, address):
+        return workers._HEADER.size + address * workers._RECORD.size
+
+    def testWriteAndRead(self):
+        self.assertEqual(self.table.read(5), None)
+        self.table.write(5, 40, 50, 1000.0)
+        self.assertEqual(self.table.read(5), (40, 50, 1000.0))
+        self.assertEqual(self.table.snapshot(), {5: (40, 50, 1000.0)})
+
+        self.table.markFailed(5)
+        self.assertTrue(self.table.failed(5))
+        self.assertEqual(self.table.read(5), (40, 50, 1000.0))  # The previous status is kept
+
+        self.table.write(5, 41, 50, 1001.0)
+        self.assertFalse(self.table.failed(5))
+
+    def testReadWaitsForARecordBeingWritten(self):
+        self.table.write(7, 40, 50, 1000.0)
+        sequence = struct.unpack_from('<I', self.table._buffer, self._offset(7))[0]
+        struct.pack_into('<I', self.table._buffer, self._offset(7), sequence + 1)  # A writer has started
+
+        results = []
+        reader = threading.Thread(target=lambda: results.append(self.table.read(7)))
+        reader.daemon = True
+        reader.start()
+        time.sleep(0.05)
+        self.assertEqual(results, [])
+
+        workers._RECORD.pack_into(self.table._buffer, self._offset(7), sequence + 2, workers._FLAG_VALID, 41, 51, 1001.0)
+        reader.join(5.0)
+        self.assertEqual(results, [(41, 51, 1001.0)])
+
+    def testReadsAreNeverTorn(self):
+        done = threading.Event()
+
+        def write():
+            for value in range(2000):
+                self.table.write(3, value % 256, value % 256, float(value))
+            done.set()
+        writer = threading.Thread(target=write)
+        writer.start()
+        while not done.is_set():
+            status = self.table.read(3)
+            if status is not None:
+                self.assertEqual(status[0], status[1])
+                self.assertEqual(status[0], int(status[2]) % 256)
+        writer.join()
+
+
+if __name__ == '__main__':
+    unittest.main()